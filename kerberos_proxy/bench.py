@@ -0,0 +1,218 @@
+"""
+Throughput bench for server.py against a local upstream stand-in.
+
+    python bench.py [--tunnels 32] [--mib 64] [--relay splice|copy|both]
+    python bench.py --latency [--requests 500]
+
+Starts, each in its own process:
+  - an upstream proxy stand-in that answers every CONNECT with 200 and then
+    echoes the tunnelled bytes back, and answers plain GETs with a small
+    keep-alive response;
+  - server.py pointed at it (Kerberos lookup stubbed out).
+Throughput mode opens --tunnels concurrent CONNECT tunnels, pushes --mib MiB
+through each while reading the echo, and half-closes to check the echo
+completes. Latency mode times --requests sequential tunnel set-ups and
+keep-alive GETs, with and without the warm upstream pool.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import time
+
+CHUNK = 64 * 1024
+USE_SPLICE_DEFAULT = hasattr(os, "splice")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_listening(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"nothing listening on {port}")
+
+
+# ------------------------------------------------------------ upstream stand-in
+
+async def _upstream_client(reader, writer):
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        head = b""  # readiness probe
+    while head.startswith(b"GET "):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+        await writer.drain()
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            head = b""
+    if not head.startswith(b"CONNECT "):
+        writer.close()
+        return
+    writer.write(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+    while True:
+        data = await reader.read(CHUNK)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.write_eof()
+    await writer.drain()
+    writer.close()
+
+def _run_upstream(port: int) -> None:
+    async def main():
+        server = await asyncio.start_server(_upstream_client, "127.0.0.1", port, backlog=1024)
+        await server.serve_forever()
+    asyncio.run(main())
+
+
+# ------------------------------------------------------------------- the proxy
+
+def _run_proxy(port: int, upstream_port: int, splice: bool, pool: int | None = None) -> None:
+    import server
+    server.PROXY_HOST, server.PROXY_PORT = "127.0.0.1", upstream_port
+    server.USE_SPLICE = splice
+    if pool is not None:
+        server.UPSTREAM_POOL_SIZE = pool
+    server.fetch_kerberos_ticket = lambda principal: ("Negotiate bench", time.time() + 3600)
+    server.print = lambda *a, **k: None  # keep the per-CONNECT chatter out
+    asyncio.run(server.serve(port, host="127.0.0.1"))
+
+
+# ------------------------------------------------------------------ the client
+
+async def _tunnel(port: int, size: int) -> int:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"CONNECT bench.invalid:443 HTTP/1.1\r\nHost: bench.invalid:443\r\n\r\n")
+    head = await reader.readuntil(b"\r\n\r\n")
+    if b" 200 " not in head.split(b"\r\n", 1)[0] + b" ":
+        raise RuntimeError(head.decode(errors="replace"))
+
+    payload = os.urandom(CHUNK)
+
+    async def send():
+        sent = 0
+        while sent < size:
+            writer.write(payload)
+            sent += len(payload)
+            await writer.drain()
+        writer.write_eof()  # half-close: the echo must still come back
+
+    async def receive():
+        got = 0
+        while True:
+            data = await reader.read(CHUNK)
+            if not data:
+                return got
+            got += len(data)
+
+    _, got = await asyncio.gather(send(), receive())
+    writer.close()
+    return got
+
+async def _drive(port: int, tunnels: int, size: int) -> float:
+    started = time.perf_counter()
+    results = await asyncio.gather(*(_tunnel(port, size) for _ in range(tunnels)))
+    elapsed = time.perf_counter() - started
+    short = [r for r in results if r != size]
+    if short:
+        raise RuntimeError(f"{len(short)} tunnels lost data (got {short[:3]}, want {size})")
+    return elapsed
+
+async def _setup_latency(port: int, requests: int) -> dict:
+    """
+    Median/p95 milliseconds to get a tunnel up, and per keep-alive GET.
+    """
+    connects = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"CONNECT bench.invalid:443 HTTP/1.1\r\nHost: bench.invalid:443\r\n\r\n")
+        await reader.readuntil(b"\r\n\r\n")
+        connects.append(time.perf_counter() - started)
+        writer.close()
+        await asyncio.sleep(0.002)  # let the pool top itself up between tunnels
+
+    gets = []
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for _ in range(requests):
+        started = time.perf_counter()
+        writer.write(b"GET http://bench.invalid/ HTTP/1.1\r\nHost: bench.invalid\r\n\r\n")
+        await reader.readuntil(b"\r\n\r\n")
+        await reader.readexactly(2)
+        gets.append(time.perf_counter() - started)
+    writer.close()
+
+    def ms(samples):
+        samples = sorted(samples)
+        return {"p50": round(samples[len(samples) // 2] * 1000, 3),
+                "p95": round(samples[int(len(samples) * 0.95)] * 1000, 3)}
+    return {"connect_ms": ms(connects), "keepalive_get_ms": ms(gets)}
+
+def _with_servers(proxy_args: tuple, drive):
+    upstream_port, proxy_port = _free_port(), _free_port()
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(target=_run_upstream, args=(upstream_port,), daemon=True),
+        ctx.Process(target=_run_proxy, args=(proxy_port, upstream_port, *proxy_args), daemon=True),
+    ]
+    for p in procs:
+        p.start()
+    try:
+        _wait_listening(upstream_port)
+        _wait_listening(proxy_port)
+        return asyncio.run(drive(proxy_port))
+    finally:
+        for p in procs:
+            p.terminate()
+            p.join()
+
+def latency(pool: int, requests: int) -> dict:
+    result = _with_servers((USE_SPLICE_DEFAULT, pool), lambda port: _setup_latency(port, requests))
+    return {"upstream_pool": pool, "requests": requests, **result}
+
+def bench(relay: str, tunnels: int, mib: int) -> dict:
+    size = (mib * 1024 * 1024) // CHUNK * CHUNK
+    elapsed = _with_servers((relay == "splice",), lambda port: _drive(port, tunnels, size))
+    moved = 2 * tunnels * size  # both directions went through the proxy
+    return {
+        "relay":   relay,
+        "tunnels": tunnels,
+        "mib":     mib,
+        "seconds": round(elapsed, 3),
+        "MiB/s":   round(moved / elapsed / 1024 / 1024, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tunnels", type=int, default=32)
+    parser.add_argument("--mib", type=int, default=64, help="MiB sent per tunnel")
+    parser.add_argument("--relay", choices=["splice", "copy", "both"], default="both")
+    parser.add_argument("--latency", action="store_true", help="time set-ups instead of throughput")
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.latency:
+        for pool in (0, 4):
+            print(json.dumps(latency(pool, args.requests)))
+        raise SystemExit
+
+    relays = ["copy", "splice"] if args.relay == "both" else [args.relay]
+    if "splice" in relays and not hasattr(os, "splice"):
+        print("[!] os.splice not available here, skipping it")
+        relays.remove("splice")
+    for relay in relays:
+        print(json.dumps(bench(relay, args.tunnels, args.mib)))
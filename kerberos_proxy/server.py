@@ -1,35 +1,143 @@
+import asyncio
+import os
 import socket
-import select
-import socketserver
-import http.server
 import logging
 import subprocess
 import re
+import time
+from collections import deque
+from datetime import datetime
 
 # Config
 PROXY_HOST = 'my-proxy.example.com'
 PROXY_PORT = 8080
 UPSTREAM_PROXY = f'{PROXY_HOST}:{PROXY_PORT}'
-BUFFER_SIZE = 8192
+SERVICE_PRINCIPAL = f'HTTP/{PROXY_HOST}'
+LISTEN_PORT = 3129
+
+# Per-direction relay buffer, allocated once per tunnel and reused
+BUFFER_SIZE = 64 * 1024
+
+# Largest request/response head accepted before the tunnel is up
+MAX_HEAD_SIZE = 64 * 1024
+
+# Relay through a kernel pipe with os.splice (Linux) instead of copying
+# through user space; KPROXY_SPLICE=0 forces the recv_into path
+USE_SPLICE = hasattr(os, "splice") and os.getenv("KPROXY_SPLICE", "1") == "1"
+
+# Kerberos tokens are cached per service principal: refreshed in the
+# background TOKEN_REFRESH_MARGIN seconds before the ticket expires, kept
+# TOKEN_FALLBACK_TTL when klist shows no parseable expiry, and a failed
+# lookup (no ticket, or an expired one) is retried after TOKEN_RETRY_SECONDS
+TOKEN_REFRESH_MARGIN = 300
+TOKEN_FALLBACK_TTL = 600
+TOKEN_RETRY_SECONDS = 30
+TOKEN_CHECK_SECONDS = 30
+
+# Idle connections to the upstream proxy kept dialled ahead of demand, and
+# how long an idle one is trusted before the proxy might have dropped it
+UPSTREAM_POOL_SIZE = 4
+UPSTREAM_POOL_MAX = 32
+UPSTREAM_IDLE_SECONDS = 30
 
 # Logging
 logging.basicConfig(level=logging.DEBUG)
 
+# Metrics served on GET /metrics (Prometheus text format): name -> (type, help)
+_METRICS = {
+    "kproxy_tunnels_total":             ("counter",   "CONNECT tunnels by outcome"),
+    "kproxy_tunnels_active":            ("gauge",     "Tunnels currently open"),
+    "kproxy_tunnel_setup_seconds":      ("histogram", "CONNECT received until 200 sent"),
+    "kproxy_tunnel_seconds":            ("histogram", "Tunnel lifetime"),
+    "kproxy_bytes_total":               ("counter",   "Bytes relayed through tunnels"),
+    "kproxy_http_requests_total":       ("counter",   "Plain HTTP requests forwarded, by outcome"),
+    "kproxy_token_lookups_total":       ("counter",   "Kerberos token lookups by source"),
+    "kproxy_upstream_connections_total": ("counter", "Upstream connections used, by source"),
+}
+_HIST_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30, 300, 3600)
+_samples = {}  # (name, labels) -> value, or [bucket counts..., sum, count]
+
+
+def _inc(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    _samples[key] = _samples.get(key, 0) + amount
 
-def generate_kerberos_token():
+def _observe(name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    row = _samples.setdefault(key, [0] * (len(_HIST_BUCKETS) + 2))
+    for i, bound in enumerate(_HIST_BUCKETS):
+        if value <= bound:
+            row[i] += 1
+            break
+    row[-2] += value
+    row[-1] += 1
+
+def _series(name, labels, value):
+    pairs = ",".join('%s="%s"' % pair for pair in labels)
+    return f"{name}{{{pairs}}} {value}" if pairs else f"{name} {value}"
+
+def render_metrics():
+    lines = []
+    for name, (kind, help) in _METRICS.items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        for (sample, labels), value in sorted(_samples.items()):
+            if sample != name:
+                continue
+            if kind != "histogram":
+                lines.append(_series(name, labels, value))
+                continue
+            cumulative = 0
+            for bound, n in zip(_HIST_BUCKETS, value):
+                cumulative += n
+                lines.append(_series(f"{name}_bucket", labels + (("le", float(bound)),), cumulative))
+            lines.append(_series(f"{name}_bucket", labels + (("le", "+Inf"),), value[-1]))
+            lines.append(_series(f"{name}_sum", labels, value[-2]))
+            lines.append(_series(f"{name}_count", labels, value[-1]))
+    return "\n".join(lines) + "\n"
+
+# klist date layouts (MIT in various locales, then Heimdal)
+_KLIST_DATES = [
+    ("%m/%d/%Y %H:%M:%S", 2), ("%m/%d/%y %H:%M:%S", 2), ("%d/%m/%Y %H:%M:%S", 2),
+    ("%d/%m/%y %H:%M:%S", 2), ("%Y-%m-%d %H:%M:%S", 2), ("%d.%m.%Y %H:%M:%S", 2),
+    ("%b %d %H:%M:%S %Y", 4),
+]
+
+
+def _ticket_expiry(line, principal):
+    """
+    Expiry (epoch seconds) from a klist ticket line, or None.
+    """
+    fields = line[:line.lower().index(principal.lower())].split()
+    for fmt, width in _KLIST_DATES:
+        if len(fields) < width:
+            continue
+        try:
+            return datetime.strptime(" ".join(fields[-width:]), fmt).timestamp()
+        except ValueError:
+            continue
+    return None
+
+def fetch_kerberos_ticket(principal):
+    """
+    Look the principal up in the credential cache. Returns (token, expires_at)
+    or None. Forks klist, so only TokenCache calls it, never the hot path.
+    """
     try:
         command = ["klist"]
         result = subprocess.run(command, capture_output=True, text=True, check=True)
         klist_output = result.stdout
 
         # Search for a ticket relevant to the proxy service
-        target_service = f"HTTP/{PROXY_HOST}@" # This should be case-insensitive
-        if re.search(target_service, klist_output, re.IGNORECASE):
-            print("[DEBUG] Found relevant Kerberos ticket.")
-            return "Negotiate <placeholder, relevant ticket found>"
-        else:
-            print(f"[ERROR] No Kerberos ticket found for {target_service}.")
-            return None
+        target_service = f"{principal}@" # This should be case-insensitive
+        for line in klist_output.splitlines():
+            if re.search(re.escape(target_service), line, re.IGNORECASE):
+                print("[DEBUG] Found relevant Kerberos ticket.")
+                expires = _ticket_expiry(line, target_service)
+                if expires is None:
+                    expires = time.time() + TOKEN_FALLBACK_TTL
+                return "Negotiate <placeholder, relevant ticket found>", expires
+        print(f"[ERROR] No Kerberos ticket found for {target_service}.")
+        return None
 
     except subprocess.CalledProcessError:
         print("[ERROR] Kerberos ticket listing failed (klist error).")
@@ -38,62 +146,564 @@ def generate_kerberos_token():
         print("[ERROR] klist not found, kerberos tools missing.")
         return None
 
-class KerberosProxyHandler(http.server.BaseHTTPRequestHandler):
-    def do_CONNECT(self):
-        target_host, target_port = self.path.split(":")
-        target_port = int(target_port)
 
-        print(f"\n[+] CONNECT request to {self.path}")
-        token = generate_kerberos_token()
-        if not token:
-            self.send_error(500, "Kerberos token generation failed")
-            return
+class TokenCache:
+    """
+    principal -> (token or None, valid_until). Lookups are served from
+    memory; klist only runs for the first lookup of a principal, from the
+    background refresher, and after a failed lookup has aged out.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._pending = {}
+
+    async def get(self, principal):
+        entry = self._tokens.get(principal)
+        if entry and entry[1] > time.time():
+            _inc("kproxy_token_lookups_total", source="cache")
+            return entry[0]
+        _inc("kproxy_token_lookups_total", source="klist")
+        return await self.refresh(principal)
+
+    async def refresh(self, principal):
+        # concurrent callers share one klist run
+        fut = self._pending.get(principal)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch(principal))
+            self._pending[principal] = fut
+            fut.add_done_callback(lambda _: self._pending.pop(principal, None))
+        return await asyncio.shield(fut)
+
+    async def _fetch(self, principal):
+        loop = asyncio.get_running_loop()
+        ticket = await loop.run_in_executor(None, fetch_kerberos_ticket, principal)
+        if ticket is None or ticket[1] <= time.time():
+            # no ticket, or only an expired one: back off before asking
+            # klist again instead of on every CONNECT
+            self._tokens[principal] = (None, time.time() + TOKEN_RETRY_SECONDS)
+            return None
+        self._tokens[principal] = ticket
+        return ticket[0]
+
+    async def keep_fresh(self):
+        while True:
+            await asyncio.sleep(TOKEN_CHECK_SECONDS)
+            now = time.time()
+            for principal, (token, expires) in list(self._tokens.items()):
+                if token is not None and expires - now < TOKEN_REFRESH_MARGIN:
+                    await self.refresh(principal)
+
+
+def _alive(sock):
+    """
+    True if an idle socket is still open and has nothing unexpected queued.
+    """
+    try:
+        return not sock.recv(1, socket.MSG_PEEK)
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+
+async def _dial(loop):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        await loop.sock_connect(sock, (PROXY_HOST, PROXY_PORT))
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+class UpstreamPool:
+    """
+    Idle, already-connected sockets to the upstream proxy: pre-dialled ones
+    (topped up to UPSTREAM_POOL_SIZE in the background) and keep-alive ones
+    handed back after a forwarded HTTP request.
+    """
+
+    def __init__(self):
+        self._idle = deque()
+        self._refill = None
+
+    async def acquire(self, loop):
+        """
+        Returns (socket, pooled). A pooled socket may still turn out to be
+        closed by the proxy; callers retry once on a fresh one.
+        """
+        now = time.monotonic()
+        while self._idle:
+            sock, since = self._idle.pop()
+            if now - since < UPSTREAM_IDLE_SECONDS and _alive(sock):
+                self.warm(loop)
+                _inc("kproxy_upstream_connections_total", source="pooled")
+                return sock, True
+            sock.close()
+        self.warm(loop)
+        _inc("kproxy_upstream_connections_total", source="dialed")
+        return await _dial(loop), False
+
+    def release(self, sock):
+        if len(self._idle) < UPSTREAM_POOL_MAX:
+            self._idle.append((sock, time.monotonic()))
+        else:
+            sock.close()
+
+    def warm(self, loop):
+        """
+        Start topping the idle set up to UPSTREAM_POOL_SIZE, if not already.
+        """
+        if UPSTREAM_POOL_SIZE and (self._refill is None or self._refill.done()):
+            self._refill = loop.create_task(self._fill(loop))
+
+    async def _fill(self, loop):
+        while len(self._idle) < UPSTREAM_POOL_SIZE:
+            try:
+                self.release(await _dial(loop))
+            except OSError as e:
+                print(f"[ERROR] Upstream pre-dial failed: {e}")
+                return
+
+
+tokens = TokenCache()
+upstream = UpstreamPool()
+
+
+class _Stream:
+    """
+    Buffered reads over a non-blocking socket, for HTTP heads and bodies.
+    All socket reads go through one reusable recv_into buffer.
+    """
+
+    def __init__(self, loop, sock):
+        self.loop = loop
+        self.sock = sock
+        self._buf = bytearray()
+        self._view = memoryview(bytearray(BUFFER_SIZE))
+
+    async def _fill(self):
+        n = await self.loop.sock_recv_into(self.sock, self._view)
+        self._buf += self._view[:n]
+        return n
+
+    async def read_until(self, sep, limit=MAX_HEAD_SIZE):
+        """
+        Bytes up to and including sep; None if the peer closed before
+        sending anything.
+        """
+        while True:
+            end = self._buf.find(sep)
+            if end >= 0:
+                data = bytes(self._buf[:end + len(sep)])
+                del self._buf[:end + len(sep)]
+                return data
+            if len(self._buf) > limit:
+                raise ValueError("HTTP head too large")
+            if not await self._fill():
+                if self._buf:
+                    raise ConnectionError("peer closed mid-message")
+                return None
+
+    async def read_head(self):
+        return await self.read_until(b"\r\n\r\n")
+
+    def take_buffered(self):
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+    async def copy(self, dst, n):
+        """
+        Forward exactly n bytes to dst.
+        """
+        if self._buf:
+            part = self.take_buffered()
+            if len(part) > n:
+                self._buf += part[n:]
+                part = part[:n]
+            await self.loop.sock_sendall(dst, part)
+            n -= len(part)
+        while n:
+            got = await self.loop.sock_recv_into(self.sock, self._view[:min(n, BUFFER_SIZE)])
+            if not got:
+                raise ConnectionError("peer closed mid-body")
+            await self.loop.sock_sendall(dst, self._view[:got])
+            n -= got
+
+    async def copy_chunked(self, dst):
+        """
+        Forward a chunked body as-is, through its last chunk and trailers.
+        """
+        while True:
+            line = await self.read_until(b"\r\n")
+            if line is None:
+                raise ConnectionError("peer closed mid-body")
+            await self.loop.sock_sendall(dst, line)
+            size = int(line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                break
+            await self.copy(dst, size + 2)
+        while True:
+            trailer = await self.read_until(b"\r\n")
+            if trailer is None:
+                raise ConnectionError("peer closed mid-body")
+            await self.loop.sock_sendall(dst, trailer)
+            if trailer == b"\r\n":
+                return
+
+    async def copy_to_eof(self, dst):
+        if self._buf:
+            await self.loop.sock_sendall(dst, self.take_buffered())
+        while True:
+            got = await self.loop.sock_recv_into(self.sock, self._view)
+            if not got:
+                return
+            await self.loop.sock_sendall(dst, self._view[:got])
+
+
+def _parse_head(head):
+    """
+    (start line parts, {lower-cased header: value}, header lines)
+    """
+    lines = head.decode('latin-1').split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return lines[0].split(" ", 2), headers, [l for l in lines[1:] if l]
+
+def _body_framing(headers):
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        return "chunked"
+    if "content-length" in headers:
+        return int(headers["content-length"])
+    return None
+
+def _keep_alive(version, headers, proxy=False):
+    value = headers.get("proxy-connection" if proxy and "proxy-connection" in headers
+                        else "connection", "").lower()
+    if version.upper() == "HTTP/1.0":
+        return "keep-alive" in value
+    return "close" not in value
+
+async def _copy_body(stream, dst, framing):
+    if framing == "chunked":
+        await stream.copy_chunked(dst)
+    elif framing:
+        await stream.copy(dst, framing)
+
+
+async def _send_error(loop, sock, code, reason):
+    body = f"{code} {reason}\r\n".encode()
+    head = (
+        f"HTTP/1.1 {code} {reason}\r\n"
+        f"Content-Type: text/plain\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n"
+    ).encode()
+    await loop.sock_sendall(sock, head + body)
+
+
+async def _wait_fd(loop, fd, write=False):
+    fut = loop.create_future()
+    wake = lambda: fut.done() or fut.set_result(None)
+    if write:
+        loop.add_writer(fd, wake)
+    else:
+        loop.add_reader(fd, wake)
+    try:
+        await fut
+    finally:
+        if write:
+            loop.remove_writer(fd)
+        else:
+            loop.remove_reader(fd)
+
+async def _pump_copy(loop, src, dst, direction):
+    """
+    src -> dst through one reusable buffer. sock_sendall only returns once
+    the peer has taken the bytes, so a slow reader throttles the sender
+    instead of growing memory.
+    """
+    buf = bytearray(BUFFER_SIZE)
+    view = memoryview(buf)
+    moved = 0
+    try:
+        while True:
+            n = await loop.sock_recv_into(src, view)
+            if not n:
+                return moved
+            await loop.sock_sendall(dst, view[:n])
+            moved += n
+    finally:
+        _inc("kproxy_bytes_total", moved, direction=direction)
+
+async def _pump_splice(loop, src, dst, direction):
+    """
+    src -> pipe -> dst with os.splice: the payload never enters user space.
+    """
+    flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+    rpipe, wpipe = os.pipe()
+    moved = 0
+    try:
+        while True:
+            try:
+                n = os.splice(src.fileno(), wpipe, BUFFER_SIZE, flags=flags)
+            except BlockingIOError:
+                await _wait_fd(loop, src.fileno())
+                continue
+            if not n:
+                return moved
+            while n:
+                try:
+                    sent = os.splice(rpipe, dst.fileno(), n, flags=flags)
+                except BlockingIOError:
+                    await _wait_fd(loop, dst.fileno(), write=True)
+                    continue
+                n -= sent
+                moved += sent
+    finally:
+        _inc("kproxy_bytes_total", moved, direction=direction)
+        os.close(rpipe)
+        os.close(wpipe)
+
+async def _relay(loop, src, dst, direction):
+    """
+    One direction of a tunnel. When src finishes sending, dst is half-closed
+    so the other direction keeps flowing until its side is done as well.
+    """
+    how = socket.SHUT_WR
+    try:
+        if USE_SPLICE:
+            await _pump_splice(loop, src, dst, direction)
+        else:
+            await _pump_copy(loop, src, dst, direction)
+    except OSError:
+        # reset by either peer: wake the other direction so it ends too
+        how = socket.SHUT_RDWR
+        try:
+            src.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    finally:
+        try:
+            dst.shutdown(how)
+        except OSError:
+            pass
+
+async def tunnel_data(loop, client_sock, remote_sock):
+    await asyncio.gather(
+        _relay(loop, client_sock, remote_sock, "upload"),
+        _relay(loop, remote_sock, client_sock, "download"),
+    )
+
 
+async def _open_tunnel(loop, target, token):
+    """
+    CONNECT through the upstream proxy on a pooled connection (retrying on
+    a fresh one if the pooled one was dropped). Returns (socket, extra)
+    where extra is any tunnelled data that arrived with the response.
+    """
+    headers = (
+        f"CONNECT {target} HTTP/1.1\r\n"
+        f"Host: {target}\r\n"
+        f"Proxy-Authorization: {token}\r\n"
+        f"Proxy-Connection: Keep-Alive\r\n\r\n"
+    ).encode()
+    while True:
+        proxy_sock, pooled = await upstream.acquire(loop)
         try:
-            proxy_sock = socket.create_connection((PROXY_HOST, PROXY_PORT))
-            headers = (
-                f"CONNECT {self.path} HTTP/1.1\r\n"
-                f"Host: {self.path}\r\n"
-                f"Proxy-Authorization: {token}\r\n"
-                f"Proxy-Connection: Keep-Alive\r\n\r\n"
-            )
-            proxy_sock.sendall(headers.encode())
-            response = proxy_sock.recv(BUFFER_SIZE)
+            stream = _Stream(loop, proxy_sock)
+            try:
+                await loop.sock_sendall(proxy_sock, headers)
+                response = await stream.read_head()
+            except OSError:
+                response = None
+                if not pooled:
+                    raise
+            if response is None:
+                if pooled:
+                    proxy_sock.close()
+                    continue  # stale pooled connection: retry on a new one
+                raise ConnectionError("upstream proxy closed the connection")
             response_line = response.decode(errors='ignore').splitlines()[0]
             print(f"[DEBUG] Proxy response: {response_line}")
+            if response_line.split()[1:2] != ["200"]:
+                raise ConnectionError(response_line)
+            return proxy_sock, stream.take_buffered()
+        except BaseException:
+            proxy_sock.close()
+            raise
 
-            if b"200 Connection Established" not in response:
-                self.send_error(502, f"Tunnel failed: {response_line}")
-                return
+async def _connect(loop, client, target):
+    print(f"\n[+] CONNECT request to {target}")
+    started = time.monotonic()
+    token = await tokens.get(SERVICE_PRINCIPAL)
+    if not token:
+        _inc("kproxy_tunnels_total", result="auth_failed")
+        await _send_error(loop, client.sock, 500, "Kerberos token generation failed")
+        return
 
-            self.send_response(200, "Connection Established")
-            self.end_headers()
-            self._tunnel_data(self.connection, proxy_sock)
+    try:
+        proxy_sock, upstream_extra = await _open_tunnel(loop, target, token)
+    except (OSError, ConnectionError, ValueError) as e:
+        print(f"[ERROR] CONNECT error: {e}")
+        _inc("kproxy_tunnels_total", result="upstream_failed")
+        await _send_error(loop, client.sock, 502, f"Tunnel failed: {e}")
+        return
+
+    _inc("kproxy_tunnels_total", result="ok")
+    _inc("kproxy_tunnels_active")
+    try:
+        await loop.sock_sendall(client.sock, b"HTTP/1.1 200 Connection Established\r\n\r\n")
+        _observe("kproxy_tunnel_setup_seconds", time.monotonic() - started)
+        if upstream_extra:
+            await loop.sock_sendall(client.sock, upstream_extra)
+        extra = client.take_buffered()
+        if extra:
+            await loop.sock_sendall(proxy_sock, extra)
+        await tunnel_data(loop, client.sock, proxy_sock)
+    finally:
+        proxy_sock.close()
+        _inc("kproxy_tunnels_active", -1)
+        _observe("kproxy_tunnel_seconds", time.monotonic() - started)
 
-        except Exception as e:
-            print(f"[ERROR] CONNECT error: {e}")
-            self.send_error(502, f"Tunnel failed: {e}")
+async def _forward(loop, client, head):
+    """
+    Forward one plain-HTTP request (absolute-form URL) to the upstream proxy
+    with our Proxy-Authorization and relay the response. Both sides are
+    kept alive when their framing allows. Returns whether the client
+    connection can carry another request.
+    """
+    (method, target, version), headers, lines = _parse_head(head)
+    token = await tokens.get(SERVICE_PRINCIPAL)
+    if not token:
+        _inc("kproxy_http_requests_total", result="auth_failed")
+        await _send_error(loop, client.sock, 500, "Kerberos token generation failed")
+        return False
+
+    client_keep = _keep_alive(version, headers, proxy=True)
+    hop = ("proxy-authorization", "proxy-connection", "connection", "keep-alive")
+    kept = [l for l in lines if l.split(":", 1)[0].strip().lower() not in hop]
+    request = "\r\n".join([
+        f"{method} {target} {version}", *kept,
+        f"Proxy-Authorization: {token}", "Proxy-Connection: Keep-Alive",
+        "Connection: keep-alive", "", "",
+    ]).encode('latin-1')
+    request_body = _body_framing(headers)
+
+    while True:
+        proxy_sock, pooled = await upstream.acquire(loop)
+        proxy = _Stream(loop, proxy_sock)
+        try:
+            await loop.sock_sendall(proxy_sock, request)
+            await _copy_body(client, proxy_sock, request_body)
+            response = await proxy.read_head()
+        except (OSError, ConnectionError):
+            proxy_sock.close()
+            if pooled and not request_body:
+                continue  # stale keep-alive connection: retry on a new one
+            raise
+        if response is None:
+            proxy_sock.close()
+            if pooled and not request_body:
+                continue
+            raise ConnectionError("upstream proxy closed the connection")
+        break
 
-    def _tunnel_data(self, client_socket, remote_socket):
-        sockets = [client_socket, remote_socket]
+    # the response has started: from here on a failure can only drop the client
+    try:
+        (rversion, status, *_), rheaders, _ = _parse_head(response)
+        await loop.sock_sendall(client.sock, response)
+        if method.upper() == "HEAD" or status[:1] == "1" or status in ("204", "304"):
+            framing = 0
+        else:
+            framing = _body_framing(rheaders)
+        if framing is None:
+            await proxy.copy_to_eof(client.sock)
+            _inc("kproxy_http_requests_total", result="ok")
+            proxy_sock.close()
+            return False
+        await _copy_body(proxy, client.sock, framing)
+    except (OSError, ConnectionError, ValueError) as e:
+        print(f"[ERROR] Forward error: {e}")
+        _inc("kproxy_http_requests_total", result="dropped")
+        proxy_sock.close()
+        return False
+    except BaseException:
+        proxy_sock.close()
+        raise
+
+    _inc("kproxy_http_requests_total", result="ok")
+    if _keep_alive(rversion, rheaders) and not proxy.take_buffered():
+        upstream.release(proxy_sock)
+    else:
+        proxy_sock.close()
+    return client_keep and _keep_alive(rversion, rheaders)
+
+async def handle_client(loop, client_sock):
+    client = _Stream(loop, client_sock)
+    try:
         while True:
-            rlist, _, _ = select.select(sockets, [], [])
-            for s in rlist:
-                data = s.recv(BUFFER_SIZE)
-                if not data:
+            head = await client.read_head()
+            if head is None:
+                return
+            method, target, _ = head.decode(errors='ignore').split(" ", 2)
+            if method.upper() == "CONNECT":
+                await _connect(loop, client, target)
+                return
+            if method.upper() == "GET" and target == "/metrics":
+                body = render_metrics().encode()
+                await loop.sock_sendall(client_sock, (
+                    f"HTTP/1.1 200 OK\r\n"
+                    f"Content-Type: text/plain; version=0.0.4\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n"
+                ).encode() + body)
+                continue
+            if "://" not in target:
+                await _send_error(loop, client_sock, 400, "Expected an absolute URL")
+                return
+            try:
+                if not await _forward(loop, client, head):
                     return
-                if s is client_socket:
-                    remote_socket.sendall(data)
-                else:
-                    client_socket.sendall(data)
+            except (OSError, ConnectionError) as e:
+                print(f"[ERROR] Forward error: {e}")
+                _inc("kproxy_http_requests_total", result="upstream_failed")
+                await _send_error(loop, client_sock, 502, f"Upstream failed: {e}")
+                return
 
-    def log_message(self, format, *args):
-        return
+    except (OSError, ConnectionError, ValueError) as e:
+        print(f"[ERROR] Client error: {e}")
+    finally:
+        client_sock.close()
+
+async def serve(port=LISTEN_PORT, host=''):
+    """
+    Accept loop: every client connection is one task on a single event loop.
+    """
+    loop = asyncio.get_running_loop()
+    listener = socket.create_server((host, port), backlog=1024)
+    listener.setblocking(False)
+    tasks = set()
+    # warm both caches before the first client arrives
+    tasks.add(loop.create_task(tokens.keep_fresh()))
+    await tokens.get(SERVICE_PRINCIPAL)
+    upstream.warm(loop)
+    with listener:
+        while True:
+            client_sock, _ = await loop.sock_accept(listener)
+            client_sock.setblocking(False)
+            client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            task = loop.create_task(handle_client(loop, client_sock))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
 
 
 if __name__ == '__main__':
-    PORT = 3129
-    print(f"[+] Kerberos proxy running at http://localhost:{PORT}")
+    print(f"[+] Kerberos proxy running at http://localhost:{LISTEN_PORT}")
     print(f"[+] Forwarding through: {PROXY_HOST}:{PROXY_PORT}")
-    with socketserver.ThreadingTCPServer(('', PORT), KerberosProxyHandler) as httpd:
-        httpd.serve_forever()
+    print(f"[+] Relay: {'os.splice' if USE_SPLICE else 'recv_into'}")
+    asyncio.run(serve())
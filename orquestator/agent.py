@@ -0,0 +1,192 @@
+"""
+Worker agent: runs steps for an orchestrator started with ORQ_DISPATCH=agents
+(or auto).
+
+    python agent.py --server http://orchestrator:8000 --labels venv:process1 --slots 2
+
+Start it from an orquestator checkout matching the server's (step paths
+are relative to it). Each slot long-polls the server for a step whose
+"requires" labels this agent has, runs it with the local
+integrations/*_runner, streams output lines back with every heartbeat
+and posts the result. A cancel, timeout or lost lease kills the step's
+process group. Several agents can run side by side on one machine.
+"""
+
+import argparse
+import logging
+import platform
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+from compiler import get_runner, load_runners
+from integrations.process import StepContext
+
+log = logging.getLogger("agent")
+
+# Seconds a lease request waits on the server for work
+LEASE_WAIT_SECONDS = 20
+
+# Pending output lines are sent this often (an empty heartbeat only every
+# lease_seconds / 3)
+STREAM_SECONDS = 1.0
+
+# Output lines sent per heartbeat at most (the rest go with the next one)
+HEARTBEAT_MAX_LINES = 2000
+
+# Pause before reconnecting after the server could not be reached
+RECONNECT_SECONDS = 2.0
+
+
+def default_labels() -> list[str]:
+    """
+    Labels every agent gets: its OS and the toolchains found on PATH.
+    """
+    labels = [platform.system().lower(), "python"]
+    labels += [tool for tool in ("node", "npm", "npx", "curl") if shutil.which(tool)]
+    return labels
+
+
+class Agent:
+    def __init__(self, server: str, name: str, labels: list, slots: int, workdir: Path):
+        self.client = httpx.Client(base_url=server.rstrip("/"), timeout=LEASE_WAIT_SECONDS + 10)
+        self.name = name
+        self.labels = sorted(set(labels))
+        self.slots = slots
+        self.workdir = workdir
+        self.agent_id = None
+        self.heartbeat_seconds = 10.0
+        self._register_lock = threading.Lock()
+
+    def register(self, stale: str | None = None) -> None:
+        with self._register_lock:
+            if self.agent_id is not None and self.agent_id != stale:
+                return  # another slot already did
+            while True:
+                try:
+                    r = self.client.post("/agents/register", params={
+                        "name": self.name, "labels": ",".join(self.labels), "slots": self.slots,
+                    })
+                    r.raise_for_status()
+                    break
+                except httpx.HTTPError as e:
+                    log.warning("register failed: %s", e)
+                    time.sleep(RECONNECT_SECONDS)
+            info = r.json()
+            self.agent_id = info["agent_id"]
+            self.heartbeat_seconds = info["lease_seconds"] / 3
+            log.info("registered as %s with labels %s", self.agent_id, ", ".join(self.labels))
+
+    def serve(self) -> None:
+        load_runners()
+        self.register()
+        threads = [threading.Thread(target=self._slot, name=f"slot{i}", daemon=True) for i in range(self.slots)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def _slot(self) -> None:
+        while True:
+            agent_id = self.agent_id
+            try:
+                r = self.client.post(f"/agents/{agent_id}/lease", params={"wait": LEASE_WAIT_SECONDS})
+            except httpx.TransportError as e:
+                log.warning("lease failed: %s", e)
+                time.sleep(RECONNECT_SECONDS)
+                continue
+            if r.status_code == 404:
+                self.register(stale=agent_id)  # the server restarted
+            elif r.status_code == 200:
+                self._run(r.json())
+            elif r.status_code != 204:
+                time.sleep(RECONNECT_SECONDS)
+
+    def _run(self, job: dict) -> None:
+        step = job["step"]
+        url = f"/agents/{self.agent_id}/jobs/{job['job_id']}"
+        lines, lines_lock = [], threading.Lock()
+        stop, finished = threading.Event(), threading.Event()
+        lost = threading.Event()
+
+        def collect(stream: str, line: str) -> None:
+            with lines_lock:
+                lines.append((stream, line))
+
+        def take() -> list:
+            with lines_lock:
+                batch = lines[:HEARTBEAT_MAX_LINES]
+                del lines[:HEARTBEAT_MAX_LINES]
+            return batch
+
+        def heartbeat() -> None:
+            last = time.monotonic()
+            while not finished.wait(STREAM_SECONDS):
+                if not lines and time.monotonic() - last < self.heartbeat_seconds:
+                    continue
+                last = time.monotonic()
+                try:
+                    r = self.client.post(f"{url}/heartbeat", json={"lease_id": job["lease_id"], "lines": take()})
+                except httpx.TransportError as e:
+                    log.warning("heartbeat failed: %s", e)
+                    continue
+                if r.status_code == 409:
+                    log.warning("lost lease on %s; stopping it", step.get("name"))
+                    lost.set()
+                    stop.set()
+                    return
+                if r.status_code == 200 and r.json().get("cancel"):
+                    stop.set()
+
+        deadline = None
+        if job.get("timeout_seconds") is not None:
+            deadline = time.monotonic() + job["timeout_seconds"]
+        ctx = StepContext(job["run_id"], job["idx"], self.workdir / "spool" / job["job_id"],
+                          on_line=collect, deadline=deadline, stop=stop)
+        ctx.remote, ctx.hints = True, job.get("hints") or {}
+        log.info("running %s (%s) for run %s", step.get("name"), step.get("type"), job["run_id"])
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            result = get_runner(step["type"]).execute(step, ctx)
+        except Exception as e:
+            result = {"error": str(e)}
+        finally:
+            finished.set()
+        if lost.is_set():
+            return
+
+        # output beyond one batch goes out with extra heartbeats first
+        while len(lines) > HEARTBEAT_MAX_LINES:
+            try:
+                self.client.post(f"{url}/heartbeat", json={"lease_id": job["lease_id"], "lines": take()})
+            except httpx.TransportError:
+                break
+        payload = {"lease_id": job["lease_id"], "result": result, "lines": take()}
+        while True:
+            try:
+                self.client.post(f"{url}/result", json=payload)
+                return
+            except httpx.TransportError as e:
+                log.warning("posting result failed: %s", e)
+                time.sleep(RECONNECT_SECONDS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", default="http://localhost:8000")
+    parser.add_argument("--name", default=socket.gethostname())
+    parser.add_argument("--labels", default="", help="extra comma-separated labels, e.g. venv:process1,gpu")
+    parser.add_argument("--slots", type=int, default=1, help="steps run at once")
+    parser.add_argument("--workdir", default=None, help="where full step output is spooled")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    labels = default_labels() + [l.strip() for l in args.labels.split(",") if l.strip()]
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.gettempdir()) / f"orq-agent-{args.name}"
+    Agent(args.server, args.name, labels, args.slots, workdir).serve()
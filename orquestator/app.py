@@ -1,24 +1,106 @@
+import asyncio
+import copy
 import uuid
 import json
+import logging
 import threading
-from importlib import import_module
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import asynccontextmanager
+from datetime import datetime
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Body, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 
-from persistence import save_run, load_run
+from broadcast import Broadcaster
+from compiler import WorkflowError, load_compiled, load_runners, get_runner, resolve_dependencies
+from persistence import (
+    FINISHED, save_run, load_run, update_step, set_status, append_output,
+    list_runs, add_listener, record_trace, run_version, read_log, STEP_RUNTIME_KEYS,
+    compact_runs, start_compactor,
+)
+from scheduler import Scheduler, QueueFull
+import dispatch
+import matrix
+import metrics
+import outbox
+import stepcache
+from settings import CYPRESS_MODULES
+import testhistory
+from integrations.process import StepContext
 from fastapi.middleware.cors import CORSMiddleware
 
 # Folder where workflow definitions live
 WORKFLOWS = Path(__file__).parent / "workflows"
 
-# Optional mapping of module names → Cypress folders
-CYPRESS_MODULES = {
-    # "smoke": "cypress/integration/smoke",
-    # "feature": "cypress/integration/my-feature-tests",
+# Full step output is spooled to runs/spool/<run_id>/
+SPOOL_DIR = Path(__file__).parent / "runs" / "spool"
+
+# Live output is pushed to subscribers per line, but folded into the
+# persisted step tail at most this often
+OUTPUT_FLUSH_SECONDS = 1.0
+
+# Idle /runs/{id}/events streams get a keep-alive comment this often
+SSE_KEEPALIVE_SECONDS = 15
+
+# Longest a /status?wait_for_change= long-poll may be held open
+MAX_LONG_POLL_SECONDS = 60
+
+# Keys /status always returns, whatever `fields` asks for
+STATUS_BASE_FIELDS = {"id", "seq", "status"}
+
+# State of a step killed for its run's cancel or a timeout, by `killed`
+# reason (kept apart from "failed", a non-zero exit of its own)
+STOPPED_STATES = {"cancelled": "cancelled", "timeout": "timed_out"}
+
+# Default cap on steps running at the same time within one run
+# (override per workflow with "max_parallel" or per run on /start)
+MAX_PARALLEL_STEPS = 4
+
+# Admission control: workflows executing at once, runs allowed to wait
+# in the queue, and global caps per step type (types not listed are unbounded)
+MAX_CONCURRENT_RUNS = 4
+MAX_QUEUED_RUNS = 200
+STEP_TYPE_LIMITS = {
+    "cypress": 2,
+    "npm": 2,
+    "python": 8,
 }
 
-app = FastAPI()
+# Seconds a step may run when neither it nor its workflow sets
+# "timeout_seconds" (None: no limit). Timed-out and cancelled steps have
+# their whole process group killed.
+DEFAULT_STEP_TIMEOUT_SECONDS = None
+
+# On startup, put runs a previous server process left queued or running
+# back in the queue (steps that were mid-flight run again)
+RESUME_INTERRUPTED_RUNS = True
+
+log = logging.getLogger(__name__)
+
+RUNS_FINISHED = metrics.Counter("orq_runs_total", "Runs finished", ("workflow", "status"))
+RUN_SECONDS = metrics.Histogram("orq_run_duration_seconds", "Run execution time", ("workflow", "status"))
+QUEUE_WAIT_SECONDS = metrics.Histogram("orq_run_queue_wait_seconds", "Time runs spend queued", ("workflow",))
+STEP_SECONDS = metrics.Histogram("orq_step_duration_seconds", "Step wall time", ("type", "result"))
+CACHE_SAVED_SECONDS = metrics.Counter(
+    "orq_step_cache_saved_seconds_total", "Step time skipped by result cache hits", ("type",),
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # import every runner plugin up front so a broken one fails at boot
+    load_runners()
+    # deliver notifications still queued from before a restart
+    outbox.start()
+    if RESUME_INTERRUPTED_RUNS:
+        resume_interrupted()
+    # move old finished runs to the archive in the background
+    start_compactor(retention)
+    yield
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -30,83 +112,733 @@ app.add_middleware(
     allow_credentials=True,
 )
 
+# live run events for /runs/{id}/events subscribers
+hub = Broadcaster()
+add_listener(hub.publish)
+
+# wakes agents long-polling /agents/{id}/lease when a step is up for grabs
+AGENTS_CHANNEL = "agents"
+dispatch.add_listener(lambda: hub.publish(AGENTS_CHANNEL, {"type": "job"}))
+
+# run_id -> event set by /runs/{id}/cancel, seen by every step of the run
+_stop_events: dict[str, threading.Event] = {}
+
 def load_workflow(name: str) -> dict:
     """
-    Read workflows/<name>.json and return its dict.
+    Return the compiled workflows/<name>.json (cached until the file changes).
+    Raises FileNotFoundError, or WorkflowError if it doesn't validate.
     """
     path = WORKFLOWS / f"{name}.json"
     if not path.exists():
         raise FileNotFoundError(f"No workflow named '{name}'")
-    return json.loads(path.read_text())
+    return load_compiled(path)
+
+def retention(name: str) -> dict | None:
+    """
+    The workflow's own "retention" overrides ({"days", "runs"}), if any.
+    """
+    try:
+        return load_workflow(name).get("retention")
+    except (FileNotFoundError, WorkflowError):
+        return None
+
+class LiveOutput:
+    """
+    Line callback for a step's StepContext: pushes every line to live
+    subscribers immediately and appends it to the run's persisted output
+    tail in batches, at most once per OUTPUT_FLUSH_SECONDS.
+    """
+
+    def __init__(self, run_id: str, idx: int):
+        self.run_id = run_id
+        self.idx = idx
+        self._lock = threading.Lock()
+        self._pending = {"out": [], "err": []}
+        self._flushed = time.monotonic()
+
+    def __call__(self, stream: str, line: str) -> None:
+        hub.publish(self.run_id, {"type": "line", "idx": self.idx, "stream": stream, "data": line})
+        with self._lock:
+            self._pending[stream].append(line)
+            if time.monotonic() - self._flushed >= OUTPUT_FLUSH_SECONDS:
+                self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        for stream, lines in self._pending.items():
+            if lines:
+                append_output(self.run_id, self.idx, stream, "".join(lines))
+                lines.clear()
+        self._flushed = time.monotonic()
+
+def execute_step(step: dict, ctx: StepContext | None = None) -> dict:
+    """
+    Resolve the step's runner plugin and execute it once a slot for its
+    type is free (or hand it to a worker agent), never raising.
+    """
+    try:
+        mod = get_runner(step["type"])
+        if dispatch.remote(step):
+            return dispatch.run_remote(step, ctx)
+        with scheduler.step_slot(step["type"]):
+            return mod.execute(step, ctx)
+    except Exception as e:
+        return {"error": str(e)}
+
+def _run_step(run_id: str, idx: int, step: dict, use_cache: bool = True,
+              trace: metrics.Span | None = None, deadline: float | None = None,
+              stop: threading.Event | None = None) -> dict:
+    with metrics.activate(trace), metrics.span(step["name"], idx=idx, type=step["type"]) as span:
+        started = time.monotonic()
+        result = _run_step_cached(run_id, idx, step, use_cache, deadline, stop)
+        if "cached" in result:
+            outcome = "cached"
+            CACHE_SAVED_SECONDS.inc(result["cached"]["saved_seconds"], type=step["type"])
+        elif "killed" in result:
+            outcome = result["killed"]
+        else:
+            outcome = "completed" if result.get("code", 1) == 0 else "failed"
+        STEP_SECONDS.observe(time.monotonic() - started, type=step["type"], result=outcome)
+        if span is not None:
+            span.attrs["result"] = outcome
+    return result
+
+def _run_step_cached(run_id: str, idx: int, step: dict, use_cache: bool,
+                     deadline: float | None, stop: threading.Event | None) -> dict:
+    live = LiveOutput(run_id, idx)
+    ctx = StepContext(run_id, idx, SPOOL_DIR / run_id, on_line=live, deadline=deadline, stop=stop)
+
+    # opt-in result cache: reuse a previous success with identical inputs
+    key = None
+    if use_cache and step.get("cache"):
+        try:
+            key = stepcache.cache_key(step, get_runner(step["type"]))
+            hit = stepcache.lookup(key, ctx.spool_dir, idx)
+        except (KeyError, OSError):
+            key = hit = None
+        if hit is not None:
+            return hit
+
+    started = time.monotonic()
+    try:
+        if "matrix" in step:
+            result = matrix.run(step, ctx, execute_step)
+        else:
+            result = execute_step(step, ctx)
+    finally:
+        live.close()
+    if key is not None and result.get("code") == 0:
+        try:
+            stepcache.store(key, step, result, run_id, time.monotonic() - started)
+        except OSError:
+            pass  # a failed cache write never fails the step
+    return result
 
 def run_workflow(run_id: str):
     """
-    Runs all steps in sequence. Stops on first non-zero exit code.
+    Runs steps as soon as their dependencies have completed, at most
+    `max_parallel` at a time. After the first non-zero exit code, a
+    cancel or the run's timeout no new steps are started; in-flight ones
+    finish (or are killed) and the rest are skipped.
     """
     run = load_run(run_id)
-    run["status"] = "running"
-    save_run(run_id, run)
+    steps = run["steps"]
+    states = run["states"]
+    deps = resolve_dependencies(steps)
+    cap = max(1, run.get("max_parallel", MAX_PARALLEL_STEPS))
+    use_cache = not run.get("no_cache", False)
+    stop = _stop_events.setdefault(run_id, threading.Event())
+    run_deadline = None
+    if run.get("timeout_seconds"):
+        run_deadline = time.monotonic() + run["timeout_seconds"]
+    timed_out = False
 
-    for idx, step in enumerate(run["steps"]):
-        try:
-            module_name = f"integrations.{step['type']}_runner"
-            mod = import_module(module_name)
-            result = mod.execute(step)
-        except Exception as e:
-            result = {"error": str(e)}
-
-        # reload & update state
-        run = load_run(run_id)
-        run["log"].append({"step": step["name"], "result": result})
-
-        # if it failed, mark as failed and stop
-        if result.get("code", 1) != 0:
-            run["status"] = "failed"
-            save_run(run_id, run)
-            return
+    # span tree stored with the run: queue wait, then one span per step
+    created = datetime.fromisoformat(run.get("created_at") or datetime.now().isoformat()).timestamp()
+    trace = metrics.Span("run", start=created, workflow=run["name"])
+    if run.get("retry_of"):
+        trace.attrs["retry_of"] = run["retry_of"]
+    trace.child("queued", start=created).finish()
+    QUEUE_WAIT_SECONDS.observe(time.time() - created, workflow=run["name"])
+    started = time.monotonic()
+
+    set_status(run_id, "running")
+
+    # a resumed run may already hold a failure from before the restart
+    failed = any(state == "failed" or state in STOPPED_STATES.values() for state in states)
+    running = {}
+    with ThreadPoolExecutor(max_workers=cap) as pool:
+        while True:
+            if run_deadline is not None and time.monotonic() >= run_deadline:
+                timed_out = failed = True
+            # launch every step whose prerequisites are all completed
+            if not failed and not stop.is_set():
+                for idx, step in enumerate(steps):
+                    if len(running) >= cap:
+                        break
+                    if states[idx] != "pending":
+                        continue
+                    if all(states[d] == "completed" for d in deps[idx]):
+                        states[idx] = "running"
+                        update_step(run_id, idx, "running", started_at=datetime.now().isoformat())
+                        limit = step.get("timeout_seconds", DEFAULT_STEP_TIMEOUT_SECONDS)
+                        deadline = time.monotonic() + limit if limit else None
+                        if run_deadline is not None:
+                            deadline = min(deadline or run_deadline, run_deadline)
+                        fut = pool.submit(_run_step, run_id, idx, step, use_cache, trace, deadline, stop)
+                        running[fut] = idx
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                idx = running.pop(fut)
+                result = fut.result()
+                if "killed" in result:
+                    states[idx] = STOPPED_STATES.get(result["killed"], "failed")
+                    failed = True
+                elif result.get("code", 1) != 0:
+                    states[idx] = "failed"
+                    failed = True
+                else:
+                    states[idx] = "completed"
+                entry = {"step": steps[idx]["name"], "result": result}
+                fields = {"ended_at": datetime.now().isoformat()}
+                if "cached" in result:
+                    entry.update(cached=True, saved_seconds=result["cached"]["saved_seconds"])
+                    fields["cached"] = True
+                update_step(run_id, idx, states[idx], log_entry=entry, **fields)
 
-        # otherwise bump current pointer and persist
-        run["current"] = idx + 1
-        save_run(run_id, run)
+    if failed or stop.is_set():
+        for idx, state in enumerate(states):
+            if state == "pending":
+                update_step(run_id, idx, "skipped")
+    if stop.is_set():
+        final = "cancelled"
+    else:
+        final = "failed" if failed else "completed"
+    _stop_events.pop(run_id, None)
 
-    # all steps passed
-    run["status"] = "completed"
-    save_run(run_id, run)
+    trace.finish()
+    trace.attrs["status"] = final
+    if timed_out:
+        trace.attrs["timed_out"] = True
+    record_trace(run_id, trace.to_dict())
+    RUNS_FINISHED.inc(workflow=run["name"], status=final)
+    RUN_SECONDS.observe(time.monotonic() - started, workflow=run["name"], status=final)
+    set_status(run_id, final)
+
+scheduler = Scheduler(
+    run_workflow,
+    max_runs=MAX_CONCURRENT_RUNS,
+    max_queued=MAX_QUEUED_RUNS,
+    step_limits=STEP_TYPE_LIMITS,
+)
+
+metrics.Gauge("orq_runs_queued", "Runs waiting in the queue", lambda: scheduler.stats()["queued"])
+metrics.Gauge("orq_runs_running", "Runs executing", lambda: scheduler.stats()["running"])
 
 @app.post("/start")
 def start(
     name: str = Query(..., description="Workflow name (filename without .json)"),
+    max_parallel: int | None = Query(None, ge=1, description="Max steps running at once"),
+    priority: int = Query(0, description="Higher runs are dequeued first"),
+    no_cache: bool = Query(False, description="Run every step even if a cached result matches"),
+    timeout_seconds: float | None = Query(None, gt=0, description="Stop the whole run after this long"),
 ):
     """
-    Start a new workflow run.
+    Queue a new workflow run.
     """
     try:
         wf = load_workflow(name)
     except FileNotFoundError:
         raise HTTPException(404, f"Workflow '{name}' not found")
+    except WorkflowError as e:
+        raise HTTPException(400, {"message": f"Workflow '{name}' is invalid", "problems": e.problems})
 
     run_id = uuid.uuid4().hex
     run = {
         "id": run_id,
         "name": name,
-        "steps": wf["steps"],
-        "current": 0,
-        "status": "pending",
+        "steps": copy.deepcopy(wf["steps"]),
+        "max_parallel": max_parallel or wf.get("max_parallel", MAX_PARALLEL_STEPS),
+        "current": [],
+        "states": ["pending"] * len(wf["steps"]),
+        "priority": priority,
+        "no_cache": no_cache,
+        "timeout_seconds": timeout_seconds or wf.get("timeout_seconds"),
+        "created_at": datetime.now().isoformat(),
+        "status": "queued",
         "log": []
     }
-    save_run(run_id, run)
+    return _enqueue(run)
+
+def _enqueue(run: dict) -> dict:
+    """
+    Persist a new run and hand it to the scheduler; refuse it outright if
+    the queue is full.
+    """
+    save_run(run["id"], run)
+    try:
+        position = scheduler.submit(run["id"], run["priority"])
+    except QueueFull as e:
+        set_status(run["id"], "rejected")
+        raise HTTPException(429, str(e))
+    return {"run_id": run["id"], "queue_position": position}
+
+def _downstream(steps: list, idx: int) -> set:
+    """
+    `idx` plus every step that (transitively) depends on it.
+    """
+    deps = resolve_dependencies(steps)
+    found = {idx}
+    changed = True
+    while changed:
+        changed = False
+        for i, wanted in enumerate(deps):
+            if i not in found and wanted & found:
+                found.add(i)
+                changed = True
+    return found
+
+@app.post("/runs/{run_id}/retry")
+def retry(
+    run_id: str,
+    from_step: str | None = Query(None, description="Re-run this step and everything after it"),
+    priority: int | None = Query(None, description="Defaults to the original run's priority"),
+):
+    """
+    Queue a new run linked to a finished one (`retry_of`). Completed steps
+    are carried over with their results instead of executed again, except
+    `from_step` and the steps depending on it; without `from_step` only
+    the failed and skipped steps run.
+    """
+    try:
+        old = load_run(run_id)
+    except FileNotFoundError:
+        raise HTTPException(404, "Run not found")
+    if old["status"] not in FINISHED:
+        raise HTTPException(409, f"Run is {old['status']}; only finished runs can be retried")
+
+    steps = [{k: v for k, v in step.items() if k not in STEP_RUNTIME_KEYS} for step in old["steps"]]
+    rerun = set()
+    if from_step is not None:
+        names = [s["name"] for s in steps]
+        if from_step not in names:
+            raise HTTPException(400, f"No step named '{from_step}' in run {run_id}")
+        rerun = _downstream(steps, names.index(from_step))
+
+    results = {e["step"]: e["result"] for e in old["log"] if "step" in e}
+    states, log = [], []
+    for idx, step in enumerate(steps):
+        if old["states"][idx] == "completed" and idx not in rerun and step["name"] in results:
+            states.append("completed")
+            step["reused_from"] = run_id
+            log.append({"step": step["name"], "result": results[step["name"]], "reused_from": run_id})
+        else:
+            states.append("pending")
+
+    new_id = uuid.uuid4().hex
+    run = {
+        "id": new_id,
+        "name": old["name"],
+        "steps": steps,
+        "max_parallel": old.get("max_parallel", MAX_PARALLEL_STEPS),
+        "current": [],
+        "states": states,
+        "priority": old.get("priority", 0) if priority is None else priority,
+        "no_cache": old.get("no_cache", False),
+        "timeout_seconds": old.get("timeout_seconds"),
+        "retry_of": run_id,
+        "from_step": from_step,
+        "created_at": datetime.now().isoformat(),
+        "status": "queued",
+        "log": log,
+    }
+    return {**_enqueue(run), "reused": [e["step"] for e in log]}
+
+@app.post("/runs/{run_id}/cancel")
+def cancel(run_id: str):
+    """
+    Cancel a queued or running run. A queued run is dropped from the queue
+    at once; in a running one no new steps start and the process groups of
+    the running steps are killed (their partial output is kept).
+    """
+    try:
+        run = load_run(run_id, {"status", "states"})
+    except FileNotFoundError:
+        raise HTTPException(404, "Run not found")
+    if run["status"] in FINISHED:
+        raise HTTPException(409, f"Run is already {run['status']}")
 
-    # launch the whole sequence in a background thread
-    threading.Thread(target=run_workflow, args=(run_id,), daemon=True).start()
+    if scheduler.cancel(run_id):
+        # steps a retry carried over as completed keep their state
+        for idx, state in enumerate(run["states"]):
+            if state == "pending":
+                update_step(run_id, idx, "skipped")
+        set_status(run_id, "cancelled")
+        return {"run_id": run_id, "status": "cancelled"}
+    # running (or just dequeued): run_workflow picks the same event up
+    _stop_events.setdefault(run_id, threading.Event()).set()
+    return {"run_id": run_id, "status": "cancelling"}
+
+def _upgrade_legacy_run(run: dict) -> bool:
+    """
+    Fill in what a run saved by the original sequential executor lacks:
+    per-step `states`, rebuilt from its `current` index (or, failing that,
+    the leading steps its log shows as passed), and `created_at`. The step
+    it was on when the server stopped is marked `interrupted_at`. Returns
+    False if the document is too damaged to resume.
+    """
+    steps = run.get("steps")
+    if not isinstance(steps, list) or not all(isinstance(s, dict) and "name" in s for s in steps):
+        return False
+    log_entries = run.get("log")
+    if not isinstance(log_entries, list):
+        return False
+    now = datetime.now().isoformat()
+    current = run.get("current")
+    if isinstance(current, int) and not isinstance(current, bool):
+        done = max(0, min(current, len(steps)))
+    else:
+        passed = {e.get("step") for e in log_entries
+                  if isinstance(e, dict) and isinstance(e.get("result"), dict) and e["result"].get("code", 1) == 0}
+        done = 0
+        while done < len(steps) and steps[done]["name"] in passed:
+            done += 1
+    run["states"] = ["completed"] * done + ["pending"] * (len(steps) - done)
+    run["current"] = []
+    if run.get("status") == "running" and done < len(steps):
+        steps[done]["interrupted_at"] = now
+    run["created_at"] = run.get("created_at") or run.get("updated_at") or now
+    return True
 
-    return {"run_id": run_id}
+def resume_interrupted() -> list[str]:
+    """
+    Requeue runs left `queued` or `running` by a previous server process
+    (or `pending`, as the original executor called runs it had not started).
+    Steps caught mid-flight go back to `pending` (marked `interrupted_at`);
+    completed ones are kept, so each run picks up where it stopped. A run
+    that cannot be read back into shape is marked `failed` instead.
+    """
+    interrupted = []
+    for status in ("running", "queued", "pending"):
+        interrupted += list_runs(status=status, limit=MAX_QUEUED_RUNS * 10)
+    interrupted.sort(key=lambda r: r["created_at"] or "")
+
+    resumed = []
+    for summary in interrupted:
+        run_id = summary["id"]
+        if scheduler.position(run_id) is not None:
+            continue
+        try:
+            run = load_run(run_id)
+        except (OSError, ValueError):
+            log.exception("cannot resume run %s", run_id)
+            continue
+        if "states" not in run:
+            if not _upgrade_legacy_run(run):
+                log.warning("run %s predates per-step states and cannot be rebuilt; marking it failed", run_id)
+                set_status(run_id, "failed")
+                continue
+            save_run(run_id, run)
+        for idx, state in enumerate(run["states"]):
+            if state == "running":
+                update_step(run_id, idx, "pending", interrupted_at=datetime.now().isoformat())
+        if run["status"] != "queued":
+            set_status(run_id, "queued")
+        try:
+            scheduler.submit(run_id, run.get("priority", 0))
+        except QueueFull:
+            set_status(run_id, "rejected")
+            continue
+        resumed.append(run_id)
+    return resumed
+
+def _etag(seq: int, position: int | None) -> str:
+    """
+    Run version as an ETag; queued runs also change tag when they move up
+    the queue, since that doesn't record an event.
+    """
+    return f'"{seq}"' if position is None else f'"{seq}-{position}"'
+
+def _seq_of(etag: str | None) -> int | None:
+    try:
+        return int(etag.strip().removeprefix("W/").strip('"').split("-")[0])
+    except (AttributeError, ValueError):
+        return None
+
+async def _wait_for_event(run_id: str, after: int, timeout: float) -> None:
+    """
+    Return once the run records an event newer than `after`, or on timeout.
+    """
+    queue = hub.subscribe(run_id)
+    try:
+        deadline = time.monotonic() + timeout
+        # an event may have landed between the caller's check and subscribing
+        while await run_in_threadpool(run_version, run_id) <= after:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return
+            if event["type"] == "resync" or event.get("seq", 0) > after:
+                return
+    finally:
+        hub.unsubscribe(run_id, queue)
 
 @app.get("/status/{run_id}")
-def status(run_id: str):
+async def status(
+    run_id: str,
+    request: Request,
+    fields: str | None = Query(None, description="Comma-separated keys to return, e.g. status,states,current"),
+    wait_for_change: float = Query(0, ge=0, le=MAX_LONG_POLL_SECONDS,
+                                   description="With If-None-Match: seconds to wait for the run to change"),
+):
+    """
+    Fetch the current state of a run. The response carries the run version
+    as ETag; sending it back as If-None-Match gets a 304 while nothing
+    changed (after waiting up to `wait_for_change` seconds for a change).
+    """
+    try:
+        etag = _etag(await run_in_threadpool(run_version, run_id), scheduler.position(run_id))
+    except FileNotFoundError:
+        raise HTTPException(404, "Run not found")
+
+    known = request.headers.get("if-none-match")
+    if known == etag and wait_for_change:
+        await _wait_for_event(run_id, _seq_of(known), wait_for_change)
+        etag = _etag(await run_in_threadpool(run_version, run_id), scheduler.position(run_id))
+    if known == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    wanted = None
+    if fields:
+        wanted = STATUS_BASE_FIELDS | {f.strip() for f in fields.split(",") if f.strip()}
+    # store reads block (file/SQLite I/O, per-run lock): keep them off the loop
+    run = await run_in_threadpool(load_run, run_id, wanted)
+    position = scheduler.position(run_id) if run["status"] == "queued" else None
+    if position is not None and (wanted is None or "queue_position" in wanted):
+        run["queue_position"] = position
+    return JSONResponse(run, headers={"ETag": _etag(run["seq"], position)})
+
+@app.get("/runs/{run_id}/log")
+def run_log(
+    run_id: str,
+    step: str | None = Query(None, description="Only entries of this step"),
+    offset: int = Query(0, description="First entry; negative counts from the end"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Page through a run's log without fetching the rest of the run.
+    `offset=-N` returns the last N entries.
+    """
+    try:
+        total, entries = read_log(run_id, step=step, offset=offset, limit=limit)
+    except FileNotFoundError:
+        raise HTTPException(404, "Run not found")
+    start = max(total + offset, 0) if offset < 0 else offset
+    return {"total": total, "offset": start, "entries": entries}
+
+def _sse(event: dict) -> str:
+    kind = event.get("type", "message")
+    head = f"id: {event['seq']}\n" if "seq" in event else ""
+    return f"{head}event: {kind}\ndata: {json.dumps(event)}\n\n"
+
+@app.get("/runs/{run_id}/events")
+async def run_events(run_id: str, request: Request):
     """
-    Fetch the current state of a run.
+    Server-sent events for one run: a `snapshot` with the full run, then
+    `status`, `step`, `output` and live `line` events until it finishes.
     """
+    queue = hub.subscribe(run_id)
     try:
-        return load_run(run_id)
+        run = await run_in_threadpool(load_run, run_id)
     except FileNotFoundError:
+        hub.unsubscribe(run_id, queue)
         raise HTTPException(404, "Run not found")
+
+    async def stream():
+        nonlocal run
+        try:
+            yield _sse({"type": "snapshot", "run": run})
+            while run["status"] not in FINISHED:
+                if await request.is_disconnected():
+                    return
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["type"] == "resync":
+                    run = await run_in_threadpool(load_run, run_id)
+                    yield _sse({"type": "snapshot", "run": run})
+                    continue
+                # already contained in the snapshot we sent
+                if event.get("seq", run["seq"] + 1) <= run["seq"]:
+                    continue
+                if event["type"] == "status":
+                    run["status"] = event["status"]
+                yield _sse(event)
+        finally:
+            hub.unsubscribe(run_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/runs")
+def runs(
+    name: str | None = Query(None, description="Workflow name"),
+    status: str | None = Query(None, description="Run status"),
+    since: str | None = Query(None, description="Created at or after (ISO timestamp)"),
+    until: str | None = Query(None, description="Created at or before (ISO timestamp)"),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+):
+    """
+    List run summaries, newest first.
+    """
+    return {"runs": list_runs(name=name, status=status, since=since, until=until,
+                              limit=limit, offset=offset)}
+
+@app.post("/runs/compact")
+def compact():
+    """
+    Run a retention pass now instead of waiting for the background one.
+    """
+    return compact_runs(retention)
+
+@app.get("/outbox")
+def outbox_items(
+    run_id: str | None = Query(None, description="Only messages queued by this run"),
+    status: str | None = Query(None, description="pending, delivered or failed"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Queued and past notifications, newest first.
+    """
+    return {"pending": outbox.pending(), "items": outbox.items(run_id=run_id, status=status, limit=limit)}
+
+@app.get("/tests/slowest")
+def tests_slowest(
+    days: float = Query(30, gt=0),
+    limit: int = Query(50, ge=1, le=1000),
+    project: str | None = Query(None, description="Absolute project folder"),
+    by: str = Query("spec", pattern="^(spec|test)$"),
+):
+    """
+    Specs (or tests) with the highest mean duration over the last `days`.
+    """
+    return {"items": testhistory.slowest(days=days, limit=limit, project=project, by=by)}
+
+@app.get("/tests/flaky")
+def tests_flaky(
+    days: float = Query(30, gt=0),
+    limit: int = Query(50, ge=1, le=1000),
+    project: str | None = Query(None, description="Absolute project folder"),
+):
+    """
+    Tests that flipped between passed and failed, most flips first.
+    """
+    return {"items": testhistory.flaky(days=days, limit=limit, project=project)}
+
+@app.get("/tests/history")
+def tests_history(
+    spec: str,
+    name: str | None = Query(None, description="One test of the spec (its full title)"),
+    project: str | None = Query(None),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """
+    Latest recorded results of one spec or test, newest first.
+    """
+    return {"items": testhistory.history(spec, name=name, project=project, limit=limit)}
+
+@app.post("/agents/register")
+def agent_register(
+    name: str,
+    labels: str = Query("", description="Comma-separated capability labels"),
+    slots: int = Query(1, ge=1),
+):
+    """
+    Add a worker agent (see agent.py).
+    """
+    return dispatch.register(name, [l.strip() for l in labels.split(",") if l.strip()], slots)
+
+@app.post("/agents/{agent_id}/lease")
+async def agent_lease(agent_id: str, wait: float = Query(20, ge=0, le=MAX_LONG_POLL_SECONDS)):
+    """
+    Next step this agent can run, waiting up to `wait` seconds (204 if none).
+    """
+    queue = hub.subscribe(AGENTS_CHANNEL)
+    try:
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                job = dispatch.lease(agent_id)
+            except KeyError:
+                raise HTTPException(404, "Unknown agent, register again")
+            if job is not None:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return Response(status_code=204)
+            try:
+                await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        hub.unsubscribe(AGENTS_CHANNEL, queue)
+
+@app.post("/agents/{agent_id}/jobs/{job_id}/heartbeat")
+def agent_heartbeat(agent_id: str, job_id: str, payload: dict = Body(...)):
+    """
+    Keep a lease alive and stream output lines; answers with "cancel" once
+    the step has to stop, 409 once the lease is lost.
+    """
+    try:
+        return dispatch.heartbeat(agent_id, job_id, payload.get("lease_id"), payload.get("lines", []))
+    except dispatch.LeaseLost:
+        raise HTTPException(409, "Lease lost")
+
+@app.post("/agents/{agent_id}/jobs/{job_id}/result")
+def agent_result(agent_id: str, job_id: str, payload: dict = Body(...)):
+    """
+    Report a leased step's result.
+    """
+    try:
+        dispatch.complete(agent_id, job_id, payload.get("lease_id"), payload.get("result") or {},
+                          payload.get("lines", []))
+    except dispatch.LeaseLost:
+        raise HTTPException(409, "Lease lost")
+    return {"ok": True}
+
+@app.get("/agents")
+def agent_list():
+    """
+    Registered agents and steps waiting for one.
+    """
+    return {"mode": dispatch.DISPATCH_MODE, "waiting": dispatch.waiting(), "agents": dispatch.agents()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """
+    Counters and histograms in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/scheduler")
+def scheduler_stats():
+    """
+    Number of queued and executing runs.
+    """
+    return scheduler.stats()
@@ -0,0 +1,161 @@
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import metrics
+
+# Finished runs moved out of the run store (see persistence.compact_runs):
+# append-only gzip segments plus a SQLite index of where each run is
+ARCHIVE_DIR = Path(os.getenv("ORQ_ARCHIVE", Path(__file__).parent / "runs" / "archive"))
+
+# A new segment is started once the current one reaches this size
+ARCHIVE_SEGMENT_BYTES = 64 * 1024 ** 2
+
+# Whole segments whose newest run is older than this are deleted (0: never)
+ARCHIVE_DAYS = float(os.getenv("ORQ_ARCHIVE_DAYS", 365))
+
+ARCHIVED_TOTAL = metrics.Counter("orq_archive_runs_total", "Runs moved into the archive")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archived (
+    id         TEXT PRIMARY KEY,
+    name       TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    created_at TEXT,
+    updated_at TEXT,
+    segment    INTEGER NOT NULL,
+    offset     INTEGER NOT NULL,
+    length     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS archived_name_created   ON archived (name, created_at);
+CREATE INDEX IF NOT EXISTS archived_status_created ON archived (status, created_at);
+CREATE INDEX IF NOT EXISTS archived_created        ON archived (created_at);
+CREATE INDEX IF NOT EXISTS archived_segment        ON archived (segment, updated_at);
+"""
+
+_SEGMENT_RE = re.compile(r"runs-(\d+)\.jsonl\.gz$")
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(ARCHIVE_DIR / "index.db", timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+def _segment_path(n: int) -> Path:
+    return ARCHIVE_DIR / f"runs-{n:06d}.jsonl.gz"
+
+def _segments() -> list[int]:
+    if not ARCHIVE_DIR.is_dir():
+        return []
+    return sorted(int(m.group(1)) for p in ARCHIVE_DIR.iterdir() if (m := _SEGMENT_RE.match(p.name)))
+
+def _current_segment() -> int:
+    segments = _segments()
+    n = segments[-1] if segments else 1
+    path = _segment_path(n)
+    if path.exists() and path.stat().st_size >= ARCHIVE_SEGMENT_BYTES:
+        n += 1
+    return n
+
+def put(run: dict) -> None:
+    """
+    Append a finished run to the current segment and index it. Each run is
+    its own gzip member, so a segment is one valid .jsonl.gz file and any
+    run can be read back without decompressing the others.
+    """
+    data = gzip.compress(json.dumps(run).encode() + b"\n")
+    with _write_lock:
+        ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        segment = _current_segment()
+        with open(_segment_path(segment), "ab") as f:
+            offset = f.tell()
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        conn = _conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO archived (id, name, status, created_at, updated_at, segment, offset, length) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (run["id"], run["name"], run["status"], run.get("created_at"), run.get("updated_at"),
+                 segment, offset, len(data)),
+            )
+    ARCHIVED_TOTAL.inc()
+
+def get(run_id: str) -> dict:
+    """
+    An archived run; raises FileNotFoundError if it isn't archived.
+    """
+    row = _conn().execute(
+        "SELECT segment, offset, length FROM archived WHERE id = ?", (run_id,)
+    ).fetchone()
+    if row is None:
+        raise FileNotFoundError(run_id)
+    segment, offset, length = row
+    with open(_segment_path(segment), "rb") as f:
+        f.seek(offset)
+        return json.loads(gzip.decompress(f.read(length)))
+
+def list_runs(name=None, status=None, since=None, until=None, limit=50, offset=0) -> list[dict]:
+    """
+    Archived run summaries, newest first (same filters as the run store).
+    """
+    where, params = [], []
+    for clause, value in (("name = ?", name), ("status = ?", status),
+                          ("created_at >= ?", since), ("created_at <= ?", until)):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+    sql = "SELECT id, name, status, created_at, updated_at FROM archived"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+    keys = ("id", "name", "status", "created_at", "updated_at")
+    return [dict(zip(keys, r)) for r in _conn().execute(sql, (*params, limit, offset))]
+
+def count() -> int:
+    return _conn().execute("SELECT COUNT(*) FROM archived").fetchone()[0]
+
+def expire(days: float | None = None) -> int:
+    """
+    Delete whole segments (never the one being appended to) whose newest
+    run was last updated more than `days` (default ARCHIVE_DAYS) ago;
+    returns how many went.
+    """
+    days = ARCHIVE_DAYS if days is None else days
+    if not days:
+        return 0
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+    dropped = 0
+    with _write_lock:
+        current = _current_segment()
+        conn = _conn()
+        for segment in _segments():
+            if segment >= current:
+                continue
+            (newest,) = conn.execute(
+                "SELECT MAX(updated_at) FROM archived WHERE segment = ?", (segment,)
+            ).fetchone()
+            if newest is not None and newest >= cutoff:
+                continue
+            with conn:
+                conn.execute("DELETE FROM archived WHERE segment = ?", (segment,))
+            _segment_path(segment).unlink(missing_ok=True)
+            dropped += 1
+    return dropped
+
+metrics.Gauge("orq_archive_runs", "Runs kept in the archive", count)
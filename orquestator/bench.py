@@ -0,0 +1,365 @@
+"""
+Offline benchmark suite for the orchestrator and the Kerberos proxy.
+
+    python bench.py [--runs 50] [--pollers 8] [--store json|sqlite|both]
+                    [--sizes 10,100,1000] [--no-proxy] [--out report.json]
+                    [--compare previous.json]
+
+Sections (each one only needs this checkout, no network):
+  - load: --runs synthetic workflows started concurrently through the API
+    (in-process, via TestClient) while --pollers threads hammer /status.
+    Steps use fake runners registered for the bench only: `fake_sleep`,
+    `fake_cpu` (hashing loop) and `fake_output` (a child process printing
+    lines, so spooling and live output are exercised too).
+  - persistence: save_run / append_event / load_run timings for each run
+    store at several run sizes (steps with log entries and output tails).
+  - proxy: kerberos_proxy/bench.py throughput and set-up latency against
+    its local echo upstream.
+
+Run state, spooled output and the step cache go to a temporary directory.
+The report is JSON; --compare prints the relative change of every number
+against an earlier report.
+"""
+
+import argparse
+import hashlib
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+HERE = Path(__file__).parent
+PROXY_BENCH = HERE.parent / "kerberos_proxy" / "bench.py"
+
+
+def _quantiles(samples: list, scale: float = 1000.0) -> dict:
+    """
+    p50/p95/max/mean of `samples` (seconds), in milliseconds by default.
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+    return {
+        "n":    len(ordered),
+        "p50":  round(pick(0.50) * scale, 3),
+        "p95":  round(pick(0.95) * scale, 3),
+        "max":  round(ordered[-1] * scale, 3),
+        "mean": round(sum(ordered) / len(ordered) * scale, 3),
+    }
+
+
+# ------------------------------------------------------------- fake runners
+
+class _FakeSleep:
+    SCHEMA = {"seconds": ((int, float), False)}
+
+    @staticmethod
+    def execute(step, ctx=None):
+        time.sleep(step.get("seconds", 0.05))
+        return {"code": 0}
+
+class _FakeCpu:
+    SCHEMA = {"rounds": (int, False)}
+
+    @staticmethod
+    def execute(step, ctx=None):
+        digest = b""
+        for _ in range(step.get("rounds", 20_000)):
+            digest = hashlib.sha256(digest).digest()
+        return {"code": 0, "out": digest.hex()}
+
+class _FakeOutput:
+    SCHEMA = {"lines": (int, False), "width": (int, False)}
+
+    @staticmethod
+    def execute(step, ctx=None):
+        from integrations.process import run_process
+        script = f"import sys\nfor i in range({step.get('lines', 2000)}): print(i, 'x' * {step.get('width', 80)})"
+        return run_process([sys.executable, "-c", script], ctx=ctx)
+
+FAKE_RUNNERS = {"fake_sleep": _FakeSleep, "fake_cpu": _FakeCpu, "fake_output": _FakeOutput}
+
+# prepare -> (hash, print) in parallel -> finish
+SYNTHETIC_WORKFLOW = {
+    "max_parallel": 2,
+    "steps": [
+        {"name": "prepare", "type": "fake_sleep", "seconds": 0.05},
+        {"name": "hash",    "type": "fake_cpu", "rounds": 20_000, "depends_on": ["prepare"]},
+        {"name": "print",   "type": "fake_output", "lines": 2000, "depends_on": ["prepare"]},
+        {"name": "finish",  "type": "fake_sleep", "seconds": 0.02, "depends_on": ["hash", "print"]},
+    ],
+}
+
+
+def _isolate(workdir: Path) -> None:
+    """
+    Point every on-disk location the app uses at `workdir` and register the
+    fake runners. Must run before any run is started.
+    """
+    sys.path.insert(0, str(HERE))
+    import app
+    import archive
+    import compiler
+    import outbox
+    import persistence
+    import stepcache
+    import testhistory
+
+    persistence._STATE_DIR = workdir / "runs"
+    persistence._STATE_DIR.mkdir(parents=True, exist_ok=True)
+    archive.ARCHIVE_DIR = workdir / "runs" / "archive"
+    outbox.OUTBOX_DB = workdir / "runs" / "outbox.db"
+    testhistory.TEST_HISTORY_DB = workdir / "runs" / "test-history.db"
+    app.SPOOL_DIR = workdir / "runs" / "spool"
+    app.WORKFLOWS = workdir / "workflows"
+    app.WORKFLOWS.mkdir(exist_ok=True)
+    stepcache.STEP_CACHE_DIR = workdir / "step-cache"
+    (app.WORKFLOWS / "bench.json").write_text(json.dumps(SYNTHETIC_WORKFLOW))
+
+    compiler.load_runners()
+    compiler._runners.update(FAKE_RUNNERS)
+
+def _use_store(kind: str) -> None:
+    import persistence
+    persistence.RUN_STORE = kind
+    persistence._store = persistence._make_store(kind)
+
+
+# --------------------------------------------------------------------- load
+
+def bench_load(runs: int, pollers: int) -> dict:
+    """
+    Start `runs` workflows at once and poll /status from `pollers` threads
+    until every run has finished.
+    """
+    from fastapi.testclient import TestClient
+    import app
+    from persistence import FINISHED
+
+    with TestClient(app.app) as client:
+        start_latency, status_latency = [], []
+        lock = threading.Lock()
+
+        def start(_):
+            started = time.perf_counter()
+            response = client.post("/start", params={"name": "bench"})
+            elapsed = time.perf_counter() - started
+            with lock:
+                start_latency.append(elapsed)
+            return response.json().get("run_id") if response.status_code == 200 else None
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(runs, 32)) as pool:
+            run_ids = list(pool.map(start, range(runs)))
+        rejected = run_ids.count(None)
+        run_ids = [r for r in run_ids if r]
+
+        pending = set(run_ids)
+        finished = {}
+
+        def poll(worker: int):
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    run_id = sorted(pending)[worker % len(pending)]
+                started = time.perf_counter()
+                run = client.get(f"/status/{run_id}").json()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    status_latency.append(elapsed)
+                    if run["status"] in FINISHED and run_id in pending:
+                        pending.discard(run_id)
+                        finished[run_id] = run
+
+        with ThreadPoolExecutor(max_workers=pollers) as pool:
+            list(pool.map(poll, range(pollers)))
+        wall = time.perf_counter() - began
+
+    traces = [run.get("trace") or {} for run in finished.values()]
+    queued = [c["seconds"] for t in traces for c in t.get("children", []) if c["name"] == "queued"]
+    steps = [c["seconds"] for t in traces for c in t.get("children", []) if c["name"] != "queued"]
+    return {
+        "runs":           runs,
+        "rejected":       rejected,
+        "failed":         sum(r["status"] != "completed" for r in finished.values()),
+        "wall_seconds":   round(wall, 3),
+        "runs_per_sec":   round(len(finished) / wall, 2),
+        "start_ms":       _quantiles(start_latency),
+        "status_ms":      _quantiles(status_latency),
+        "queue_wait_ms":  _quantiles(queued),
+        "run_ms":         _quantiles([t["seconds"] for t in traces if "seconds" in t]),
+        "step_ms":        _quantiles(steps),
+    }
+
+
+# -------------------------------------------------------------- persistence
+
+def _synthetic_run(steps: int) -> dict:
+    return {
+        "id": "", "name": "bench", "status": "queued", "log": [], "current": [],
+        "created_at": datetime.now().isoformat(),
+        "steps": [{"name": f"step-{i}", "type": "fake_sleep"} for i in range(steps)],
+        "states": ["pending"] * steps,
+    }
+
+def bench_persistence(kind: str, sizes: list, workdir: Path) -> dict:
+    """
+    Per-call timings for one store writing and reading runs of each size.
+    Every step gets a running and a completed event plus one output chunk.
+    """
+    import persistence
+
+    report = {}
+    for size in sizes:
+        directory = workdir / f"{kind}-{size}"
+        directory.mkdir(parents=True)
+        store = (persistence.JsonFileStore(directory) if kind == "json"
+                 else persistence.SqliteStore(directory / "runs.db"))
+        run_id = f"bench-{size}"
+        run = {**_synthetic_run(size), "id": run_id}
+        chunk = "line of step output\n" * 50
+
+        started = time.perf_counter()
+        store.save_run(run_id, run)
+        save = time.perf_counter() - started
+
+        events = []
+        began = time.perf_counter()
+        for idx in range(size):
+            for event in (
+                {"type": "step", "idx": idx, "state": "running", "fields": {}},
+                {"type": "output", "idx": idx, "stream": "out", "data": chunk},
+                {"type": "step", "idx": idx, "state": "completed", "fields": {},
+                 "log": {"step": f"step-{idx}", "result": {"code": 0, "out": chunk}}},
+            ):
+                t = time.perf_counter()
+                store.append_event(run_id, event)
+                events.append(time.perf_counter() - t)
+        total = time.perf_counter() - began
+
+        loads = []
+        for _ in range(20):
+            t = time.perf_counter()
+            store.load_run(run_id)
+            loads.append(time.perf_counter() - t)
+
+        report[str(size)] = {
+            "save_ms":       round(save * 1000, 3),
+            "event_ms":      _quantiles(events),
+            "events_per_sec": round(len(events) / total, 1),
+            "load_ms":       _quantiles(loads),
+        }
+    return report
+
+
+# -------------------------------------------------------------------- proxy
+
+def bench_proxy(tunnels: int, mib: int, requests: int) -> dict:
+    """
+    kerberos_proxy/bench.py in a subprocess (it spawns its own servers).
+    """
+    def run(*args):
+        out = subprocess.run(
+            [sys.executable, str(PROXY_BENCH), *args],
+            cwd=PROXY_BENCH.parent, capture_output=True, text=True, timeout=600,
+        )
+        if out.returncode != 0:
+            raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "proxy bench failed")
+        return [json.loads(line) for line in out.stdout.splitlines() if line.startswith("{")]
+
+    throughput = run("--tunnels", str(tunnels), "--mib", str(mib))
+    latency = run("--latency", "--requests", str(requests))
+    return {
+        "throughput": {r["relay"]: r for r in throughput},
+        "latency": {f"pool_{r['upstream_pool']}": r for r in latency},
+    }
+
+
+# ------------------------------------------------------------------- report
+
+def _flatten(node, prefix="") -> dict:
+    if isinstance(node, dict):
+        flat = {}
+        for key, value in node.items():
+            flat.update(_flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+        return flat
+    if isinstance(node, (int, float)) and not isinstance(node, bool):
+        return {prefix: node}
+    return {}
+
+def compare(old: dict, new: dict) -> list[str]:
+    """
+    One line per number present in both reports: old -> new (change %).
+    """
+    before, after = _flatten(old.get("results", {})), _flatten(new.get("results", {}))
+    lines = []
+    for key in sorted(before.keys() & after.keys()):
+        a, b = before[key], after[key]
+        change = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+        lines.append(f"{key:60} {a:>12} -> {b:<12} {change}")
+    return lines
+
+def _revision() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=50, help="concurrent workflow runs")
+    parser.add_argument("--pollers", type=int, default=8, help="threads polling /status")
+    parser.add_argument("--store", choices=["json", "sqlite", "both"], default="both")
+    parser.add_argument("--sizes", default="10,100,1000", help="steps per run for persistence")
+    parser.add_argument("--no-proxy", action="store_true", help="skip the proxy section")
+    parser.add_argument("--tunnels", type=int, default=16)
+    parser.add_argument("--mib", type=int, default=16, help="MiB sent per tunnel")
+    parser.add_argument("--requests", type=int, default=200, help="proxy latency samples")
+    parser.add_argument("--out", help="report path (default: bench-<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier report to diff against")
+    args = parser.parse_args()
+
+    stores = ["json", "sqlite"] if args.store == "both" else [args.store]
+    sizes = [int(s) for s in args.sizes.split(",")]
+    results = {"load": {}, "persistence": {}}
+
+    with tempfile.TemporaryDirectory(prefix="orq-bench-") as tmp:
+        workdir = Path(tmp)
+        _isolate(workdir)
+        for kind in stores:
+            print(f"[+] load: {args.runs} runs on the {kind} store")
+            _use_store(kind)
+            results["load"][kind] = bench_load(args.runs, args.pollers)
+            print(f"[+] persistence: {kind} store, sizes {sizes}")
+            results["persistence"][kind] = bench_persistence(kind, sizes, workdir / "persistence")
+
+    if not args.no_proxy:
+        print(f"[+] proxy: {args.tunnels} tunnels x {args.mib} MiB, {args.requests} set-ups")
+        results["proxy"] = bench_proxy(args.tunnels, args.mib, args.requests)
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "revision":   _revision(),
+        "python":     platform.python_version(),
+        "platform":   platform.platform(),
+        "args":       vars(args),
+        "results":    results,
+    }
+    out = Path(args.out or f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    out.write_text(json.dumps(report, indent=2))
+    print(f"[+] report written to {out}")
+
+    if args.compare:
+        for line in compare(json.loads(Path(args.compare).read_text()), report):
+            print(line)
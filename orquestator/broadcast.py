@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+# Events buffered per subscriber before it is told to resync
+SUBSCRIBER_BUFFER = 1000
+
+
+class Broadcaster:
+    """
+    Fans run events out to live subscribers (the /runs/{id}/events stream).
+
+    Publishers are worker threads; every subscriber is an asyncio.Queue
+    living on the server's event loop, fed with call_soon_threadsafe. A
+    subscriber that falls SUBSCRIBER_BUFFER events behind has its backlog
+    dropped and gets a single {"type": "resync"} instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: dict[str, set] = {}
+
+    def subscribe(self, run_id: str) -> asyncio.Queue:
+        """
+        Must be called from the event loop that will consume the queue.
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subs.setdefault(run_id, set()).add((loop, queue))
+        return queue
+
+    def unsubscribe(self, run_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subs = self._subs.get(run_id, set())
+            subs -= {s for s in subs if s[1] is queue}
+            if not subs:
+                self._subs.pop(run_id, None)
+
+    def publish(self, run_id: str, event: dict) -> None:
+        with self._lock:
+            subs = list(self._subs.get(run_id, ()))
+        for loop, queue in subs:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                pass  # loop already closed (server shutting down)
+
+
+def _offer(queue: asyncio.Queue, event: dict) -> None:
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait({"type": "resync"})
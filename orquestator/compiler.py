@@ -0,0 +1,206 @@
+import hashlib
+import json
+import threading
+from importlib import import_module
+from pathlib import Path
+
+import matrix
+
+# Folder holding the <type>_runner.py plugins
+INTEGRATIONS = Path(__file__).parent / "integrations"
+
+# Keys every step may carry regardless of its runner: name -> (types, required)
+COMMON_KEYS = {
+    "name":       (str, True),
+    "type":       (str, True),
+    "depends_on": (list, False),
+    "stage":      ((int, float), False),
+    "cache":      ((bool, dict), False),
+    "timeout_seconds": ((int, float), False),
+    "matrix":          ((list, dict), False),
+    "matrix_parallel": (int, False),
+    "fail_fast":       (bool, False),
+    "requires":        (list, False),
+}
+
+
+class WorkflowError(ValueError):
+    """
+    A workflow definition that cannot run; `problems` lists every issue found.
+    """
+
+    def __init__(self, problems: list[str]):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+# ----------------------------------------------------------------- registry
+
+_runners: dict = {}
+_runners_lock = threading.Lock()
+
+def load_runners() -> dict:
+    """
+    Import every integrations/*_runner.py once and index it by step type.
+    """
+    with _runners_lock:
+        if not _runners:
+            for path in sorted(INTEGRATIONS.glob("*_runner.py")):
+                kind = path.stem[: -len("_runner")]
+                _runners[kind] = import_module(f"integrations.{path.stem}")
+    return _runners
+
+def get_runner(kind: str):
+    runners = load_runners()
+    if kind not in runners:
+        raise KeyError(f"No runner for step type '{kind}'")
+    return runners[kind]
+
+
+# ---------------------------------------------------------------- compiling
+
+def _type_name(types) -> str:
+    if isinstance(types, tuple):
+        return " or ".join(t.__name__ for t in types)
+    return types.__name__
+
+def validate_step(step, where: str) -> list[str]:
+    """
+    Check one step against the common keys and its runner's SCHEMA.
+    """
+    if not isinstance(step, dict):
+        return [f"{where}: must be an object"]
+    problems = []
+    runners = load_runners()
+    kind = step.get("type")
+    runner = runners.get(kind) if isinstance(kind, str) else None
+    if isinstance(kind, str) and runner is None:
+        problems.append(f"{where}: unknown type '{kind}' (known: {', '.join(sorted(runners))})")
+
+    schema = {**COMMON_KEYS, **getattr(runner, "SCHEMA", {})}
+    for key, (types, required) in schema.items():
+        if key not in step:
+            if required:
+                problems.append(f"{where}: missing '{key}'")
+        elif not isinstance(step[key], types) and not ("matrix" in step and matrix.is_placeholder(step[key])):
+            problems.append(f"{where}: '{key}' must be {_type_name(types)}")
+    if runner is not None and hasattr(runner, "SCHEMA"):
+        for key in step:
+            if key not in schema:
+                problems.append(f"{where}: unknown key '{key}' for {kind} steps")
+    if isinstance(step.get("matrix"), (list, dict)) and isinstance(step.get("matrix_parallel", 1), int):
+        problems += matrix.validate(step, where)
+    return problems
+
+def resolve_dependencies(steps: list) -> list:
+    """
+    Return, for each step, the set of step indexes it waits for.
+
+    Steps may declare `depends_on` (list of step names) and/or `stage`
+    (a number; every step of a lower stage must finish first). A workflow
+    using neither keeps the classic behaviour: each step waits for the
+    previous one.
+    """
+    if not any("depends_on" in s or "stage" in s for s in steps):
+        return [set() if i == 0 else {i - 1} for i in range(len(steps))]
+
+    index = {}
+    for i, step in enumerate(steps):
+        if step["name"] in index:
+            raise ValueError(f"Duplicate step name '{step['name']}'")
+        index[step["name"]] = i
+
+    deps = []
+    for i, step in enumerate(steps):
+        wanted = set()
+        for name in step.get("depends_on", []):
+            if name not in index:
+                raise ValueError(f"Step '{step['name']}' depends on unknown step '{name}'")
+            wanted.add(index[name])
+        if "stage" in step:
+            wanted |= {j for j, other in enumerate(steps)
+                       if "stage" in other and other["stage"] < step["stage"]}
+        if i in wanted:
+            raise ValueError(f"Step '{step['name']}' depends on itself")
+        deps.append(wanted)
+
+    # reject cycles up front instead of deadlocking mid-run
+    done, remaining = set(), set(range(len(steps)))
+    while remaining:
+        ready = {i for i in remaining if deps[i] <= done}
+        if not ready:
+            names = ", ".join(steps[i]["name"] for i in sorted(remaining))
+            raise ValueError(f"Dependency cycle between steps: {names}")
+        done |= ready
+        remaining -= ready
+    return deps
+
+def compile_workflow(wf, source: str = "workflow") -> dict:
+    """
+    Validate a parsed workflow and return it with its dependency graph.
+    Raises WorkflowError listing every problem found.
+    """
+    if not isinstance(wf, dict) or not isinstance(wf.get("steps"), list) or not wf["steps"]:
+        raise WorkflowError([f"{source}: needs a non-empty 'steps' list"])
+    problems = []
+    if "max_parallel" in wf and (not isinstance(wf["max_parallel"], int) or wf["max_parallel"] < 1):
+        problems.append(f"{source}: 'max_parallel' must be a positive integer")
+    timeout = wf.get("timeout_seconds")
+    if "timeout_seconds" in wf and (not isinstance(timeout, (int, float)) or timeout <= 0):
+        problems.append(f"{source}: 'timeout_seconds' must be a positive number")
+    if "retention" in wf:
+        keep = wf["retention"]
+        if not isinstance(keep, dict) or set(keep) - {"days", "runs"} or not all(
+            isinstance(v, (int, float)) and v >= 0 for v in keep.values()
+        ):
+            problems.append(f"{source}: 'retention' must be {{\"days\": n, \"runs\": n}} (non-negative numbers)")
+
+    names = set()
+    for i, step in enumerate(wf["steps"]):
+        where = f"{source} step {i + 1}"
+        if isinstance(step, dict) and isinstance(step.get("name"), str):
+            where = f"{source} step '{step['name']}'"
+            if step["name"] in names:
+                problems.append(f"{where}: duplicate step name")
+            names.add(step["name"])
+        problems += validate_step(step, where)
+    if problems:
+        raise WorkflowError(problems)
+
+    try:
+        deps = resolve_dependencies(wf["steps"])
+    except ValueError as e:
+        raise WorkflowError([f"{source}: {e}"])
+    return {**wf, "deps": deps}
+
+
+# -------------------------------------------------------------------- cache
+
+_compiled: dict[Path, dict] = {}
+_compiled_lock = threading.Lock()
+
+def load_compiled(path: Path) -> dict:
+    """
+    Compiled workflow for a JSON file, recompiled only when the file changes
+    (same mtime+size is trusted; otherwise the content hash decides).
+    """
+    stat = path.stat()  # FileNotFoundError for unknown workflows
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _compiled_lock:
+        entry = _compiled.get(path)
+        if entry and entry["stamp"] == stamp:
+            return entry["workflow"]
+
+    raw = path.read_bytes()
+    digest = hashlib.sha256(raw).hexdigest()
+    if entry and entry["hash"] == digest:
+        workflow = entry["workflow"]
+    else:
+        try:
+            parsed = json.loads(raw)
+        except ValueError as e:
+            raise WorkflowError([f"{path.name}: invalid JSON ({e})"])
+        workflow = compile_workflow(parsed, path.stem)
+    with _compiled_lock:
+        _compiled[path] = {"stamp": stamp, "hash": digest, "workflow": workflow}
+    return workflow
@@ -0,0 +1,285 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import metrics
+import outbox
+import testhistory
+from compiler import get_runner
+
+# Where steps execute: "local" (in this process), "agents" (always on a
+# worker agent, see agent.py) or "auto" (on an agent when a live one has
+# every label the step "requires", else locally)
+DISPATCH_MODE = os.getenv("ORQ_DISPATCH", "local")
+
+# A leased step must be heartbeated within this many seconds, otherwise it
+# is handed to another agent
+LEASE_SECONDS = 30.0
+
+# Times a step may lose its lease before it fails
+MAX_LEASES = 3
+
+# Agents not heard from for this long are not counted for "auto" routing
+AGENT_TIMEOUT_SECONDS = 60.0
+
+# How long a step waits for an agent with the labels it requires
+DISPATCH_WAIT_SECONDS = 600.0
+
+JOBS_TOTAL = metrics.Counter("orq_dispatch_jobs_total", "Steps run on agents, by outcome", ("result",))
+LEASES_EXPIRED = metrics.Counter("orq_dispatch_leases_expired_total", "Leases that ran out without a heartbeat")
+
+
+class LeaseLost(Exception):
+    """
+    The job is gone or was handed to another agent; the caller must stop.
+    """
+
+
+class _Job:
+    def __init__(self, step: dict, ctx, hints: dict):
+        self.id = uuid.uuid4().hex
+        self.step = step
+        self.hints = hints
+        self.requires = set(step.get("requires", []))
+        self.ctx = ctx
+        self.lease = None
+        self.agent = None
+        self.expires = 0.0
+        self.leases = 0
+        self.waiting_since = time.monotonic()
+        self.cancel = None
+        self.cancelled_at = 0.0
+        self.result = None
+        self.done = threading.Event()
+
+
+_lock = threading.Lock()
+_jobs: dict[str, _Job] = {}
+_agents: dict[str, dict] = {}
+_listeners = []
+
+
+def add_listener(fn) -> None:
+    """
+    `fn()` is called whenever a step becomes available for leasing.
+    """
+    _listeners.append(fn)
+
+def _notify() -> None:
+    for fn in _listeners:
+        fn()
+
+def _live(agent: dict, now: float) -> bool:
+    return now - agent["last_seen"] < AGENT_TIMEOUT_SECONDS
+
+def register(name: str, labels: list, slots: int) -> dict:
+    """
+    Add an agent; returns its id and the lease terms it must keep.
+    """
+    agent_id = uuid.uuid4().hex[:12]
+    with _lock:
+        _agents[agent_id] = {
+            "id":            agent_id,
+            "name":          name,
+            "labels":        sorted(set(labels)),
+            "slots":         slots,
+            "registered_at": datetime.now().isoformat(),
+            "last_seen":     time.monotonic(),
+            "running":       set(),
+        }
+    return {"agent_id": agent_id, "lease_seconds": LEASE_SECONDS}
+
+def agents() -> list[dict]:
+    now = time.monotonic()
+    with _lock:
+        return [{
+            **{k: v for k, v in a.items() if k not in ("last_seen", "running")},
+            "live":           _live(a, now),
+            "last_seen_secs": round(now - a["last_seen"], 1),
+            "running":        len(a["running"]),
+        } for a in _agents.values()]
+
+def waiting() -> int:
+    with _lock:
+        return sum(1 for j in _jobs.values() if j.lease is None)
+
+def remote(step: dict) -> bool:
+    """
+    Whether `step` should be handed to an agent under DISPATCH_MODE.
+    """
+    if DISPATCH_MODE == "agents":
+        return True
+    if DISPATCH_MODE != "auto":
+        return False
+    needs = set(step.get("requires", []))
+    now = time.monotonic()
+    with _lock:
+        return any(_live(a, now) and needs <= set(a["labels"]) for a in _agents.values())
+
+def _release(job: _Job) -> None:
+    agent = _agents.get(job.agent)
+    if agent is not None:
+        agent["running"].discard(job.id)
+    job.lease = job.agent = None
+
+def _settle(result: dict, step: dict, ctx) -> dict:
+    """
+    Do what the agent left to the orchestrator: queue its outbox item and
+    record its parsed test reports, here where the run and /tests are.
+    """
+    queued = result.pop("enqueue", None)
+    if queued is not None:
+        item_id = outbox.enqueue(
+            queued["kind"], queued["target"], queued["payload"],
+            run_id=getattr(ctx, "run_id", None), idx=getattr(ctx, "idx", None),
+        )
+        result.update(out=f"Queued (outbox #{item_id})", outbox_id=item_id)
+    tests = result.get("tests")
+    if isinstance(tests, dict) and "reports" in tests:
+        tests = testhistory.keep(tests["project"], tests["reports"], step, ctx)
+        if tests:
+            result["tests"] = tests
+        else:
+            result.pop("tests")
+    return result
+
+def run_remote(step: dict, ctx=None) -> dict:
+    """
+    Offer the step to agents and block until one reports its result. A
+    lease that is not heartbeated in time goes back up for grabs; a cancel
+    or timeout of the step is passed to the agent on its next heartbeat.
+    """
+    hints = getattr(get_runner(step["type"]), "remote_hints", None)
+    job = _Job(step, ctx, hints(step) if hints else {})
+    with _lock:
+        _jobs[job.id] = job
+    _notify()
+    try:
+        while not job.done.wait(0.5):
+            now = time.monotonic()
+            reason = ctx.stop_reason() if ctx is not None else None
+            requeued = False
+            with _lock:
+                if job.done.is_set():
+                    break
+                if job.lease is None:
+                    if reason:
+                        return {"code": 1, "killed": reason}
+                    if now - job.waiting_since > DISPATCH_WAIT_SECONDS:
+                        JOBS_TOTAL.inc(result="unassigned")
+                        labels = ", ".join(sorted(job.requires)) or "none"
+                        return {"code": 1, "error": f"No agent took the step (labels required: {labels})"}
+                    continue
+                if reason and job.cancel is None:
+                    job.cancel, job.cancelled_at = reason, now
+                if job.cancel and now - job.cancelled_at > LEASE_SECONDS:
+                    _release(job)
+                    return {"code": 1, "killed": job.cancel}
+                if now > job.expires:
+                    LEASES_EXPIRED.inc()
+                    agent = _agents.get(job.agent, {}).get("name")
+                    _release(job)
+                    if job.leases >= MAX_LEASES:
+                        JOBS_TOTAL.inc(result="lost")
+                        return {"code": 1, "error": f"Lease lost {job.leases} times (last agent: {agent})"}
+                    job.waiting_since = now
+                    requeued = True
+            # agents subscribe before asking for work, so waking them when
+            # the step is offered (above) or offered again is enough
+            if requeued:
+                _notify()
+        return _settle(job.result, step, ctx)
+    finally:
+        with _lock:
+            _jobs.pop(job.id, None)
+            if job.lease is not None:
+                _release(job)
+
+def lease(agent_id: str) -> dict | None:
+    """
+    Hand the agent the oldest waiting step it has the labels for, or None.
+    Raises KeyError for an unknown agent (it should register again).
+    """
+    now = time.monotonic()
+    with _lock:
+        agent = _agents[agent_id]
+        agent["last_seen"] = now
+        labels = set(agent["labels"])
+        for job in _jobs.values():
+            if job.lease is not None or job.done.is_set() or not job.requires <= labels:
+                continue
+            ctx = job.ctx
+            if ctx is not None and ctx.stop_reason():
+                continue
+            job.lease, job.agent = uuid.uuid4().hex, agent_id
+            job.expires = now + LEASE_SECONDS
+            job.leases += 1
+            agent["running"].add(job.id)
+            timeout = None
+            if ctx is not None and ctx.deadline is not None:
+                timeout = max(ctx.deadline - now, 0.0)
+            return {
+                "job_id":          job.id,
+                "lease_id":        job.lease,
+                "step":            job.step,
+                "hints":           job.hints,
+                "run_id":          getattr(ctx, "run_id", None),
+                "idx":             getattr(ctx, "idx", None),
+                "timeout_seconds": timeout,
+                "lease_seconds":   LEASE_SECONDS,
+            }
+    return None
+
+def _held(agent_id: str, job_id: str, lease_id: str) -> _Job:
+    agent = _agents.get(agent_id)
+    if agent is not None:
+        agent["last_seen"] = time.monotonic()
+    job = _jobs.get(job_id)
+    if job is None or job.lease != lease_id or job.agent != agent_id:
+        raise LeaseLost(job_id)
+    return job
+
+def _forward(job: _Job, lines: list) -> None:
+    if job.ctx is None:
+        return
+    for stream, line in lines:
+        job.ctx.emit(stream, line)
+
+def heartbeat(agent_id: str, job_id: str, lease_id: str, lines: list) -> dict:
+    """
+    Extend the lease and pass on output lines ([stream, line] pairs). The
+    reply carries "cancel" once the step has to stop.
+    """
+    with _lock:
+        job = _held(agent_id, job_id, lease_id)
+        job.expires = time.monotonic() + LEASE_SECONDS
+        cancel = job.cancel
+    _forward(job, lines)
+    return {"cancel": cancel}
+
+def complete(agent_id: str, job_id: str, lease_id: str, result: dict, lines: list) -> None:
+    """
+    Record the step's result (plus any output lines not yet sent).
+    """
+    with _lock:
+        job = _held(agent_id, job_id, lease_id)
+        agent = _agents[agent_id]
+        agent["running"].discard(job.id)
+    _forward(job, lines)
+    result = {**result, "agent": agent["name"]}
+    if "killed" in result:
+        outcome = "killed"
+    else:
+        outcome = "completed" if result.get("code", 1) == 0 else "failed"
+    JOBS_TOTAL.inc(result=outcome)
+    with _lock:
+        job.result = result
+        job.done.set()
+
+metrics.Gauge("orq_dispatch_waiting", "Steps waiting for an agent", waiting)
+metrics.Gauge(
+    "orq_dispatch_agents_live", "Agents heard from within AGENT_TIMEOUT_SECONDS",
+    lambda: sum(1 for a in agents() if a["live"]),
+)
@@ -1,10 +1,20 @@
-import { Injectable } from '@angular/core';
+import { Injectable, NgZone } from '@angular/core';
 import axios from 'axios';
+import { Observable } from 'rxjs';
+
+export interface RunEvent {
+  type: string;
+  data: any;
+}
+
+const EVENT_TYPES = ['snapshot', 'status', 'step', 'output', 'line'];
 
 @Injectable({ providedIn: 'root' })
 export class OrchestratorService {
   private base = 'http://localhost:8000';
 
+  constructor(private zone: NgZone) {}
+
   async start(name: string): Promise<string> {
     const res = await axios.post<{ run_id: string }>(
       `${this.base}/start?name=${name}`
@@ -16,4 +26,30 @@ export class OrchestratorService {
     const res = await axios.get<any>(`${this.base}/status/${runId}`);
     return res.data;
   }
+
+  /** Server-sent events of a run; completes once the run has finished. */
+  events(runId: string): Observable<RunEvent> {
+    return new Observable<RunEvent>((observer) => {
+      if (typeof EventSource === 'undefined') {
+        observer.complete(); // server-side rendering
+        return;
+      }
+      const source = new EventSource(`${this.base}/runs/${runId}/events`);
+      for (const type of EVENT_TYPES) {
+        source.addEventListener(type, (e) =>
+          this.zone.run(() =>
+            observer.next({ type, data: JSON.parse((e as MessageEvent).data) })
+          )
+        );
+      }
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          this.zone.run(() =>
+            observer.error(new Error('Lost connection to the orchestrator'))
+          );
+        }
+      };
+      return () => source.close();
+    });
+  }
 }
@@ -11,9 +11,11 @@ import { MatCardModule } from '@angular/material/card';
 import { MatChipsModule } from '@angular/material/chips'; // ← Aquí
 import { MatIconModule } from '@angular/material/icon';
 import { MatProgressBarModule } from '@angular/material/progress-bar';
-import { OrchestratorService } from '../orchestrator.service';
-import { interval, Subscription } from 'rxjs';
-import { switchMap } from 'rxjs/operators';
+import { OrchestratorService, RunEvent } from '../orchestrator.service';
+import { Subscription } from 'rxjs';
+
+const FINISHED = ['completed', 'failed', 'rejected', 'cancelled'];
+const MAX_LIVE_LINES = 500;
 
 @Component({
   selector: 'app-workflow-status',
@@ -32,47 +34,60 @@ export class WorkflowStatusComponent implements OnInit, OnDestroy {
   @Input() runId!: string;
   @Output() reset = new EventEmitter<void>();
   run!: any;
+  lines: { step: string; data: string }[] = [];
   error = '';
   private sub!: Subscription;
 
   constructor(private svc: OrchestratorService) {}
 
   ngOnInit() {
-    this.sub = interval(2000)
-      .pipe(switchMap(() => this.fetchStatus()))
-      .subscribe({
-        next: () => {},
-        error: (err) => {
-          this.error = err.message;
-          this.sub.unsubscribe();
-        },
-      });
-    this.fetchStatus();
+    this.sub = this.svc.events(this.runId).subscribe({
+      next: (ev) => this.onEvent(ev),
+      error: (err) => (this.error = err.message),
+    });
   }
 
   ngOnDestroy() {
     this.sub.unsubscribe();
   }
 
-  private async fetchStatus() {
-    const data = await this.svc.status(this.runId);
-    data.steps = data.steps.map((step: any) => {
-      const start = step.started_at
-        ? new Date(step.started_at).toLocaleTimeString()
-        : '';
-      const end = step.ended_at
-        ? new Date(step.ended_at).toLocaleTimeString()
-        : '';
-      const duration =
-        step.started_at && step.ended_at
-          ? `${(
-              (new Date(step.ended_at).getTime() -
-                new Date(step.started_at).getTime()) /
-              1000
-            ).toFixed(1)}s`
-          : '';
-      return { ...step, startTime: start, endTime: end, duration };
-    });
-    this.run = data;
+  private onEvent({ type, data }: RunEvent) {
+    if (type === 'snapshot') {
+      this.run = { ...data.run, steps: data.run.steps.map(withTimes) };
+    } else if (type === 'status') {
+      this.run = { ...this.run, status: data.status };
+    } else if (type === 'step') {
+      const steps = this.run.steps.slice();
+      steps[data.idx] = withTimes({ ...steps[data.idx], ...data.fields });
+      const states = this.run.states.slice();
+      states[data.idx] = data.state;
+      const log = data.log ? [...this.run.log, data.log] : this.run.log;
+      this.run = { ...this.run, steps, states, log };
+    } else if (type === 'line') {
+      const step = this.run?.steps[data.idx]?.name ?? '';
+      this.lines = [
+        ...this.lines.slice(1 - MAX_LIVE_LINES),
+        { step, data: data.data },
+      ];
+    }
+    if (FINISHED.includes(this.run?.status)) {
+      this.sub?.unsubscribe();
+    }
   }
 }
+
+function withTimes(step: any) {
+  const start = step.started_at
+    ? new Date(step.started_at).toLocaleTimeString()
+    : '';
+  const end = step.ended_at ? new Date(step.ended_at).toLocaleTimeString() : '';
+  const duration =
+    step.started_at && step.ended_at
+      ? `${(
+          (new Date(step.ended_at).getTime() -
+            new Date(step.started_at).getTime()) /
+          1000
+        ).toFixed(1)}s`
+      : '';
+  return { ...step, startTime: start, endTime: end, duration };
+}
@@ -1,25 +1,52 @@
 import { useEffect, useState } from "react";
-import axios from "axios";
 import { CheckCircle, Loader, XCircle } from "lucide-react";
 
+const FINISHED = ["completed", "failed", "rejected", "cancelled"];
+const MAX_LIVE_LINES = 500;
+
+// fold a persisted `step` event into the run, like the server's apply_event
+function applyStep(run, ev) {
+  const steps = run.steps.slice();
+  steps[ev.idx] = { ...steps[ev.idx], ...ev.fields };
+  const states = run.states.slice();
+  states[ev.idx] = ev.state;
+  return {
+    ...run,
+    steps,
+    states,
+    current: states.flatMap((s, i) => (s === "running" ? [i] : [])),
+    log: ev.log ? [...run.log, ev.log] : run.log,
+  };
+}
+
 export default function WorkflowStatus({ runId, onReset }) {
   const [run, setRun] = useState(null);
+  const [lines, setLines] = useState([]);
   const [error, setError] = useState(null);
 
   useEffect(() => {
-    let interval;
-    const fetchStatus = async () => {
-      try {
-        const res = await axios.get(`/status/${runId}`);
-        setRun(res.data);
-      } catch (err) {
-        setError(err.response?.data || err.message);
-        clearInterval(interval);
+    const source = new EventSource(`/runs/${runId}/events`);
+    const on = (type, handler) =>
+      source.addEventListener(type, (e) => handler(JSON.parse(e.data)));
+
+    on("snapshot", (ev) => {
+      setRun(ev.run);
+      if (FINISHED.includes(ev.run.status)) source.close();
+    });
+    on("status", (ev) => {
+      setRun((r) => r && { ...r, status: ev.status });
+      if (FINISHED.includes(ev.status)) source.close();
+    });
+    on("step", (ev) => setRun((r) => r && applyStep(r, ev)));
+    on("line", (ev) =>
+      setLines((l) => [...l.slice(1 - MAX_LIVE_LINES), ev])
+    );
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        setError("Lost connection to the orchestrator");
       }
     };
-    fetchStatus();
-    interval = setInterval(fetchStatus, 2000);
-    return () => clearInterval(interval);
+    return () => source.close();
   }, [runId]);
 
   if (error) {
@@ -62,13 +89,20 @@ export default function WorkflowStatus({ runId, onReset }) {
         >
           {run.status.toUpperCase()}
         </span>
+        {run.status === "queued" && run.queue_position && (
+          <span className="ml-3 text-sm text-gray-600">
+            #{run.queue_position} in queue
+          </span>
+        )}
       </div>
 
       <div className="border-l-4 border-gray-200 p-4 space-y-6">
         {run.steps.map((step, idx) => {
-          const isDone = idx < run.current;
-          const isRunning = idx === run.current && run.status === "running";
-          const isFailed = run.status === "failed" && idx === run.current;
+          const state = run.states[idx];
+          const isDone = state === "completed";
+          const isRunning = state === "running";
+          const isFailed = state === "failed";
+          const isSkipped = state === "skipped";
 
           const Icon = isDone ? CheckCircle : isRunning ? Loader : XCircle;
           const iconColor = isDone
@@ -120,6 +154,8 @@ export default function WorkflowStatus({ runId, onReset }) {
                       ? "RUNNING"
                       : isFailed
                       ? "FAILED"
+                      : isSkipped
+                      ? "SKIPPED"
                       : "PENDING"}
                   </span>
                 </div>
@@ -142,6 +178,15 @@ export default function WorkflowStatus({ runId, onReset }) {
         })}
       </div>
 
+      {lines.length > 0 && (
+        <details className="mt-4" open={run.status === "running"}>
+          <summary className="cursor-pointer font-medium">Live output ▼</summary>
+          <pre className="mt-2 bg-black text-white p-4 rounded-xl max-h-64 overflow-auto text-sm">
+            {lines.map((ev) => `[${run.steps[ev.idx].name}] ${ev.data}`)}
+          </pre>
+        </details>
+      )}
+
       <details className="mt-4">
         <summary className="cursor-pointer font-medium">Logs ▼</summary>
         <pre className="mt-2 bg-black text-white p-4 rounded-xl max-h-64 overflow-auto text-sm">
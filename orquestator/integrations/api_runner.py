@@ -1,10 +1,65 @@
 # integrations/api_runner.py
 
+import asyncio
+import concurrent.futures
+import random
+import threading
 import time
-import requests
-from pathlib import Path
 
-def execute(step: dict) -> dict:
+import httpx
+
+import metrics
+
+# Step keys understood by this runner: name -> (types, required)
+SCHEMA = {
+    "url":            (str, True),
+    "method":         (str, False),
+    "headers":        (dict, False),
+    "body":           (object, False),
+    "status_field":   (str, False),
+    "desired_status": (object, False),
+    "retries":        (int, False),
+    "interval":       ((int, float), False),
+    "backoff":        ((int, float), False),
+    "max_interval":   ((int, float), False),
+    "jitter":         ((int, float), False),
+    "deadline":       ((int, float), False),
+    "timeout":        ((int, float), False),
+}
+
+REQUESTS_TOTAL = metrics.Counter("orq_api_requests_total", "Poll requests by outcome", ("outcome",))
+REQUEST_SECONDS = metrics.Histogram(
+    "orq_api_request_seconds", "Poll request latency",
+    buckets=(0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# Connection pool shared by every API step in the process
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE = 20
+
+# How often a step thread checks for a cancel/timeout while its poll runs
+STOP_CHECK_SECONDS = 0.25
+
+# One background event loop + pooled client drive all polls; step threads
+# only wait on the result, they never hold a socket or sleep in a loop.
+_engine_lock = threading.Lock()
+_loop: asyncio.AbstractEventLoop | None = None
+_client: httpx.AsyncClient | None = None
+
+def _engine() -> tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]:
+    global _loop, _client
+    with _engine_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="api-poller", daemon=True).start()
+            _client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                    max_keepalive_connections=MAX_KEEPALIVE),
+            )
+            _loop = loop
+    return _loop, _client
+
+def execute(step: dict, ctx=None) -> dict:
     """
     Polls a long‑running API until a desired status appears (or retries exhaust).
 
@@ -17,42 +72,128 @@ def execute(step: dict) -> dict:
       - desired_status (any, optional): value of status_field we wait for
       - retries        (int, default=10): max attempts
       - interval       (int, default=5): seconds between attempts
+      - backoff        (float, default=1): interval multiplier per attempt
+      - max_interval   (float, default=60): cap for the backed-off interval
+      - jitter         (float, default=0.1): +/- fraction randomizing each wait
+      - deadline       (float, optional): give up after this many seconds overall
+      - timeout        (float, default=10): per-request timeout
+
+    A cancel or the step/run timeout (from `ctx`) cancels the poll at once;
+    the result then carries "killed", as for process steps.
+    """
+    loop, client = _engine()
+    started = time.monotonic()
+    with metrics.span("api poll", method=step.get("method", "GET").upper()) as span:
+        future = asyncio.run_coroutine_threadsafe(poll(client, step, ctx), loop)
+        while True:
+            try:
+                result = future.result(timeout=STOP_CHECK_SECONDS if ctx is not None else None)
+                break
+            except concurrent.futures.TimeoutError:
+                reason = ctx.stop_reason()
+                if reason:
+                    future.cancel()
+                    result = _stopped(reason, None, started)
+                    break
+        if span is not None:
+            span.attrs["attempts"] = result.get("attempt")
+            if "killed" in result:
+                span.attrs["killed"] = result["killed"]
+    return result
+
+def _stopped(reason: str, attempt: int | None, started: float) -> dict:
+    return {"code": 1, "killed": reason, "attempt": attempt,
+            "error": f"API poll stopped ({reason})", "elapsed": time.monotonic() - started}
+
+async def poll(client: httpx.AsyncClient, step: dict, ctx=None) -> dict:
+    """
+    The polling loop itself; safe to await from async code directly. With
+    a step context it stops before any attempt or wait once the step has
+    to (see StepContext.stop_reason), and never sleeps past its deadline.
     """
     url    = step["url"]
     method = step.get("method", "GET").upper()
-    headers= step.get("headers", {})
+    headers= dict(step.get("headers", {}))
     body   = step.get("body")
     retries = step.get("retries", 10)
     interval= step.get("interval", 5)
+    backoff = step.get("backoff", 1)
+    max_interval = step.get("max_interval", 60)
+    jitter  = step.get("jitter", 0.1)
+    timeout = step.get("timeout", 10)
+    field = step.get("status_field")
+    want  = step.get("desired_status")
+
+    started = time.monotonic()
+    deadline = started + step["deadline"] if step.get("deadline") else None
+    # the step/run timeout: reaching it is a kill, not a failed poll
+    hard_deadline = getattr(ctx, "deadline", None)
+
+    # conditional requests: only safe methods, only if the server sends ETags
+    conditional = method in ("GET", "HEAD")
+    etag = None
+    data = None
 
     last_resp = None
+    attempt = 0
     for attempt in range(1, retries + 1):
+        reason = ctx.stop_reason() if ctx is not None else None
+        if reason:
+            return _stopped(reason, attempt - 1, started)
         try:
-            resp = requests.request(method, url, json=body, headers=headers, timeout=10)
+            send_headers = dict(headers)
+            if conditional and etag:
+                send_headers["If-None-Match"] = etag
+            sent = time.monotonic()
+            request_timeout = timeout
+            if hard_deadline is not None:
+                request_timeout = max(min(timeout, hard_deadline - sent), 0.001)
+            try:
+                resp = await client.request(method, url, json=body, headers=send_headers, timeout=request_timeout)
+            except Exception:
+                REQUESTS_TOTAL.inc(outcome="error")
+                raise
+            REQUEST_SECONDS.observe(time.monotonic() - sent)
+            REQUESTS_TOTAL.inc(outcome=f"{resp.status_code // 100}xx")
             last_resp = resp
-            # try JSON, else raw text
-            data = resp.json() if 'application/json' in resp.headers.get('Content-Type','') else resp.text
+
+            if resp.status_code == 304 and data is not None:
+                pass  # unchanged since last poll: reuse the previous body
+            else:
+                # try JSON, else raw text
+                data = resp.json() if 'application/json' in resp.headers.get('Content-Type','') else resp.text
+                etag = resp.headers.get("ETag") if conditional else None
 
             # if polling a specific field:
-            field = step.get("status_field")
-            want  = step.get("desired_status")
             if field and want is not None:
                 if isinstance(data, dict) and data.get(field) == want:
-                    return {"code": 0, "response": data, "attempt": attempt}
+                    return {"code": 0, "response": data, "attempt": attempt,
+                            "elapsed": time.monotonic() - started}
             else:
                 # no polling field specified, treat any 2xx as success
-                if resp.ok:
-                    return {"code": 0, "response": data, "attempt": attempt}
+                if resp.is_success:
+                    return {"code": 0, "response": data, "attempt": attempt,
+                            "elapsed": time.monotonic() - started}
         except Exception as e:
             last_resp = e
 
         if attempt < retries:
-            time.sleep(interval)
+            delay = min(interval * backoff ** (attempt - 1), max_interval)
+            delay *= 1 + random.uniform(-jitter, jitter)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                delay = min(delay, remaining)
+            if hard_deadline is not None:
+                delay = min(delay, hard_deadline - time.monotonic())
+            await asyncio.sleep(max(delay, 0))
 
-    # all retries exhausted
+    # all retries (or the deadline) exhausted
     err_text = last_resp.text if hasattr(last_resp, "text") else str(last_resp)
     return {
         "code": 1,
-        "error": f"Did not reach desired status '{step.get('desired_status')}' after {retries} attempts",
-        "last_response": err_text
+        "error": f"Did not reach desired status '{want}' after {attempt} attempts",
+        "last_response": err_text,
+        "elapsed": time.monotonic() - started,
     }
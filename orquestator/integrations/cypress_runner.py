@@ -1,13 +1,105 @@
-import subprocess
-import platform
+import json
 import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from dotenv import load_dotenv
-from app import CYPRESS_MODULES
+import metrics
+import testhistory
+from settings import CYPRESS_MODULES
+from integrations.junit import parse_reports
+from integrations.process import run_process
+from integrations.project_context import find_binary, step_env
 
-def execute(step: dict) -> dict:
+# Step keys understood by this runner: name -> (types, required)
+SCHEMA = {
+    "project": (str, False),
+    "folder":  (str, False),
+    "module":  (str, False),
+    "shards":  (int, False),
+    "reports": (str, False),
+    "junit":   (bool, False),
+}
+
+# Seconds assumed for a spec that has never been timed
+DEFAULT_SPEC_SECONDS = 30.0
+
+# Ports held by running shards, so concurrent sharded steps never share one
+_ports_in_use: set[int] = set()
+_ports_lock = threading.Lock()
+
+SPECS_TOTAL = metrics.Counter("orq_cypress_specs_total", "Spec files run, by outcome", ("status",))
+SPEC_SECONDS = metrics.Histogram("orq_cypress_spec_seconds", "Per-spec duration from JUnit reports")
+
+def _load_timings(project: Path) -> dict:
+    try:
+        return testhistory.expected_durations(str(project))
+    except sqlite3.Error:
+        return {}
+
+def remote_hints(step: dict) -> dict:
+    """
+    Worked out on the orchestrator before the step goes to an agent: the
+    spec timings shards are balanced with (agents keep no test history).
+    """
+    if int(step.get("shards", 1)) <= 1:
+        return {}
+    return {"timings": _load_timings(Path(step.get("project", ".")).resolve())}
+
+def _junit_args(reports: Path) -> list:
+    return ["--reporter", "junit", "--reporter-options", f"mochaFile={reports}/result-[hash].xml"]
+
+def _reserve_port() -> int:
+    """
+    A free TCP port for one shard: picked by the OS (bind to port 0) and
+    held in this process until _release_port.
+    """
+    with _ports_lock:
+        while True:
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                port = s.getsockname()[1]
+            if port not in _ports_in_use:
+                _ports_in_use.add(port)
+                return port
+
+def _release_port(port: int) -> None:
+    with _ports_lock:
+        _ports_in_use.discard(port)
+
+def _balance(specs: list, history: dict, shards: int) -> list:
+    """
+    Longest-processing-time-first: hand each spec, slowest first, to the
+    shard with the least expected work.
+    """
+    known = sorted(history.values())
+    fallback = known[len(known) // 2] if known else DEFAULT_SPEC_SECONDS
+    weighted = sorted(specs, key=lambda s: history.get(s, fallback), reverse=True)
+    buckets = [{"specs": [], "expected": 0.0} for _ in range(shards)]
+    for spec in weighted:
+        target = min(buckets, key=lambda b: b["expected"])
+        target["specs"].append(spec)
+        target["expected"] += history.get(spec, fallback)
+    return [b for b in buckets if b["specs"]]
+
+def toolchain(step: dict) -> str:
+    """
+    Installed Cypress version, part of the step's result-cache key.
+    """
+    package = Path(step.get("project", ".")).resolve() / "node_modules" / "cypress" / "package.json"
+    try:
+        return "cypress " + json.loads(package.read_text())["version"]
+    except (OSError, ValueError, KeyError):
+        return "cypress unknown"
+
+def execute(step: dict, ctx=None) -> dict:
     """
-    1) Loads .env from the project root (overrides nothing else).
+    1) Reads .env from the project root (cached, never put into os.environ).
     2) Picks the right cypress binary (local .cmd on Windows, or npx fallback).
     3) Runs with that env dict, so http_proxy/https_proxy from .env are honored.
     """
@@ -15,16 +107,10 @@ def execute(step: dict) -> dict:
     if not project.is_dir():
         return {"error": f"Project folder not found: {project!s}"}
 
-    # 1. Load .env
-    dotenv_path = project / ".env"
-    if dotenv_path.is_file():
-        load_dotenv(dotenv_path, override=True)
+    # 1-2. Build the step's env dict
+    #    We drop any system proxy vars, then let the .env values stand.
+    env = step_env(project, strip_proxies=True)
 
-    # 2. Build the filtered env dict
-    #    We drop any system proxy vars, then let python-dotenv values stand.
-    env = {k: v for k, v in os.environ.items()
-           if not k.lower().endswith("_proxy")}
-    
     # 3. Resolve folder vs module
     folder = step.get("folder")
     if step.get("module"):
@@ -36,47 +122,166 @@ def execute(step: dict) -> dict:
     if not spec_dir.exists():
         return {"error": f"Spec folder not found: {spec_dir!s}"}
 
+    # 4. Find the binary or fall back to npx (local or global)
+    local_bin = find_binary("cypress", project, search_path=False)
+    if local_bin:
+        base_cmd = [local_bin, "run"]
+    else:
+        npx_cmd = find_binary("npx", project, search_path=False) or "npx"
+        base_cmd = [npx_cmd, "cypress", "run"]
+
+    shards = int(step.get("shards", 1))
+    if shards > 1:
+        return _run_sharded(step, ctx, project, spec_dir, base_cmd, env, shards)
+
     patterns = [
         str(spec_dir / "**" / "*.cy.js"),
         str(spec_dir / "**" / "*.spec.js")
     ]
     spec_pattern = ",".join(patterns)
+    cmd = base_cmd + ["--spec", spec_pattern]
 
-    # 4. Find the binary or fall back to npx
-    system = platform.system()
-    if system == "Windows":
-        local_bin = project / "node_modules" / ".bin" / "cypress.cmd"
-    else:
-        local_bin = project / "node_modules" / ".bin" / "cypress"
+    # 5. Launch! Per-test results are collected only when asked for: from
+    #    the files the project's own reporter writes ("reports"), or by
+    #    switching this step to Cypress' JUnit reporter ("junit": true)
+    use_junit = bool(step.get("junit")) and not step.get("reports")
+    with _work_dir(ctx, "junit") if use_junit else nullcontext() as junit_dir:
+        if junit_dir is not None:
+            cmd += _junit_args(junit_dir)
+        started = time.time()
+        try:
+            result = run_process(cmd, cwd=str(project), env=env, ctx=ctx, label="cypress")
+        except FileNotFoundError as e:
+            return {"error": f"Executable not found: {cmd[0]}", "exception": str(e)}
+        files = []
+        if step.get("reports"):
+            files = [p for p in sorted(project.glob(step["reports"])) if p.stat().st_mtime >= started]
+        elif junit_dir is not None:
+            files = sorted(junit_dir.glob("*.xml"))
+        tests = testhistory.ingest(project, files, step, ctx) if files else None
+    if tests:
+        result["tests"] = tests
+    return result
 
-    if local_bin.exists():
-        runner = str(local_bin)
-        cmd = [runner, "run", "--spec", spec_pattern]
-    else:
-        # try local npx or global
-        if system == "Windows":
-            local_npx = project / "node_modules" / ".bin" / "npx.cmd"
-        else:
-            local_npx = project / "node_modules" / ".bin" / "npx"
-        npx_cmd = str(local_npx) if local_npx.exists() else "npx"
-        cmd = [npx_cmd, "cypress", "run", "--spec", spec_pattern]
-
-    # 5. Launch!
+@contextmanager
+def _work_dir(ctx, name: str):
+    """
+    Scratch folder for this step: under the run's spool dir when there is
+    one (kept with the run's other output), else a temp dir removed on exit.
+    """
+    if ctx is not None and ctx.spool_dir is not None:
+        path = ctx.spool_dir / f"{ctx.idx}-{name}"
+        if getattr(ctx, "matrix_item", None) is not None:
+            path = ctx.spool_dir / f"{ctx.idx}-{ctx.matrix_item}-{name}"
+        path.mkdir(parents=True, exist_ok=True)
+        yield path
+        return
+    path = Path(tempfile.mkdtemp(prefix=f"cypress-{name}-"))
     try:
-        proc = subprocess.run(
-            cmd,
-            cwd=str(project),
-            env=env,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-        )
-    except FileNotFoundError as e:
-        return {"error": f"Executable not found: {cmd[0]}", "exception": str(e)}
-
-    return {
-        "out":  proc.stdout,
-        "err":  proc.stderr,
-        "code": proc.returncode
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def _run_sharded(step, ctx, project, spec_dir, base_cmd, env, shards) -> dict:
+    """
+    Split the spec files across `shards` concurrent Cypress processes, each
+    with its own port, app-data/tmp dirs and JUnit output, then merge the
+    shard results into a single step result with per-spec outcomes.
+    """
+    specs = sorted(
+        str(p.relative_to(project)).replace(os.sep, "/")
+        for pattern in ("*.cy.js", "*.spec.js")
+        for p in spec_dir.rglob(pattern)
+    )
+    if not specs:
+        return {"error": f"No spec files found under {spec_dir!s}"}
+
+    hints = ctx.hints if ctx is not None else {}
+    history = hints["timings"] if "timings" in hints else _load_timings(project)
+    plan = _balance(specs, history, shards)
+
+    parent = metrics.current_span()
+
+    def run_shard(i: int, bucket: dict) -> dict:
+        with metrics.activate(parent), metrics.span("shard", shard=i, specs=len(bucket["specs"])):
+            return _shard(i, bucket)
+
+    def _shard(i: int, bucket: dict) -> dict:
+        shard_dir = work / f"shard{i}"
+        reports = shard_dir / "junit"
+        for sub in ("junit", "config", "tmp"):
+            (shard_dir / sub).mkdir(parents=True, exist_ok=True)
+        shard_env = {
+            **env,
+            "XDG_CONFIG_HOME": str(shard_dir / "config"),
+            "TMPDIR": str(shard_dir / "tmp"),
+        }
+        port = _reserve_port()
+        cmd = base_cmd + [
+            "--spec", ",".join(bucket["specs"]),
+            "--port", str(port),
+            *_junit_args(reports),
+            "--config", f"screenshotsFolder={shard_dir / 'screenshots'},"
+                        f"videosFolder={shard_dir / 'videos'}",
+        ]
+        try:
+            result = run_process(cmd, cwd=str(project), env=shard_env, ctx=ctx, label=f"shard{i}")
+        except FileNotFoundError as e:
+            result = {"code": 1, "error": f"Executable not found: {cmd[0]}", "exception": str(e)}
+        finally:
+            _release_port(port)
+        result.update(shard=i, port=port, specs=bucket["specs"], expected_seconds=round(bucket["expected"], 1))
+        result["reports"] = parse_reports(sorted(reports.glob("*.xml")))
+        return result
+
+    with _work_dir(ctx, "shards") as work, ThreadPoolExecutor(max_workers=len(plan)) as pool:
+        shard_results = list(pool.map(run_shard, range(len(plan)), plan))
+
+    # merge per-spec outcomes from every shard's JUnit files
+    outcomes, parsed = [], []
+    for shard in shard_results:
+        seen = {}
+        parsed += shard["reports"]
+        for report in shard.pop("reports"):
+            if report["file"]:
+                seen[report["file"].replace(os.sep, "/")] = report["cases"]
+        for spec in shard["specs"]:
+            cases = seen.get(spec)
+            if cases is None:
+                outcomes.append({"spec": spec, "shard": shard["shard"], "status": "unknown"})
+                continue
+            secs = round(sum(c["time"] for c in cases), 3)
+            failed = sum(c["status"] == "failed" for c in cases)
+            SPEC_SECONDS.observe(secs)
+            outcomes.append({
+                "spec":     spec,
+                "shard":    shard["shard"],
+                "status":   "failed" if failed else "passed",
+                "tests":    len(cases),
+                "failures": failed,
+                "duration": secs,
+            })
+    for outcome in outcomes:
+        SPECS_TOTAL.inc(status=outcome["status"])
+
+    # first non-zero exit code (killed shards report negative ones)
+    codes = [s.get("code", 1) for s in shard_results]
+    code = next((c for c in codes if c != 0), 0) if codes else 1
+    out = "".join(f"--- shard {s['shard']} ---\n{s.pop('out', '')}" for s in shard_results)
+    err = "".join(f"--- shard {s['shard']} ---\n{s.pop('err', '')}" for s in shard_results)
+    result = {
+        "code":   code,
+        "out":    out,
+        "err":    err,
+        "shards": shard_results,
+        "specs":  outcomes,
     }
+    if parsed:
+        # history is best-effort; the step result has the outcomes
+        tests = testhistory.keep(str(project), parsed, step, ctx)
+        if tests:
+            result["tests"] = tests
+    killed = next((s["killed"] for s in shard_results if "killed" in s), None)
+    if killed:
+        result["killed"] = killed
+    return result
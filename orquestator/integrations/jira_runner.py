@@ -1,7 +1,44 @@
-import subprocess
+import hashlib
 import json
 
-def execute(step: dict) -> dict:
+import metrics
+from integrations.process import run_process
+
+# Step keys understood by this runner: name -> (types, required)
+SCHEMA = {
+    "jira_url": (str, True),
+    "user":     (str, True),
+    "token":    (str, True),
+    "issue":    (str, True),
+    "comment":  (str, True),
+    "outbox":   (bool, False),
+}
+
+COMMENTS_TOTAL = metrics.Counter("orq_jira_comments_total", "Comments posted, by outcome", ("result",))
+
+def execute(step: dict, ctx=None) -> dict:
+    """
+    Post `comment` on `issue`. With "outbox": true the comment is queued
+    for the background outbox worker instead and the step completes at
+    once; the delivery outcome shows up later under the step's "delivery".
+    """
+    if step.get("outbox"):
+        payload = {k: step[k] for k in ("jira_url", "user", "token", "issue", "comment")}
+        # comments are only merged when posted as the same user with the
+        # same credentials (the target is listed by /outbox: no raw token)
+        token_fp = hashlib.sha256(step["token"].encode()).hexdigest()[:12]
+        target = f"{step['jira_url']}|{step['issue']}|{step['user']}|{token_fp}"
+        COMMENTS_TOTAL.inc(result="queued")
+        if getattr(ctx, "remote", False):
+            # an agent has no outbox worker: the orchestrator queues it
+            # when the result comes back (dispatch.run_remote)
+            return {"code": 0, "enqueue": {"kind": "jira", "target": target, "payload": payload}}
+        import outbox  # server side only; it brings in the run store
+        item_id = outbox.enqueue(
+            "jira", target, payload, run_id=getattr(ctx, "run_id", None), idx=getattr(ctx, "idx", None),
+        )
+        return {"code": 0, "out": f"Comment for {step['issue']} queued (outbox #{item_id})", "outbox_id": item_id}
+
     data = json.dumps({"body": step["comment"]})
     cmd = [
       "curl", "-X", "POST",
@@ -10,9 +47,21 @@ def execute(step: dict) -> dict:
       f"{step['jira_url']}/issue/{step['issue']}/comment",
       "--data", data
     ]
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-    return {
-        "out": proc.stdout,
-        "err": proc.stderr,
-        "code": proc.returncode
-    }
+    result = run_process(cmd, ctx=ctx, label="curl")
+    COMMENTS_TOTAL.inc(result="ok" if result["code"] == 0 else "failed")
+    return result
+
+def deliver(client, payloads: list[dict]) -> None:
+    """
+    Outbox hook: post queued comments for one issue (all by the same user,
+    see the enqueue target) as a single comment over the worker's pooled
+    session. Raises on any failure.
+    """
+    first = payloads[0]
+    response = client.post(
+        f"{first['jira_url']}/issue/{first['issue']}/comment",
+        auth=(first["user"], first["token"]),
+        json={"body": "\n\n".join(p["comment"] for p in payloads)},
+    )
+    response.raise_for_status()
+    COMMENTS_TOTAL.inc(len(payloads), result="ok")
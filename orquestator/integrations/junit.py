@@ -0,0 +1,90 @@
+# integrations/junit.py
+
+import json
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+def parse_report(path: Path) -> dict:
+    """
+    Read one JUnit XML file (as written by mocha-junit-reporter, which is
+    what Cypress' `--reporter junit` uses).
+
+    Returns {"file": <spec file or None>, "cases": [...]} where each case is
+    {"suite", "name", "classname", "time", "status", "message"} and status is
+    "passed" | "failed" | "skipped".
+    """
+    root = ET.parse(path).getroot()
+    suites = [root] if root.tag == "testsuite" else list(root.iter("testsuite"))
+
+    spec = None
+    cases = []
+    for suite in suites:
+        # mocha-junit-reporter puts the spec path on the (empty) root suite
+        spec = spec or suite.get("file")
+        for case in suite.findall("testcase"):
+            status, message = "passed", None
+            for tag in ("failure", "error"):
+                node = case.find(tag)
+                if node is not None:
+                    status, message = "failed", node.get("message") or (node.text or "").strip()
+                    break
+            else:
+                if case.find("skipped") is not None:
+                    status = "skipped"
+            cases.append({
+                "suite":     suite.get("name"),
+                "name":      case.get("name"),
+                "classname": case.get("classname"),
+                "time":      float(case.get("time") or 0),
+                "status":    status,
+                "message":   message,
+            })
+    return {"file": spec, "cases": cases}
+
+def _mocha_cases(suite: dict, cases: list) -> None:
+    for test in suite.get("tests", []):
+        if test.get("fail"):
+            status = "failed"
+        elif test.get("pending") or test.get("skipped"):
+            status = "skipped"
+        else:
+            status = "passed"
+        cases.append({
+            "suite":     suite.get("title"),
+            "name":      test.get("title"),
+            "classname": test.get("fullTitle"),
+            "time":      (test.get("duration") or 0) / 1000,
+            "status":    status,
+            "message":   (test.get("err") or {}).get("message"),
+        })
+    for child in suite.get("suites", []):
+        _mocha_cases(child, cases)
+
+def parse_mochawesome(path: Path) -> list[dict]:
+    """
+    Read one mochawesome JSON report; same shape as parse_report, one entry
+    per spec file in it.
+    """
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    reports = []
+    for result in data.get("results", []):
+        cases = []
+        _mocha_cases(result, cases)
+        reports.append({"file": result.get("file") or result.get("fullFile"), "cases": cases})
+    return reports
+
+def parse_reports(paths) -> list[dict]:
+    """
+    Parse JUnit XML and mochawesome JSON files, skipping unreadable/corrupt
+    ones.
+    """
+    reports = []
+    for path in paths:
+        try:
+            if Path(path).suffix == ".json":
+                reports.extend(parse_mochawesome(path))
+            else:
+                reports.append(parse_report(path))
+        except (OSError, ET.ParseError, ValueError, AttributeError):
+            continue
+    return reports
@@ -1,14 +1,133 @@
 # integrations/npm_runner.py
 
-import subprocess
-import platform
+import hashlib
 import shutil
+import tarfile
+import threading
+import time
 import os
 from pathlib import Path
-from dotenv import load_dotenv
 from datetime import datetime
 
-def execute(step: dict) -> dict:
+import metrics
+import testhistory
+from integrations.process import run_process
+from integrations.project_context import find_binary, step_env, tool_version
+
+# Step keys understood by this runner: name -> (types, required)
+SCHEMA = {
+    "project": (str, False),
+    "script":  (str, True),
+    "args":    (list, False),
+    "env":     (dict, False),
+    "reports": (str, False),
+}
+
+# Shared, content-addressed store of installed node_modules trees
+NPM_CACHE_DIR = Path(os.getenv("ORQ_NPM_CACHE", Path.home() / ".cache" / "orquestator" / "npm"))
+NPM_CACHE_MAX_BYTES = 5 * 1024 ** 3
+
+DEPS_TOTAL = metrics.Counter("orq_npm_deps_total", "Dependency checks by outcome", ("result",))
+DEPS_SECONDS = metrics.Histogram("orq_npm_deps_seconds", "Time to get node_modules ready", ("result",))
+
+# Written into node_modules once it matches a fingerprint
+_STAMP = ".orq-fingerprint"
+
+# One install at a time per project folder
+_project_locks: dict[Path, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+def _project_lock(project: Path) -> threading.Lock:
+    with _locks_guard:
+        return _project_locks.setdefault(project, threading.Lock())
+
+def _fingerprint(project: Path) -> str:
+    """
+    Hash of package.json + package-lock.json + the Node version.
+    """
+    h = hashlib.sha256()
+    for name in ("package.json", "package-lock.json"):
+        path = project / name
+        h.update(name.encode() + b"\0")
+        h.update(path.read_bytes() if path.is_file() else b"")
+    h.update(tool_version(find_binary("node")).encode())
+    return h.hexdigest()
+
+def _evict(keep: Path) -> None:
+    """
+    Drop least recently used archives until the cache fits its budget.
+    """
+    archives = sorted(NPM_CACHE_DIR.glob("*.tar"), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in archives)
+    for path in archives:
+        if total <= NPM_CACHE_MAX_BYTES:
+            break
+        if path != keep:
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+
+def _ensure_deps(npm_path: str, project: Path, ctx) -> dict:
+    """
+    Make node_modules match the project's lockfile, as cheaply as possible:
+      hit      - node_modules already carries the current fingerprint
+      restored - unpacked from the shared cache
+      miss     - installed with `npm ci` (or `npm install` without a
+                 lockfile), then archived into the cache
+    """
+    started = time.monotonic()
+    modules = project / "node_modules"
+    fp = _fingerprint(project)
+    info = {"fingerprint": fp[:16]}
+
+    stamp = modules / _STAMP
+    if stamp.is_file() and stamp.read_text() == fp:
+        return {**info, "cache": "hit", "install_seconds": round(time.monotonic() - started, 3)}
+
+    archive = NPM_CACHE_DIR / f"{fp}.tar"
+    if archive.is_file():
+        shutil.rmtree(modules, ignore_errors=True)
+        with tarfile.open(archive) as tar:
+            extra = {"filter": "tar"} if hasattr(tarfile, "tar_filter") else {}
+            tar.extractall(project, **extra)
+        os.utime(archive)  # mark as recently used
+        stamp.write_text(fp)
+        return {**info, "cache": "restored", "install_seconds": round(time.monotonic() - started, 3)}
+
+    locked = (project / "package-lock.json").is_file()
+    if locked:
+        cmd = [npm_path, "ci", "--prefer-offline", "--cache", str(NPM_CACHE_DIR / "_npm")]
+    else:
+        cmd = [npm_path, "install"]
+    install = run_process(cmd, cwd=str(project), ctx=ctx, label="install")
+    if install["code"] != 0:
+        failed = {
+            "error": f"npm {cmd[1]} failed",
+            "out": install["out"],
+            "err": install["err"]
+        }
+        if "killed" in install:
+            failed["killed"] = install["killed"]
+        return failed
+    modules.mkdir(exist_ok=True)
+    stamp.write_text(fp)
+
+    # without a lockfile the tree isn't reproducible, so don't share it
+    if locked:
+        NPM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = archive.with_suffix(f".{os.getpid()}.tmp")
+        with tarfile.open(tmp, "w") as tar:
+            tar.add(modules, arcname="node_modules")
+        os.replace(tmp, archive)
+        _evict(keep=archive)
+    return {**info, "cache": "miss", "install_seconds": round(time.monotonic() - started, 3)}
+
+def toolchain(step: dict) -> str:
+    """
+    Node version, part of the step's result-cache key.
+    """
+    return tool_version(find_binary("node"))
+
+def execute(step: dict, ctx=None) -> dict:
     """
     Runs an `npm run <script>` command in its own Node project,
     returning stdout, stderr, exit code, plus timestamps and duration.
@@ -18,37 +137,25 @@ def execute(step: dict) -> dict:
     if not project.is_dir():
         return {"error": f"Project folder not found: {project}"}
 
-    # 2) Load .env if present
-    dotenv_path = project / ".env"
-    if dotenv_path.is_file():
-        load_dotenv(dotenv_path, override=True)
-
-    # 3) Find npm binary
-    npm_cmd = "npm.cmd" if platform.system() == "Windows" else "npm"
-    npm_path = shutil.which(npm_cmd)
+    # 2-3) Find npm binary (cached until PATH changes)
+    npm_path = find_binary("npm")
     if not npm_path:
-        return {"error": f"npm executable not found in PATH (looked for {npm_cmd})"}
-
-    # 4) Ensure deps are installed
-    install = subprocess.run(
-        [npm_path, "install"],
-        cwd=str(project),
-        capture_output=True,
-        text=True
-    )
-    if install.returncode != 0:
-        return {
-            "error": "npm install failed",
-            "out": install.stdout,
-            "err": install.stderr
-        }
+        return {"error": "npm executable not found in PATH"}
 
-    # 5) Build env: inject node_modules/.bin first, plus any step-specific env
-    env = os.environ.copy()
-    bin_dir = project / "node_modules" / ".bin"
-    env["PATH"] = str(bin_dir) + os.pathsep + env.get("PATH", "")
-    for k, v in step.get("env", {}).items():
-        env[k] = v
+    # 4) Ensure deps are installed (skipped when the lockfile is unchanged)
+    with _project_lock(project), metrics.span("npm deps") as span:
+        deps = _ensure_deps(npm_path, project, ctx)
+        if span is not None:
+            span.attrs["result"] = deps.get("cache", "error")
+    if "error" in deps:
+        DEPS_TOTAL.inc(result="error")
+        return deps
+    DEPS_TOTAL.inc(result=deps["cache"])
+    DEPS_SECONDS.observe(deps["install_seconds"], result=deps["cache"])
+
+    # 5) Build env: the project's .env, node_modules/.bin first on PATH,
+    #    plus any step-specific env (os.environ itself is left alone)
+    env = step_env(project, step.get("env"))
 
     # 6) Determine which script to run
     script = step.get("script")
@@ -62,15 +169,7 @@ def execute(step: dict) -> dict:
     proc = None
     exc = None
     try:
-        proc = subprocess.run(
-            cmd,
-            cwd=str(project),
-            env=env,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="replace"
-        )
+        proc = run_process(cmd, cwd=str(project), env=env, ctx=ctx, label="run")
     except FileNotFoundError as e:
         exc = e
     end_time = datetime.now()
@@ -87,15 +186,19 @@ def execute(step: dict) -> dict:
         "start":          start_time.isoformat(),
         "end":            end_time.isoformat(),
         "duration":       total_secs,
-        "duration_human": human
+        "duration_human": human,
+        "deps":           deps
     }
 
     if proc is not None:
-        result.update({
-            "out":  proc.stdout,
-            "err":  proc.stderr,
-            "code": proc.returncode
-        })
+        result.update(proc)
+        # 10) Record per-test results from reporter files this run wrote
+        if step.get("reports"):
+            files = [p for p in sorted(project.glob(step["reports"]))
+                     if p.stat().st_mtime >= start_time.timestamp()]
+            tests = testhistory.ingest(project, files, step, ctx)
+            if tests:
+                result["tests"] = tests
     if exc is not None:
         result.update({
             "error":     f"Executable not found: {cmd[0]}",
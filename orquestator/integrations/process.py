@@ -0,0 +1,243 @@
+# integrations/process.py
+
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import metrics
+
+# Lines of each stream kept in memory (and returned in the step result)
+TAIL_LINES = 200
+
+# A timed-out or cancelled process group gets SIGTERM, then SIGKILL if it
+# is still around this many seconds later
+KILL_GRACE_SECONDS = 5.0
+
+# How long output pumps may keep draining once a killed process is reaped
+# (a detached grandchild could otherwise hold the pipes open forever)
+PUMP_DRAIN_SECONDS = 2.0
+
+SPAWN_SECONDS = metrics.Histogram(
+    "orq_process_spawn_seconds", "Time to start a runner subprocess", ("program",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+PROCESS_SECONDS = metrics.Histogram(
+    "orq_process_seconds", "Runner subprocess wall time", ("program",),
+)
+
+
+class StepContext:
+    """
+    What the orchestrator hands a runner besides the step itself: where to
+    spool full output, who to notify about each line as it is produced, and
+    when the step must stop (a monotonic `deadline` and/or a `stop` event
+    set when the run is cancelled). Runners called without a context just
+    keep the in-memory tail and are never stopped.
+
+    On a worker agent `remote` is set: runners then leave the outbox and
+    test history to the orchestrator (see dispatch.run_remote) and read
+    what it computed for them from `hints`.
+    """
+
+    def __init__(self, run_id: str | None = None, idx: int | None = None,
+                 spool_dir: Path | None = None, on_line=None,
+                 deadline: float | None = None, stop: threading.Event | None = None):
+        self.run_id = run_id
+        self.idx = idx
+        self.spool_dir = spool_dir
+        self._on_line = on_line
+        self.deadline = deadline
+        self.stop = stop
+        self.matrix_item = None
+        self.remote = False
+        self.hints = {}
+
+    def item(self, n: int) -> "StepContext":
+        """
+        Context for item `n` of a matrix step: same deadline and run, its
+        own spool files, live lines prefixed with "[n] ".
+        """
+        child = StepContext(self.run_id, self.idx, self.spool_dir, self._on_line, self.deadline, self.stop)
+        child.matrix_item = n
+        child.remote, child.hints = self.remote, self.hints
+        return child
+
+    def stop_reason(self) -> str | None:
+        """
+        "cancelled" or "timeout" once the step has to stop, else None.
+        """
+        if self.stop is not None and self.stop.is_set():
+            return "cancelled"
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "timeout"
+        return None
+
+    def spool_path(self, label: str, stream: str) -> Path | None:
+        if self.spool_dir is None:
+            return None
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        if self.matrix_item is not None:
+            label = f"{self.matrix_item}-{label}"
+        return self.spool_dir / f"{self.idx}-{label}.{stream}.log"
+
+    def emit(self, stream: str, line: str) -> None:
+        if self._on_line is not None:
+            if self.matrix_item is not None:
+                line = f"[{self.matrix_item}] {line}"
+            self._on_line(stream, line)
+
+
+class Watchdog:
+    """
+    Signals a process group once the context's deadline passes or its run
+    is cancelled: SIGTERM first, SIGKILL after KILL_GRACE_SECONDS. Call
+    finish() once the process has exited; `reason` says why it was killed.
+    """
+
+    def __init__(self, ctx: StepContext, send_signal):
+        self.ctx = ctx
+        self.reason = None
+        self._send = send_signal
+        self._done = threading.Event()
+        if ctx.deadline is not None or ctx.stop is not None:
+            threading.Thread(target=self._watch, daemon=True).start()
+
+    def _watch(self) -> None:
+        while not self._done.is_set():
+            reason = self.ctx.stop_reason()
+            if reason:
+                self.reason = reason
+                self._signal(signal.SIGTERM)
+                if not self._done.wait(KILL_GRACE_SECONDS):
+                    self._signal(signal.SIGKILL)
+                return
+            wait = 0.2
+            if self.ctx.deadline is not None:
+                wait = min(wait, max(self.ctx.deadline - time.monotonic(), 0))
+            self._done.wait(wait)
+
+    def _signal(self, sig) -> None:
+        try:
+            self._send(sig)
+        except (ProcessLookupError, PermissionError):
+            pass  # already gone
+
+    def finish(self) -> None:
+        self._done.set()
+        if self.reason:
+            # sweep whatever the group leader left behind
+            self._signal(getattr(signal, "SIGKILL", signal.SIGTERM))
+
+
+def _group_signaller(proc: subprocess.Popen):
+    if hasattr(os, "killpg"):
+        return lambda sig: os.killpg(proc.pid, sig)
+    return lambda sig: proc.kill()
+
+def _reap(proc: subprocess.Popen) -> dict:
+    """
+    Wait for the process; also returns its CPU time and peak RSS where the
+    platform reports them.
+    """
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return {}
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+        "max_rss_kb":  usage.ru_maxrss,
+    }
+
+def run_process(cmd: list, cwd: str | None = None, env: dict | None = None,
+                ctx: StepContext | None = None, label: str = "main") -> dict:
+    """
+    Run `cmd` in its own process group, streaming stdout/stderr line by
+    line to spool files and to the context's listener while only the last
+    TAIL_LINES stay in memory. If the context's deadline passes or its run
+    is cancelled, the whole group is killed.
+
+    Returns {"code", "out", "err", "cpu_seconds", "max_rss_kb"} (out/err
+    are the tails) plus "out_file"/"err_file" when the output was spooled
+    and "killed" ("timeout" or "cancelled") when it was stopped. Raises
+    FileNotFoundError like subprocess.run when the executable is missing.
+    """
+    ctx = ctx or StepContext()
+    reason = ctx.stop_reason()
+    if reason:
+        return {"code": 1, "out": "", "err": "", "killed": reason}
+    program = Path(str(cmd[0])).name
+    with metrics.span("process", program=program, label=label) as span:
+        started = time.perf_counter()
+        proc = subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+            start_new_session=True,
+        )
+        spawn = time.perf_counter() - started
+        SPAWN_SECONDS.observe(spawn, program=program)
+        watchdog = Watchdog(ctx, _group_signaller(proc))
+        result = _collect(proc, ctx, label, watchdog)
+        PROCESS_SECONDS.observe(time.perf_counter() - started, program=program)
+        if span is not None:
+            span.attrs.update(code=result["code"], spawn_seconds=round(spawn, 6))
+            if "killed" in result:
+                span.attrs["killed"] = result["killed"]
+    return result
+
+def _collect(proc: subprocess.Popen, ctx: StepContext, label: str, watchdog: Watchdog) -> dict:
+    """
+    Pump both pipes to their tails/spool files until the process exits.
+    """
+    tails = {"out": deque(maxlen=TAIL_LINES), "err": deque(maxlen=TAIL_LINES)}
+    files = {}
+
+    def pump(stream: str, pipe) -> None:
+        path = ctx.spool_path(label, stream)
+        spool = open(path, "w", encoding="utf-8") if path else None
+        if path:
+            files[stream] = str(path)
+        try:
+            for line in pipe:
+                tails[stream].append(line)
+                if spool:
+                    spool.write(line)
+                ctx.emit(stream, line)
+        finally:
+            pipe.close()
+            if spool:
+                spool.close()
+
+    pumps = [
+        threading.Thread(target=pump, args=("out", proc.stdout), daemon=True),
+        threading.Thread(target=pump, args=("err", proc.stderr), daemon=True),
+    ]
+    for t in pumps:
+        t.start()
+    usage = _reap(proc)
+    watchdog.finish()
+    for t in pumps:
+        t.join(PUMP_DRAIN_SECONDS if watchdog.reason else None)
+
+    result = {
+        "code": proc.returncode,
+        "out": "".join(tails["out"]),
+        "err": "".join(tails["err"]),
+        **usage,
+    }
+    if watchdog.reason:
+        result["killed"] = watchdog.reason
+    for stream, path in files.items():
+        result[f"{stream}_file"] = path
+    return result
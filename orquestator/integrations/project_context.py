@@ -0,0 +1,123 @@
+# integrations/project_context.py
+
+import os
+import platform
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+from types import MappingProxyType
+
+from dotenv import dotenv_values
+
+import metrics
+
+LOOKUPS_TOTAL = metrics.Counter(
+    "orq_project_context_total", "Project context lookups (.env, binaries, venvs)", ("kind", "result"),
+)
+
+_WINDOWS = platform.system() == "Windows"
+
+# (kind, key) -> (stamp, value); a lookup is redone once its stamp changes
+_cache: dict[tuple, tuple] = {}
+_lock = threading.Lock()
+
+
+def _stamp(path: Path):
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _cached(kind: str, key: str, stamp, compute):
+    with _lock:
+        hit = _cache.get((kind, key))
+    if hit is not None and hit[0] == stamp:
+        LOOKUPS_TOTAL.inc(kind=kind, result="hit")
+        return hit[1]
+    value = compute()
+    with _lock:
+        _cache[(kind, key)] = (stamp, value)
+    LOOKUPS_TOTAL.inc(kind=kind, result="miss")
+    return value
+
+def project_env(project: Path):
+    """
+    The project's parsed .env as a read-only mapping (empty without one),
+    re-read only when the file changes.
+    """
+    path = Path(project) / ".env"
+    stamp = _stamp(path)
+    if stamp is None:
+        return MappingProxyType({})
+    return _cached("dotenv", str(path), stamp, lambda: MappingProxyType(
+        {k: v for k, v in dotenv_values(path).items() if v is not None}
+    ))
+
+def find_binary(name: str, project: Path | None = None, search_path: bool = True) -> str | None:
+    """
+    Full path of a tool (its .cmd shim on Windows): the project's
+    node_modules/.bin first, then PATH unless `search_path` is off. Cached
+    until that folder's mtime or PATH changes.
+    """
+    exe = f"{name}.cmd" if _WINDOWS else name
+    if project is not None:
+        bin_dir = Path(project) / "node_modules" / ".bin"
+        stamp = _stamp(bin_dir)
+        if stamp is not None:
+            local = bin_dir / exe
+            found = _cached("bin", str(local), stamp, lambda: str(local) if local.exists() else None)
+            if found:
+                return found
+    if not search_path:
+        return None
+    return _cached("which", exe, os.environ.get("PATH", ""), lambda: shutil.which(exe))
+
+def venv_python(venv: str | None) -> Path:
+    """
+    Interpreter of a venv folder, or plain "python" (from PATH) when the
+    step has no venv or the folder does not exist.
+    """
+    if not venv:
+        return Path("python")
+    venv_dir = Path(venv).resolve()
+    stamp = _stamp(venv_dir)
+    if stamp is None:
+        return Path("python")
+    return _cached("venv", str(venv_dir), stamp, lambda: venv_dir / (
+        Path("Scripts") / "python.exe" if _WINDOWS else Path("bin") / "python"
+    ))
+
+def tool_version(exe: str | None) -> str:
+    """
+    `<exe> --version`, run again only when the binary changes.
+    """
+    if not exe:
+        return "unknown"
+    path = exe if os.path.isabs(exe) else (find_binary(exe) or exe)
+
+    def probe() -> str:
+        try:
+            proc = subprocess.run([path, "--version"], capture_output=True, text=True)
+            return (proc.stdout or proc.stderr).strip()
+        except OSError:
+            return "unknown"
+    return _cached("version", path, _stamp(Path(path)), probe)
+
+def step_env(project: Path | None = None, extra: dict | None = None, strip_proxies: bool = False) -> dict:
+    """
+    A fresh environment for one step, built without touching os.environ:
+    this process's variables (minus *_proxy ones with `strip_proxies`),
+    then the project's .env, then `extra`; the project's
+    node_modules/.bin goes first on PATH.
+    """
+    env = {k: v for k, v in os.environ.items() if not (strip_proxies and k.lower().endswith("_proxy"))}
+    if project is not None:
+        env.update(project_env(project))
+        bin_dir = Path(project) / "node_modules" / ".bin"
+        if _stamp(bin_dir) is not None:
+            env["PATH"] = str(bin_dir) + os.pathsep + env.get("PATH", "")
+    if extra:
+        env.update({k: str(v) for k, v in extra.items()})
+    return env
@@ -1,37 +1,301 @@
-import time
-import platform
+import json
+import logging
+import os
+import queue
 import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
 from pathlib import Path
 
-def execute(step: dict) -> dict:
+import metrics
+from integrations.process import TAIL_LINES, Watchdog, run_process
+from integrations.project_context import step_env, tool_version, venv_python
+
+log = logging.getLogger(__name__)
+
+# Step keys understood by this runner: name -> (types, required)
+SCHEMA = {
+    "script":          (str, True),
+    "venv":            (str, False),
+    "args":            (list, False),
+    "env":             (dict, False),
+    "retries":         (int, False),
+    "interval":        ((int, float), False),
+    "expected_status": (str, False),
+    "warm":            (bool, False),
+    "preload":         (list, False),
+    "limits":          (dict, False),
+}
+
+ATTEMPTS_TOTAL = metrics.Counter("orq_python_attempts_total", "Script attempts", ("mode",))
+WARM_WAIT_SECONDS = metrics.Histogram(
+    "orq_python_warm_wait_seconds", "Time to get a warm interpreter from the pool",
+    buckets=(0.001, 0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10),
+)
+
+# Idle warm interpreters kept per (python, script folder, preload) pool
+WARM_POOL_SIZE = 2
+
+_WORKER = Path(__file__).with_name("warm_worker.py")
+
+
+class _WarmWorker:
+    """
+    One pre-started fork-server interpreter (see warm_worker.py).
+    """
+
+    def __init__(self, python_exe: str, cwd: str, preload: tuple):
+        self.proc = subprocess.Popen(
+            [python_exe, str(_WORKER), *preload],
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        self.ready = json.loads(self.proc.stdout.readline() or "{}")
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None and self.ready.get("ready", False)
+
+    def run(self, job: dict, ctx=None) -> dict:
+        """
+        Execute one job; the forked child's process group is killed if the
+        context says the step must stop.
+        """
+        self.proc.stdin.write(json.dumps(job) + "\n")
+        self.proc.stdin.flush()
+        started = self.proc.stdout.readline()
+        if not started:
+            raise RuntimeError("warm interpreter died")
+        pid = json.loads(started)["pid"]
+        watchdog = Watchdog(ctx, lambda sig: os.killpg(pid, sig)) if ctx is not None else None
+        try:
+            line = self.proc.stdout.readline()
+        finally:
+            if watchdog is not None:
+                watchdog.finish()
+        if not line:
+            raise RuntimeError("warm interpreter died")
+        status = json.loads(line)
+        if watchdog is not None and watchdog.reason:
+            status["killed"] = watchdog.reason
+        return status
+
+    def close(self) -> None:
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait()
+
+
+class _WarmPool:
+    def __init__(self, python_exe: str, cwd: str, preload: tuple):
+        self.args = (python_exe, cwd, preload)
+        self.idle: queue.Queue = queue.Queue()
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Pre-start the idle workers (once). Only callers of this pool wait
+        while the preload imports run.
+        """
+        with self._start_lock:
+            if self._started:
+                return
+            workers = [_WarmWorker(*self.args) for _ in range(WARM_POOL_SIZE)]
+            for worker in workers:
+                self.idle.put(worker)
+            failed = workers[0].ready.get("failed") if workers else None
+            if failed:
+                log.warning("warm pool %s (%s): preload failed: %s",
+                            self.args[0], self.args[1], "; ".join(failed))
+            self._started = True
+
+    def acquire(self) -> _WarmWorker:
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                return _WarmWorker(*self.args)  # burst beyond the pool
+            if worker.alive():
+                return worker
+            worker.close()
+
+    def release(self, worker: _WarmWorker) -> None:
+        if worker.alive() and self.idle.qsize() < WARM_POOL_SIZE:
+            self.idle.put(worker)
+        else:
+            worker.close()
+
+
+_pools: dict[tuple, _WarmPool] = {}
+_pools_lock = threading.Lock()
+
+def _pool_for(python_exe: str, cwd: str, preload: tuple) -> _WarmPool:
+    key = (python_exe, cwd, preload)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = _WarmPool(*key)
+    pool.start()  # outside _pools_lock: other venvs don't wait for this one
+    return pool
+
+def _follow(path: Path, stream: str, ctx, done: threading.Event, tail: deque) -> None:
+    """
+    Tail a spool file the forked child writes, forwarding complete lines.
+    """
+    while not path.exists() and not done.is_set():
+        time.sleep(0.05)
+    if not path.exists():
+        return
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        partial = ""
+        while True:
+            chunk = f.readline()
+            if chunk:
+                partial += chunk
+                if partial.endswith("\n"):
+                    tail.append(partial)
+                    if ctx is not None:
+                        ctx.emit(stream, partial)
+                    partial = ""
+            elif done.is_set():
+                if partial:
+                    tail.append(partial)
+                    if ctx is not None:
+                        ctx.emit(stream, partial)
+                return
+            else:
+                time.sleep(0.1)
+
+def _run_warm(python_exe, script_path, args, step, ctx, label) -> dict:
+    """
+    run_process equivalent that executes the script in a forked child of a
+    pre-started interpreter instead of cold-starting Python.
+    """
+    preload = tuple(step.get("preload", []))
+    pool = _pool_for(str(python_exe), str(script_path.parent), preload)
+
+    paths = {}
+    for stream in ("out", "err"):
+        path = ctx.spool_path(label, stream) if ctx is not None else None
+        if path is None:
+            fd, name = tempfile.mkstemp(suffix=f".{stream}.log")
+            os.close(fd)
+            path = Path(name)
+        paths[stream] = path
+
+    tails = {"out": deque(maxlen=TAIL_LINES), "err": deque(maxlen=TAIL_LINES)}
+    done = threading.Event()
+    followers = [
+        threading.Thread(target=_follow, args=(paths[s], s, ctx, done, tails[s]), daemon=True)
+        for s in ("out", "err")
+    ]
+    for t in followers:
+        t.start()
+
+    with metrics.span("warm process", label=label) as span:
+        with WARM_WAIT_SECONDS.time():
+            worker = pool.acquire()
+        try:
+            status = worker.run({
+                "script": str(script_path),
+                "args":   [str(a) for a in args],
+                "cwd":    str(script_path.parent),
+                "env":    {k: str(v) for k, v in step.get("env", {}).items()},
+                "limits": step.get("limits", {}),
+                "out":    str(paths["out"]),
+                "err":    str(paths["err"]),
+            }, ctx)
+        finally:
+            pool.release(worker)
+            done.set()
+            for t in followers:
+                t.join()
+        if span is not None:
+            span.attrs.update(code=status["code"], cpu_seconds=status["cpu_seconds"])
+
+    result = {
+        "code": status["code"],
+        "out":  "".join(tails["out"]),
+        "err":  "".join(tails["err"]),
+        "warm": True,
+        "cpu_seconds": status["cpu_seconds"],
+        "max_rss_kb":  status["max_rss_kb"],
+    }
+    if "killed" in status:
+        result["killed"] = status["killed"]
+    if worker.ready.get("failed"):
+        result["preload_failed"] = worker.ready["failed"]
+    if ctx is not None and ctx.spool_dir is not None:
+        result.update(out_file=str(paths["out"]), err_file=str(paths["err"]))
+    else:
+        for path in paths.values():
+            path.unlink(missing_ok=True)
+    return result
+
+def _python_exe(step: dict) -> Path:
+    return venv_python(step.get("venv"))  # system Python without a venv
+
+def toolchain(step: dict) -> str:
+    """
+    Interpreter version, part of the step's result-cache key.
+    """
+    return tool_version(str(_python_exe(step)))
+
+def _pause(ctx, seconds: float) -> str | None:
+    """
+    Wait out the interval between attempts, cut short by the step's
+    cancel or deadline; returns the stop reason if there was one.
+    """
+    if ctx is None:
+        time.sleep(seconds)
+        return None
+    if ctx.deadline is not None:
+        seconds = min(seconds, max(ctx.deadline - time.monotonic(), 0.0))
+    if ctx.stop is not None:
+        ctx.stop.wait(seconds)
+    else:
+        time.sleep(seconds)
+    return ctx.stop_reason()
+
+def execute(step: dict, ctx=None) -> dict:
     script_path = Path(step["script"]).resolve()
     if not script_path.is_file():
         return {"error": f"Script not found: {script_path}"}
 
-    venv_dir = Path(step.get("venv", "")).resolve()
-    if venv_dir.is_dir():
-        if platform.system() == "Windows":
-            python_exe = venv_dir / "Scripts" / "python.exe"
-        else:
-            python_exe = venv_dir / "bin" / "python"
-        if not python_exe.is_file():
-            return {"error": f"Python binary not found in venv: {python_exe}"}
-    else:
-        python_exe = Path("python")  # fallback to system Python
+    python_exe = _python_exe(step)
+    if python_exe.is_absolute() and not python_exe.is_file():
+        return {"error": f"Python binary not found in venv: {python_exe}"}
 
     args = step.get("args", [])
     retries = step.get("retries", 5)
     interval = step.get("interval", 5)
     expected_status = step.get("expected_status")  # e.g. "ready", "success", etc.
+    # warm mode forks from a pre-started interpreter (POSIX only)
+    warm = bool(step.get("warm")) and hasattr(os, "fork")
 
     last_output = None
 
     for attempt in range(1, retries + 1):
+        ATTEMPTS_TOTAL.inc(mode="warm" if warm else "cold")
         try:
-            cmd = [str(python_exe), str(script_path), *args]
-            proc = subprocess.run(cmd, cwd=str(script_path.parent), capture_output=True, text=True)
-            output = proc.stdout.strip()
+            if warm:
+                proc = _run_warm(python_exe, script_path, args, step, ctx, f"attempt{attempt}")
+            else:
+                cmd = [str(python_exe), str(script_path), *args]
+                env = step_env(extra=step["env"]) if step.get("env") else None
+                proc = run_process(cmd, cwd=str(script_path.parent), env=env, ctx=ctx, label=f"attempt{attempt}")
+            output = proc["out"].strip()
             last_output = output
+            usage = {k: proc[k] for k in ("warm", "cpu_seconds", "max_rss_kb", "killed", "preload_failed") if k in proc}
+            if "killed" in proc:
+                # timed out or cancelled: no further attempts
+                return {"code": proc["code"] or 1, "response": output, "attempt": attempt, **usage}
 
             # If you're checking for an exact string or JSON key-value
             if expected_status:
@@ -39,20 +303,24 @@ def execute(step: dict) -> dict:
                     return {
                         "code": 0,
                         "response": output,
-                        "attempt": attempt
+                        "attempt": attempt,
+                        **usage
                     }
             else:
                 # No specific check, just return if success
                 return {
-                    "code": proc.returncode,
+                    "code": proc["code"],
                     "response": output,
-                    "attempt": attempt
+                    "attempt": attempt,
+                    **usage
                 }
         except Exception as e:
             last_output = str(e)
 
         if attempt < retries:
-            time.sleep(interval)
+            reason = _pause(ctx, interval)
+            if reason:
+                return {"code": 1, "response": last_output, "attempt": attempt, "killed": reason}
 
     return {
         "error": "All retries exhausted",
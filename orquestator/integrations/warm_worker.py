@@ -0,0 +1,120 @@
+"""
+Fork-server used by python_runner's warm mode. Started with a venv's own
+interpreter, so it may only use the standard library.
+
+    python warm_worker.py <preload-module> ...
+
+It imports the preload modules once, prints a ready line, then reads one
+JSON job per stdin line:
+
+    {"script", "args", "cwd", "env", "limits", "out", "err"}
+
+For each job it forks; the child starts its own process group, redirects
+stdout/stderr to the given files, applies argv/env/cwd and resource
+limits and runs the script as __main__. The parent first answers with
+the child's pid (so the caller can kill that group on a timeout), then
+waits and answers with the outcome:
+
+    {"pid"}
+    {"code", "cpu_seconds", "max_rss_kb"}
+"""
+
+import importlib
+import json
+import os
+import runpy
+import sys
+import traceback
+
+
+def _child(job: dict, channel_fd: int) -> None:
+    code = 1
+    try:
+        os.close(channel_fd)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        for fd, path in ((1, job["out"]), (2, job["err"])):
+            target = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.dup2(target, fd)
+            os.close(target)
+
+        os.setpgrp()
+        os.chdir(job["cwd"])
+        os.environ.update(job.get("env", {}))
+        limits = job.get("limits", {})
+        if limits:
+            import resource
+            if limits.get("cpu_seconds"):
+                secs = int(limits["cpu_seconds"])
+                resource.setrlimit(resource.RLIMIT_CPU, (secs, secs))
+            if limits.get("memory_mb"):
+                size = int(limits["memory_mb"]) * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_AS, (size, size))
+
+        code = _run_script(job)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _run_script(job: dict) -> int:
+    sys.argv = [job["script"], *job.get("args", [])]
+    sys.path[0] = os.path.dirname(job["script"])
+    try:
+        runpy.run_path(job["script"], run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+
+
+def main() -> None:
+    channel = os.fdopen(os.dup(1), "w", buffering=1)
+    # anything the preloads print must not corrupt the protocol channel
+    os.dup2(2, 1)
+
+    # started from the script's folder, so its sibling modules resolve
+    sys.path[0] = os.getcwd()
+    loaded, failed = [], []
+    for name in sys.argv[1:]:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception as e:
+            failed.append(f"{name}: {e}")
+    channel.write(json.dumps({"ready": True, "preloaded": loaded, "failed": failed}) + "\n")
+
+    for line in sys.stdin:
+        job = json.loads(line)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            _child(job, channel.fileno())
+        try:
+            os.setpgid(pid, pid)  # also done by the child; whichever runs first
+        except OSError:
+            pass
+        channel.write(json.dumps({"pid": pid}) + "\n")
+        _, status, usage = os.wait4(pid, 0)
+        channel.write(json.dumps({
+            "code":        os.waitstatus_to_exitcode(status),
+            "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+            "max_rss_kb":  usage.ru_maxrss,
+        }) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import itertools
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+import metrics
+from integrations.process import StepContext
+
+# Items a matrix step may expand to
+MATRIX_MAX_ITEMS = 1000
+
+# Items of one matrix step running at once unless it sets "matrix_parallel"
+# (step type limits still apply on top)
+MATRIX_PARALLEL = 4
+
+# Lines of each item's stdout/stderr kept in the aggregated result
+MATRIX_ITEM_TAIL_LINES = 20
+
+ITEMS_TOTAL = metrics.Counter("orq_matrix_items_total", "Matrix items run, by outcome", ("type", "result"))
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+# matrix keys stripped from every child step
+_MATRIX_KEYS = ("matrix", "matrix_parallel", "fail_fast")
+
+
+def _values(name: str, spec, read_files: bool) -> list:
+    if isinstance(spec, list):
+        return spec
+    if isinstance(spec, dict) and set(spec) == {"range"}:
+        bounds = spec["range"]
+        if not (isinstance(bounds, list) and 1 <= len(bounds) <= 3 and all(isinstance(b, int) for b in bounds)):
+            raise ValueError(f"'{name}': range must be [stop], [start, stop] or [start, stop, step] integers")
+        return list(range(*bounds))
+    if isinstance(spec, dict) and set(spec) == {"file"}:
+        if not isinstance(spec["file"], str):
+            raise ValueError(f"'{name}': file must be a path")
+        if not read_files:
+            return [spec["file"]]
+        # one value per non-empty line, read when the step starts
+        lines = Path(spec["file"]).read_text(encoding="utf-8").splitlines()
+        return [line.strip() for line in lines if line.strip()]
+    raise ValueError(f"'{name}': expected a list, {{\"range\": [...]}} or {{\"file\": path}}")
+
+def expand(matrix, read_files: bool = True) -> list[dict]:
+    """
+    Parameter sets of a step's `matrix`: either an explicit list of objects
+    or an object mapping each parameter to its values (a list, a range or a
+    file of lines), expanded to their cross product.
+    """
+    if isinstance(matrix, list):
+        if not all(isinstance(item, dict) for item in matrix):
+            raise ValueError("a matrix list must hold objects")
+        items = matrix
+    elif isinstance(matrix, dict) and matrix:
+        names = list(matrix)
+        columns = [_values(name, matrix[name], read_files) for name in names]
+        if len(columns) == 1:
+            items = [{names[0]: v} for v in columns[0]]
+        else:
+            items = [dict(zip(names, combo)) for combo in itertools.product(*columns)]
+    else:
+        raise ValueError("matrix must be a non-empty list or object")
+    if not items:
+        raise ValueError("matrix expands to no items")
+    if len(items) > MATRIX_MAX_ITEMS:
+        raise ValueError(f"matrix expands to {len(items)} items (limit {MATRIX_MAX_ITEMS})")
+    return items
+
+def validate(step: dict, where: str) -> list[str]:
+    """
+    Shape checks for the matrix keys of a step. File-backed values are
+    only read when the step runs.
+    """
+    problems = []
+    try:
+        expand(step["matrix"], read_files=False)
+    except ValueError as e:
+        problems.append(f"{where}: {e}")
+    if "matrix_parallel" in step and step["matrix_parallel"] < 1:
+        problems.append(f"{where}: 'matrix_parallel' must be at least 1")
+    return problems
+
+def is_placeholder(value) -> bool:
+    """
+    True for a string that is a single "{name}" (typed by the parameter).
+    """
+    return isinstance(value, str) and _PLACEHOLDER.fullmatch(value) is not None
+
+def render(step: dict, params: dict) -> dict:
+    """
+    The child step for one parameter set: every "{name}" in a string value
+    is replaced by that parameter. A top-level value that is just the
+    placeholder takes the parameter's own type; inside lists and objects
+    (args, env...) it stays a string. Unknown placeholders are left alone.
+    """
+    def sub(value):
+        if isinstance(value, str):
+            return _PLACEHOLDER.sub(lambda m: str(params.get(m.group(1), m.group(0))), value)
+        if isinstance(value, list):
+            return [sub(v) for v in value]
+        if isinstance(value, dict):
+            return {k: sub(v) for k, v in value.items()}
+        return value
+
+    child = {}
+    for key, value in step.items():
+        if key in _MATRIX_KEYS:
+            continue
+        whole = _PLACEHOLDER.fullmatch(value) if isinstance(value, str) else None
+        child[key] = params[whole.group(1)] if whole and whole.group(1) in params else sub(value)
+    return child
+
+def _label(params: dict) -> str:
+    return " ".join(f"{k}={v}" for k, v in params.items())
+
+def _tail(text: str | None) -> str:
+    lines = (text or "").splitlines(keepends=True)
+    return "".join(lines[-MATRIX_ITEM_TAIL_LINES:])
+
+def run(step: dict, ctx: StepContext, execute) -> dict:
+    """
+    Run a matrix step: one `execute(child_step, child_ctx)` per parameter
+    set, at most `matrix_parallel` at a time. With "fail_fast" no new items
+    start after the first failure (running ones finish); otherwise every
+    item runs. Returns one result with per-item outcomes and timings.
+    """
+    ctx = ctx or StepContext()
+    started = time.monotonic()
+    try:
+        items = expand(step["matrix"])
+    except (ValueError, OSError) as e:
+        return {"code": 1, "error": f"matrix: {e}"}
+    cap = min(step.get("matrix_parallel", MATRIX_PARALLEL), len(items))
+    fail_fast = step.get("fail_fast", False)
+
+    outcomes: list[dict | None] = [None] * len(items)
+    failed = threading.Event()
+
+    def one(n: int) -> dict:
+        params = items[n]
+        item_started = time.monotonic()
+        result = execute(render(step, params), ctx.item(n))
+        outcome = {
+            "params":  params,
+            "code":    result.get("code", 1),
+            "seconds": round(time.monotonic() - item_started, 3),
+        }
+        for key in ("out", "err"):
+            if result.get(key):
+                outcome[key] = _tail(result[key])
+        for key in ("error", "killed"):
+            if key in result:
+                outcome[key] = result[key]
+        if outcome["code"] != 0:
+            failed.set()
+        ITEMS_TOTAL.inc(type=step["type"], result="ok" if outcome["code"] == 0 else "failed")
+        return outcome
+
+    with ThreadPoolExecutor(max_workers=cap) as pool:
+        pending = iter(range(len(items)))
+        running = {}
+        while True:
+            while len(running) < cap and not (fail_fast and failed.is_set()) and not ctx.stop_reason():
+                n = next(pending, None)
+                if n is None:
+                    break
+                running[pool.submit(one, n)] = n
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                outcomes[running.pop(fut)] = fut.result()
+
+    passed = sum(1 for o in outcomes if o is not None and o["code"] == 0)
+    ran = sum(1 for o in outcomes if o is not None)
+    summary = []
+    for params, outcome in zip(items, outcomes):
+        if outcome is None:
+            summary.append(f"[skipped] {_label(params)}\n")
+        else:
+            state = "ok" if outcome["code"] == 0 else f"exit {outcome['code']}"
+            summary.append(f"[{state}] {_label(params)} ({outcome['seconds']}s)\n")
+
+    result = {
+        "code":   0 if passed == len(items) else 1,
+        "out":    "".join(summary),
+        "matrix": {
+            "total":   len(items),
+            "passed":  passed,
+            "failed":  ran - passed,
+            "skipped": len(items) - ran,
+            "seconds": round(time.monotonic() - started, 3),
+        },
+        "items":  [o if o is not None else {"params": p, "skipped": True} for p, o in zip(items, outcomes)],
+    }
+    killed = next((o["killed"] for o in outcomes if o is not None and "killed" in o), None)
+    if killed or (ran < len(items) and ctx.stop_reason()):
+        result["killed"] = killed or ctx.stop_reason()
+    return result
@@ -0,0 +1,207 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Default histogram buckets (seconds): sub-millisecond store writes up to
+# hour-long Cypress suites
+DEFAULT_BUCKETS = (0.001, 0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+_registry: list = []
+_registry_lock = threading.Lock()
+
+
+def _labels_key(labelnames: tuple, labels: dict) -> tuple:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def _format_labels(pairs) -> str:
+    pairs = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+             for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic count per label set, e.g. runs finished per workflow/status.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, zip(self.labelnames, key), value
+
+
+class Histogram:
+    """
+    Observations bucketed per label set, exposed as Prometheus cumulative
+    `_bucket`, `_sum` and `_count` series.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels_key(self.labelnames, labels)
+        with self._lock:
+            row = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for key, row in items:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                yield f"{self.name}_bucket", labels + [("le", repr(float(bound)))], cumulative
+            yield f"{self.name}_bucket", labels + [("le", "+Inf")], row[-1]
+            yield f"{self.name}_sum", labels, row[-2]
+            yield f"{self.name}_count", labels, row[-1]
+
+
+class Gauge:
+    """
+    Current value read from `fn` at scrape time, e.g. queue length.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn):
+        self.name = name
+        self.help = help
+        self._fn = fn
+        with _registry_lock:
+            _registry.append(self)
+
+    def samples(self):
+        yield self.name, (), self._fn()
+
+
+def render() -> str:
+    """
+    Every registered metric in the Prometheus text exposition format.
+    """
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(list(labels))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------------------------------------------------- spans
+
+class Span:
+    """
+    One timed section of a run; children are nested sections. Stored with
+    the run as {"name", "start", "seconds", "attrs", "children"}.
+    """
+
+    def __init__(self, name: str, start: float | None = None, **attrs):
+        self.name = name
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.attrs = attrs
+        self.children: list[Span] = []
+        self._lock = threading.Lock()
+
+    def child(self, name: str, start: float | None = None, **attrs) -> "Span":
+        span = Span(name, start, **attrs)
+        with self._lock:
+            self.children.append(span)
+        return span
+
+    def finish(self, end: float | None = None) -> None:
+        if self.end is None:
+            self.end = time.time() if end is None else end
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            children = list(self.children)
+        end = self.end if self.end is not None else time.time()
+        return {
+            "name":     self.name,
+            "start":    round(self.start, 6),
+            "seconds":  round(end - self.start, 6),
+            "attrs":    self.attrs,
+            "children": [c.to_dict() for c in children],
+        }
+
+
+_local = threading.local()
+
+def current_span() -> Span | None:
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+@contextmanager
+def activate(span: Span | None):
+    """
+    Make `span` the parent for span() calls in this thread, e.g. in a pool
+    thread working on behalf of a step.
+    """
+    stack = _local.__dict__.setdefault("stack", [])
+    stack.append(span)
+    try:
+        yield span
+    finally:
+        stack.pop()
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time a section as a child of the current span. Without an active span
+    (e.g. a runner called outside a run) the section is not recorded.
+    """
+    parent = current_span()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, **attrs)
+    with activate(child):
+        try:
+            yield child
+        finally:
+            child.finish()
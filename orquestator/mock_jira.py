@@ -0,0 +1,97 @@
+"""
+Local stand-in for the Jira REST API, for trying jira steps offline.
+
+    python mock_jira.py [--port 8089] [--latency 0.2] [--fail-rate 0.3]
+
+Point a step's "jira_url" at http://localhost:8089/rest/api/2. Every
+POST .../issue/<key>/comment is accepted with 201 (after --latency
+seconds, or a 503 for a --fail-rate share of requests) and kept in memory.
+GET /comments lists what was received, GET /comments/<key> one issue.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockJira(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, fail_rate: float = 0.0):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.comments: dict[str, list] = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: MockJira
+
+    def _reply(self, code: int, body) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        parts = self.path.rstrip("/").split("/")
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        if len(parts) < 3 or parts[-1] != "comment" or parts[-3] != "issue":
+            return self._reply(404, {"errorMessages": ["Not found"]})
+        if not self.headers.get("Authorization"):
+            return self._reply(401, {"errorMessages": ["Authentication required"]})
+        try:
+            body = json.loads(raw)["body"]
+        except (ValueError, KeyError, TypeError):
+            return self._reply(400, {"errorMessages": ["Comment body is required"]})
+
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+            if random.random() < self.server.fail_rate:
+                return self._reply(503, {"errorMessages": ["Service unavailable (mock)"]})
+            comments = self.server.comments.setdefault(parts[-2], [])
+            comment = {"id": str(sum(map(len, self.server.comments.values())) + 1), "body": body}
+            comments.append(comment)
+        self._reply(201, comment)
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        with self.server.lock:
+            if parts == ["comments"]:
+                return self._reply(200, {"requests": self.server.requests, "comments": self.server.comments})
+            if len(parts) == 2 and parts[0] == "comments":
+                return self._reply(200, self.server.comments.get(parts[1], []))
+        self._reply(404, {"errorMessages": ["Not found"]})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = 8089, latency: float = 0.0, fail_rate: float = 0.0) -> MockJira:
+    """
+    Start the mock in a background thread and return it (call .shutdown()).
+    """
+    server = MockJira(("127.0.0.1", port), latency, fail_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per comment")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered 503")
+    args = parser.parse_args()
+
+    server = MockJira(("127.0.0.1", args.port), args.latency, args.fail_rate)
+    print(f"[+] Mock Jira at http://localhost:{args.port}/rest/api/2")
+    server.serve_forever()
@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+import metrics
+from compiler import get_runner
+from persistence import record_delivery
+
+log = logging.getLogger(__name__)
+
+# Notifications waiting to be delivered, kept across restarts
+OUTBOX_DB = Path(os.getenv("ORQ_OUTBOX", Path(__file__).parent / "runs" / "outbox.db"))
+
+# Messages for the same target queued within this window go out together
+OUTBOX_COALESCE_SECONDS = 5.0
+
+# Retry schedule: BASE * 2^(attempt-1) seconds (+/- JITTER), capped at MAX;
+# an item is given up on after MAX_ATTEMPTS
+OUTBOX_BACKOFF_BASE = 2.0
+OUTBOX_BACKOFF_MAX = 300.0
+OUTBOX_BACKOFF_JITTER = 0.2
+OUTBOX_MAX_ATTEMPTS = 8
+
+# Per-request timeout of the shared delivery session
+OUTBOX_TIMEOUT = 15.0
+
+DELIVERIES_TOTAL = metrics.Counter(
+    "orq_outbox_deliveries_total", "Outbox delivery attempts by outcome", ("channel", "result"),
+)
+DELIVERY_SECONDS = metrics.Histogram(
+    "orq_outbox_delivery_seconds", "Outbox delivery latency", ("channel",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 15),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel    TEXT    NOT NULL,
+    target     TEXT    NOT NULL,
+    payload    TEXT    NOT NULL,
+    run_id     TEXT,
+    idx        INTEGER,
+    status     TEXT    NOT NULL DEFAULT 'pending',
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    next_at    REAL    NOT NULL,
+    created_at TEXT    NOT NULL,
+    error      TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_at);
+"""
+
+_local = threading.local()
+_wake = threading.Event()
+_worker_lock = threading.Lock()
+_worker: threading.Thread | None = None
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        OUTBOX_DB.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(OUTBOX_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+def enqueue(channel: str, target: str, payload: dict,
+            run_id: str | None = None, idx: int | None = None) -> int:
+    """
+    Queue one message for `channel` (a step type whose runner defines
+    `deliver`). Messages with the same channel+target that are still
+    pending are delivered together. Returns the outbox id.
+    """
+    conn = _conn()
+    with conn:
+        row = conn.execute(
+            "SELECT MIN(next_at) FROM outbox WHERE status = 'pending' AND channel = ? AND target = ?",
+            (channel, target),
+        ).fetchone()
+        # join a group that is already waiting, otherwise open a new window
+        next_at = row[0] if row[0] is not None else time.time() + OUTBOX_COALESCE_SECONDS
+        item_id = conn.execute(
+            "INSERT INTO outbox (channel, target, payload, run_id, idx, next_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (channel, target, json.dumps(payload), run_id, idx, next_at, datetime.now().isoformat()),
+        ).lastrowid
+    _record(run_id, idx, {"status": "queued", "id": item_id})
+    start()
+    _wake.set()
+    return item_id
+
+def items(run_id: str | None = None, status: str | None = None, limit: int = 100) -> list[dict]:
+    """
+    Outbox entries, newest first (payloads left out).
+    """
+    where, params = [], []
+    for clause, value in (("run_id = ?", run_id), ("status = ?", status)):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+    sql = "SELECT id, channel, target, run_id, idx, status, attempts, next_at, created_at, error FROM outbox"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    keys = ("id", "channel", "target", "run_id", "idx", "status", "attempts", "next_at", "created_at", "error")
+    return [dict(zip(keys, r)) for r in _conn().execute(sql, (*params, limit))]
+
+def pending() -> int:
+    return _conn().execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+
+def _record(run_id, idx, delivery: dict) -> None:
+    if run_id is None or idx is None:
+        return
+    try:
+        record_delivery(run_id, idx, delivery)
+    except (OSError, KeyError, IndexError, TypeError):
+        pass  # the run is gone; the outbox row still has the outcome
+
+def _backoff(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+    return delay * (1 + random.uniform(-OUTBOX_BACKOFF_JITTER, OUTBOX_BACKOFF_JITTER))
+
+def _permanent(error: Exception) -> bool:
+    """
+    Client errors other than 408/429 won't succeed on a retry.
+    """
+    response = getattr(error, "response", None)
+    code = getattr(response, "status_code", None)
+    return code is not None and 400 <= code < 500 and code not in (408, 429)
+
+def _next_group(conn) -> tuple[list, float | None]:
+    """
+    Rows of the most overdue channel+target group, or ([], seconds until
+    the next one is due).
+    """
+    now = time.time()
+    row = conn.execute(
+        "SELECT channel, target, next_at FROM outbox WHERE status = 'pending' "
+        "ORDER BY next_at LIMIT 1"
+    ).fetchone()
+    if row is None:
+        return [], None
+    channel, target, next_at = row
+    if next_at > now:
+        return [], next_at - now
+    rows = conn.execute(
+        "SELECT id, payload, run_id, idx, attempts FROM outbox "
+        "WHERE status = 'pending' AND channel = ? AND target = ? AND next_at <= ? ORDER BY id",
+        (channel, target, now),
+    ).fetchall()
+    return [(channel, *r) for r in rows], 0.0
+
+def _deliver(conn, client: httpx.Client, group: list) -> None:
+    channel = group[0][0]
+    ids = [r[1] for r in group]
+    payloads = [json.loads(r[2]) for r in group]
+    attempts = max(r[5] for r in group) + 1
+    started = time.monotonic()
+    try:
+        get_runner(channel).deliver(client, payloads)
+    except Exception as e:
+        DELIVERY_SECONDS.observe(time.monotonic() - started, channel=channel)
+        give_up = attempts >= OUTBOX_MAX_ATTEMPTS or _permanent(e)
+        status = "failed" if give_up else "pending"
+        DELIVERIES_TOTAL.inc(channel=channel, result=status if give_up else "retry")
+        next_at = time.time() + _backoff(attempts)
+        with conn:
+            conn.executemany(
+                "UPDATE outbox SET status = ?, attempts = ?, next_at = ?, error = ? WHERE id = ?",
+                [(status, attempts, next_at, str(e), i) for i in ids],
+            )
+        delivery = {"status": "failed" if give_up else "retrying", "attempts": attempts, "error": str(e)}
+        if not give_up:
+            delivery["next_attempt"] = datetime.fromtimestamp(next_at).isoformat()
+    else:
+        DELIVERY_SECONDS.observe(time.monotonic() - started, channel=channel)
+        DELIVERIES_TOTAL.inc(channel=channel, result="delivered")
+        with conn:
+            conn.executemany(
+                "UPDATE outbox SET status = 'delivered', attempts = ?, error = NULL WHERE id = ?",
+                [(attempts, i) for i in ids],
+            )
+        delivery = {"status": "delivered", "attempts": attempts, "delivered_at": datetime.now().isoformat(),
+                    "coalesced": len(ids)}
+    for _, item_id, _, run_id, idx, _ in group:
+        _record(run_id, idx, {**delivery, "id": item_id})
+
+def _run() -> None:
+    # rows only change after an attempt, so anything a crash interrupted is
+    # still pending and simply gets delivered again
+    conn = _conn()
+    with httpx.Client(timeout=OUTBOX_TIMEOUT) as client:
+        while True:
+            _wake.clear()
+            try:
+                group, wait = _next_group(conn)
+                if group:
+                    _deliver(conn, client, group)
+                    continue
+            except sqlite3.Error:
+                log.exception("outbox worker")
+                wait = 5.0
+            _wake.wait(wait)
+
+def start() -> None:
+    """
+    Start the background delivery worker (once per process).
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="outbox", daemon=True)
+            _worker.start()
+
+metrics.Gauge("orq_outbox_pending", "Outbox messages waiting for delivery", pending)
@@ -1,33 +1,710 @@
 import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
 from pathlib import Path
-from threading import Lock
+
+import archive
+import metrics
+
+log = logging.getLogger(__name__)
 
 # Directory for run‑state files
 _STATE_DIR = Path(__file__).parent / "runs"
 _STATE_DIR.mkdir(exist_ok=True)
 
-# In‑process locks to avoid concurrent writes
-_locks: dict[str, Lock] = {}
+# Which backend keeps run state: "json" (one file per run) or "sqlite"
+RUN_STORE = os.getenv("ORQ_RUN_STORE", "json")
 
-def _lock_for(run_id: str) -> Lock:
-    if run_id not in _locks:
-        _locks[run_id] = Lock()
-    return _locks[run_id]
+# JSON store: fold the journal into the snapshot every N events
+COMPACT_EVERY = 50
 
-def save_run(run_id: str, data: dict) -> None:
+# Characters of live output kept per step stream in the run document
+OUTPUT_TAIL_CHARS = 16_384
+
+# Statuses after which a run no longer changes
+FINISHED = {"completed", "failed", "rejected", "cancelled"}
+
+# Retention: finished runs older than RETAIN_DAYS, or beyond the newest
+# RETAIN_RUNS of their workflow, are moved to the archive (archive.py) by a
+# background compactor. A workflow can set its own "retention":
+# {"days": ..., "runs": ...}.
+RETAIN_DAYS = float(os.getenv("ORQ_RETAIN_DAYS", 30))
+RETAIN_RUNS = int(os.getenv("ORQ_RETAIN_RUNS", 500))
+
+# Runs updated more recently than this stay in the store (late outbox
+# deliveries are still recorded on them)
+ARCHIVE_MIN_IDLE_SECONDS = 3600
+
+# Seconds between compactor passes
+COMPACTOR_INTERVAL_SECONDS = 600
+
+# Keys the orchestrator adds to a run's steps while executing them (never
+# part of a workflow definition)
+STEP_RUNTIME_KEYS = {"started_at", "ended_at", "tail", "cached", "delivery", "interrupted_at", "reused_from"}
+
+STORE_WRITE_SECONDS = metrics.Histogram(
+    "orq_store_write_seconds", "Run store write latency", ("store", "op"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+
+# In‑process locks to avoid concurrent writes; a run's lock only lives
+# while some thread holds a reference to it
+_locks: weakref.WeakValueDictionary[str, threading.RLock] = weakref.WeakValueDictionary()
+_locks_guard = threading.Lock()
+
+def _lock_for(run_id: str) -> threading.RLock:
+    with _locks_guard:
+        lock = _locks.get(run_id)
+        if lock is None:
+            lock = _locks[run_id] = threading.RLock()
+        return lock
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+class RunStore:
     """
-    Persist run state to runs/<run_id>.json
+    Interface every run-state backend implements.
+
+    A run document looks like:
+      {"id", "name", "status", "created_at", "updated_at", "steps": [...],
+       "states": [...], "current": [...], "log": [...], ...}
+    `load_run` raises FileNotFoundError for unknown runs.
     """
-    path = _STATE_DIR / f"{run_id}.json"
-    with _lock_for(run_id):
-        with open(path, "w") as f:
+
+    def save_run(self, run_id: str, data: dict) -> None:
+        raise NotImplementedError
+
+    def load_run(self, run_id: str) -> dict:
+        raise NotImplementedError
+
+    def append_event(self, run_id: str, event: dict) -> int:
+        """
+        Record one state-change event and return the run's new version
+        (`seq`). Events are the only way a run changes after creation.
+        """
+        raise NotImplementedError
+
+    def list_runs(self, name: str | None = None, status: str | None = None,
+                  since: str | None = None, until: str | None = None,
+                  limit: int = 50, offset: int = 0) -> list[dict]:
+        """
+        Run summaries (no steps/log), newest first, filtered by workflow
+        name, status and created_at range (ISO timestamps, inclusive).
+        """
+        raise NotImplementedError
+
+    def version(self, run_id: str) -> int:
+        """
+        The run's current `seq`, without materializing the whole document
+        where the backend allows it.
+        """
+        return self.load_run(run_id)["seq"]
+
+    def load_fields(self, run_id: str, fields: set) -> dict:
+        """
+        Only the given top-level keys of the run (missing ones are left out).
+        """
+        run = self.load_run(run_id)
+        return {k: v for k, v in run.items() if k in fields}
+
+    def read_log(self, run_id: str, step: str | None = None,
+                 offset: int = 0, limit: int = 100) -> tuple[int, list]:
+        """
+        (total, entries): up to `limit` log entries from `offset`, optionally
+        only those of one step. A negative offset counts from the end.
+        """
+        log = self.load_run(run_id)["log"]
+        if step is not None:
+            log = [e for e in log if e.get("step") == step]
+        start = max(len(log) + offset, 0) if offset < 0 else offset
+        return len(log), log[start:start + limit]
+
+    def delete_run(self, run_id: str) -> None:
+        """
+        Remove the run (no error if it is already gone).
+        """
+        raise NotImplementedError
+
+
+def apply_event(run: dict, event: dict) -> None:
+    """
+    Fold one journal event into a materialized run document.
+    """
+    kind = event["type"]
+    if kind == "status":
+        run["status"] = event["status"]
+    elif kind == "step":
+        idx = event["idx"]
+        run["states"][idx] = event["state"]
+        run["steps"][idx].update(event.get("fields", {}))
+        run["current"] = [i for i, s in enumerate(run["states"]) if s == "running"]
+        if "log" in event:
+            run["log"].append(event["log"])
+    elif kind == "trace":
+        run["trace"] = event["trace"]
+    elif kind == "delivery":
+        run["steps"][event["idx"]]["delivery"] = event["delivery"]
+    elif kind == "output":
+        tail = run["steps"][event["idx"]].setdefault("tail", {})
+        text = tail.get(event["stream"], "") + event["data"]
+        tail[event["stream"]] = text[-OUTPUT_TAIL_CHARS:]
+    run["seq"] = event["seq"]
+    run["updated_at"] = event["at"]
+
+
+class JsonFileStore(RunStore):
+    """
+    Per run, a runs/<run_id>.json snapshot plus an append-only
+    runs/<run_id>.jsonl journal of the events since. Each transition is one
+    appended line; every COMPACT_EVERY events (and when the run finishes)
+    the journal is folded into a fresh snapshot and truncated.
+    """
+
+    def __init__(self, directory: Path):
+        self._dir = directory
+        self._seq: dict[str, int] = {}       # last journaled seq per run
+        self._pending: dict[str, int] = {}   # events since last snapshot
+        # run_id -> (file stamps, summary): list_runs only re-reads runs
+        # whose snapshot or journal changed since it last looked
+        self._summaries: dict[str, tuple] = {}
+        self._summaries_lock = threading.Lock()
+
+    def _path(self, run_id: str) -> Path:
+        return self._dir / f"{run_id}.json"
+
+    def _journal(self, run_id: str) -> Path:
+        return self._dir / f"{run_id}.jsonl"
+
+    def _write_snapshot(self, run_id: str, data: dict) -> None:
+        tmp = self._path(run_id).with_suffix(".tmp")
+        with open(tmp, "w") as f:
             json.dump(data, f, indent=2)
+        os.replace(tmp, self._path(run_id))
+
+    def _materialize(self, run_id: str) -> tuple[dict, int]:
+        """
+        Snapshot + journal tail; also returns how many events were replayed.
+        """
+        with open(self._path(run_id), "r") as f:
+            run = json.load(f)
+        run.setdefault("seq", 0)
+        replayed = 0
+        journal = self._journal(run_id)
+        if journal.exists():
+            with open(journal, "r") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # torn write from a crash
+                    event = json.loads(line)
+                    # events already folded into the snapshot are skipped
+                    if event["seq"] > run["seq"]:
+                        apply_event(run, event)
+                        replayed += 1
+        return run, replayed
+
+    def _compact(self, run_id: str) -> dict:
+        run, _ = self._materialize(run_id)
+        self._write_snapshot(run_id, run)
+        self._journal(run_id).unlink(missing_ok=True)
+        self._pending[run_id] = 0
+        return run
+
+    def save_run(self, run_id: str, data: dict) -> None:
+        with _lock_for(run_id):
+            data.setdefault("seq", 0)
+            data["updated_at"] = _now()
+            self._write_snapshot(run_id, data)
+            self._journal(run_id).unlink(missing_ok=True)
+            self._seq[run_id] = data["seq"]
+            self._pending[run_id] = 0
+
+    def load_run(self, run_id: str) -> dict:
+        with _lock_for(run_id):
+            return self._materialize(run_id)[0]
+
+    def version(self, run_id):
+        # runs written since startup keep their seq in memory until finished
+        seq = self._seq.get(run_id)
+        return seq if seq is not None else self.load_run(run_id)["seq"]
+
+    def append_event(self, run_id, event):
+        with _lock_for(run_id):
+            if run_id not in self._seq:
+                # first write since startup: start from a clean snapshot so
+                # a torn line left by a crash is never appended after
+                self._seq[run_id] = self._compact(run_id)["seq"]
+            seq = self._seq[run_id] + 1
+            event = {"seq": seq, "at": _now(), **event}
+            with open(self._journal(run_id), "a") as f:
+                f.write(json.dumps(event) + "\n")
+            self._seq[run_id] = seq
+            self._pending[run_id] += 1
+
+            finished = event["type"] == "status" and event["status"] in FINISHED
+            if finished or self._pending[run_id] >= COMPACT_EVERY:
+                self._compact(run_id)
+            if finished:
+                self._seq.pop(run_id, None)
+                self._pending.pop(run_id, None)
+            return seq
+
+    def delete_run(self, run_id):
+        with _lock_for(run_id):
+            self._path(run_id).unlink(missing_ok=True)
+            self._journal(run_id).unlink(missing_ok=True)
+            self._seq.pop(run_id, None)
+            self._pending.pop(run_id, None)
+        with self._summaries_lock:
+            self._summaries.pop(run_id, None)
 
-def load_run(run_id: str) -> dict:
+    def _summary_of(self, run_id: str) -> dict:
+        stamps = []
+        for path in (self._path(run_id), self._journal(run_id)):
+            try:
+                st = path.stat()
+                stamps.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamps.append(None)
+        with self._summaries_lock:
+            hit = self._summaries.get(run_id)
+        if hit is not None and hit[0] == stamps:
+            return hit[1]
+        # stamped before reading: a write in between is picked up next time
+        summary = _summary(self.load_run(run_id))
+        with self._summaries_lock:
+            self._summaries[run_id] = (stamps, summary)
+        return summary
+
+    def list_runs(self, name=None, status=None, since=None, until=None, limit=50, offset=0):
+        # full directory scan, but only changed runs are read: fine for
+        # small installs, use sqlite beyond that
+        found = []
+        for path in self._dir.glob("*.json"):  # snapshots only, not *.jsonl
+            try:
+                summary = self._summary_of(path.stem)
+            except (OSError, ValueError):
+                continue
+            created = summary["created_at"] or ""
+            if name and summary["name"] != name:
+                continue
+            if status and summary["status"] != status:
+                continue
+            if since and created < since:
+                continue
+            if until and created > until:
+                continue
+            found.append(dict(summary))
+        found.sort(key=lambda r: r["created_at"] or "", reverse=True)
+        return found[offset:offset + limit]
+
+
+def _summary(run: dict) -> dict:
+    return {k: run.get(k) for k in ("id", "name", "status", "created_at", "updated_at")}
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id         TEXT PRIMARY KEY,
+    name       TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    seq        INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    updated_at TEXT,
+    doc        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_name_created   ON runs (name, created_at);
+CREATE INDEX IF NOT EXISTS runs_status_created ON runs (status, created_at);
+CREATE INDEX IF NOT EXISTS runs_created        ON runs (created_at);
+
+CREATE TABLE IF NOT EXISTS steps (
+    run_id TEXT    NOT NULL,
+    idx    INTEGER NOT NULL,
+    name   TEXT    NOT NULL,
+    type   TEXT,
+    state  TEXT    NOT NULL,
+    def    TEXT    NOT NULL,
+    PRIMARY KEY (run_id, idx)
+);
+
+CREATE TABLE IF NOT EXISTS log (
+    run_id TEXT    NOT NULL,
+    seq    INTEGER NOT NULL,
+    step   TEXT,
+    result TEXT    NOT NULL,
+    PRIMARY KEY (run_id, seq)
+);
+"""
+
+# run keys kept in their own tables/columns rather than in runs.doc
+_SPLIT_KEYS = ("steps", "states", "current", "log")
+
+
+class SqliteStore(RunStore):
     """
-    Load run state from runs/<run_id>.json
+    Runs, steps and log entries in indexed tables of one WAL-mode SQLite
+    database. Each event is one transaction touching only the rows it
+    changes (a step row, an appended log row, the run's status/seq).
     """
-    path = _STATE_DIR / f"{run_id}.json"
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save_run(self, run_id, data):
+        doc = {k: v for k, v in data.items() if k not in _SPLIT_KEYS}
+        doc.setdefault("seq", 0)
+        doc["updated_at"] = _now()
+        conn = self._conn()
+        with _lock_for(run_id), conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO runs (id, name, status, seq, created_at, updated_at, doc) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, data["name"], data["status"], doc["seq"], data.get("created_at"),
+                 doc["updated_at"], json.dumps(doc)),
+            )
+            conn.execute("DELETE FROM steps WHERE run_id = ?", (run_id,))
+            conn.executemany(
+                "INSERT INTO steps (run_id, idx, name, type, state, def) VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id, i, s["name"], s.get("type"), data["states"][i], json.dumps(s))
+                 for i, s in enumerate(data["steps"])],
+            )
+            conn.execute("DELETE FROM log WHERE run_id = ?", (run_id,))
+            conn.executemany(
+                "INSERT INTO log (run_id, seq, step, result) VALUES (?, ?, ?, ?)",
+                [(run_id, i, e.get("step"), json.dumps(e)) for i, e in enumerate(data["log"])],
+            )
+
+    def load_run(self, run_id):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT doc, status, seq, updated_at FROM runs WHERE id = ?", (run_id,)
+        ).fetchone()
+        if row is None:
+            raise FileNotFoundError(run_id)
+        run = json.loads(row[0])
+        run["status"], run["seq"], run["updated_at"] = row[1:]
+        steps = conn.execute(
+            "SELECT state, def FROM steps WHERE run_id = ? ORDER BY idx", (run_id,)
+        ).fetchall()
+        run["steps"] = [json.loads(d) for _, d in steps]
+        run["states"] = [s for s, _ in steps]
+        run["current"] = [i for i, s in enumerate(run["states"]) if s == "running"]
+        run["log"] = [json.loads(r) for (r,) in conn.execute(
+            "SELECT result FROM log WHERE run_id = ? ORDER BY seq", (run_id,)
+        )]
+        return run
+
+    def version(self, run_id):
+        row = self._conn().execute("SELECT seq FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(run_id)
+        return row[0]
+
+    def load_fields(self, run_id, fields):
+        # only touch the steps/log tables when those keys are asked for
+        if fields & {"steps", "states", "current", "log"}:
+            run = self.load_run(run_id)
+        else:
+            row = self._conn().execute(
+                "SELECT doc, status, seq, updated_at FROM runs WHERE id = ?", (run_id,)
+            ).fetchone()
+            if row is None:
+                raise FileNotFoundError(run_id)
+            run = json.loads(row[0])
+            run["status"], run["seq"], run["updated_at"] = row[1:]
+        return {k: v for k, v in run.items() if k in fields}
+
+    def read_log(self, run_id, step=None, offset=0, limit=100):
+        self.version(run_id)  # FileNotFoundError for unknown runs
+        where, params = "run_id = ?", [run_id]
+        if step is not None:
+            where += " AND step = ?"
+            params.append(step)
+        conn = self._conn()
+        (total,) = conn.execute(f"SELECT COUNT(*) FROM log WHERE {where}", params).fetchone()
+        start = max(total + offset, 0) if offset < 0 else offset
+        rows = conn.execute(
+            f"SELECT result FROM log WHERE {where} ORDER BY seq LIMIT ? OFFSET ?",
+            (*params, limit, start),
+        ).fetchall()
+        return total, [json.loads(r) for (r,) in rows]
+
+    def _patch_step(self, conn, run_id, idx, patch) -> None:
+        (raw,) = conn.execute(
+            "SELECT def FROM steps WHERE run_id = ? AND idx = ?", (run_id, idx)
+        ).fetchone()
+        step = json.loads(raw)
+        patch(step)
+        conn.execute(
+            "UPDATE steps SET def = ? WHERE run_id = ? AND idx = ?",
+            (json.dumps(step), run_id, idx),
+        )
+
+    def append_event(self, run_id, event):
+        conn = self._conn()
+        # the same per-run lock as the JSON store: archiving a run
+        # (_archive_run) must not interleave with its writes
+        with _lock_for(run_id), conn:
+            now = _now()
+            bumped = conn.execute(
+                "UPDATE runs SET seq = seq + 1, updated_at = ? WHERE id = ?", (now, run_id)
+            ).rowcount
+            if not bumped:
+                # unknown or already archived; nothing else may be written
+                raise FileNotFoundError(run_id)
+            kind = event["type"]
+            if kind == "status":
+                conn.execute(
+                    "UPDATE runs SET status = ? WHERE id = ?", (event["status"], run_id)
+                )
+            elif kind == "step":
+                conn.execute(
+                    "UPDATE steps SET state = ? WHERE run_id = ? AND idx = ?",
+                    (event["state"], run_id, event["idx"]),
+                )
+                if event.get("fields"):
+                    self._patch_step(conn, run_id, event["idx"],
+                                     lambda step: step.update(event["fields"]))
+                if "log" in event:
+                    log_entry = event["log"]
+                    conn.execute(
+                        "INSERT INTO log (run_id, seq, step, result) "
+                        "SELECT ?, COUNT(*), ?, ? FROM log WHERE run_id = ?",
+                        (run_id, log_entry.get("step"), json.dumps(log_entry), run_id),
+                    )
+            elif kind == "output":
+                def add_output(step):
+                    tail = step.setdefault("tail", {})
+                    text = tail.get(event["stream"], "") + event["data"]
+                    tail[event["stream"]] = text[-OUTPUT_TAIL_CHARS:]
+                self._patch_step(conn, run_id, event["idx"], add_output)
+            elif kind == "delivery":
+                self._patch_step(conn, run_id, event["idx"],
+                                 lambda step: step.update(delivery=event["delivery"]))
+            elif kind == "trace":
+                (raw,) = conn.execute("SELECT doc FROM runs WHERE id = ?", (run_id,)).fetchone()
+                doc = json.loads(raw)
+                doc["trace"] = event["trace"]
+                conn.execute("UPDATE runs SET doc = ? WHERE id = ?", (json.dumps(doc), run_id))
+            (seq,) = conn.execute("SELECT seq FROM runs WHERE id = ?", (run_id,)).fetchone()
+            return seq
+
+    def delete_run(self, run_id):
+        conn = self._conn()
+        with _lock_for(run_id), conn:
+            for table, key in (("runs", "id"), ("steps", "run_id"), ("log", "run_id")):
+                conn.execute(f"DELETE FROM {table} WHERE {key} = ?", (run_id,))
+
+    def list_runs(self, name=None, status=None, since=None, until=None, limit=50, offset=0):
+        where, params = [], []
+        for clause, value in (("name = ?", name), ("status = ?", status),
+                              ("created_at >= ?", since), ("created_at <= ?", until)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        sql = "SELECT id, name, status, created_at, updated_at FROM runs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+        rows = self._conn().execute(sql, (*params, limit, offset)).fetchall()
+        keys = ("id", "name", "status", "created_at", "updated_at")
+        return [dict(zip(keys, r)) for r in rows]
+
+
+def _make_store(kind: str) -> RunStore:
+    if kind == "json":
+        return JsonFileStore(_STATE_DIR)
+    if kind == "sqlite":
+        return SqliteStore(_STATE_DIR / "runs.db")
+    raise ValueError(f"Unknown run store '{kind}' (expected 'json' or 'sqlite')")
+
+_store = _make_store(RUN_STORE)
+_listeners: list = []
+
+def save_run(run_id: str, data: dict) -> None:
+    """
+    Persist the whole run document.
+    """
+    with STORE_WRITE_SECONDS.time(store=RUN_STORE, op="save"):
+        _store.save_run(run_id, data)
+
+def load_run(run_id: str, fields: set | None = None) -> dict:
+    """
+    Load run state (only `fields`, if given), from the archive once the run
+    was compacted; raises FileNotFoundError if the run doesn't exist.
+    """
+    try:
+        if fields is not None:
+            return _store.load_fields(run_id, fields)
+        return _store.load_run(run_id)
+    except FileNotFoundError:
+        run = archive.get(run_id)
+    if fields is not None:
+        return {k: v for k, v in run.items() if k in fields}
+    return run
+
+def run_version(run_id: str) -> int:
+    """
+    Monotonic version of a run: bumped by every recorded event.
+    """
+    try:
+        return _store.version(run_id)
+    except FileNotFoundError:
+        return archive.get(run_id)["seq"]
+
+def read_log(run_id: str, step: str | None = None, offset: int = 0, limit: int = 100) -> tuple[int, list]:
+    """
+    A page of the run log (see RunStore.read_log).
+    """
+    try:
+        return _store.read_log(run_id, step=step, offset=offset, limit=limit)
+    except FileNotFoundError:
+        entries = archive.get(run_id)["log"]
+    if step is not None:
+        entries = [e for e in entries if e.get("step") == step]
+    start = max(len(entries) + offset, 0) if offset < 0 else offset
+    return len(entries), entries[start:start + limit]
+
+def _record(run_id: str, event: dict) -> None:
+    with STORE_WRITE_SECONDS.time(store=RUN_STORE, op=event["type"]):
+        seq = _store.append_event(run_id, event)
+    for listener in _listeners:
+        listener(run_id, {"seq": seq, **event})
+
+def add_listener(fn) -> None:
+    """
+    Call fn(run_id, event) after every recorded event (from the writer's thread).
+    """
+    _listeners.append(fn)
+
+def update_step(run_id: str, idx: int, state: str, log_entry: dict | None = None, **fields) -> None:
+    """
+    Set step `idx` to `state`, merge `fields` into the step and append
+    `log_entry` (if any) to the run log, as a single event.
+    """
+    event = {"type": "step", "idx": idx, "state": state, "fields": fields}
+    if log_entry is not None:
+        event["log"] = log_entry
+    _record(run_id, event)
+
+def set_status(run_id: str, status: str) -> None:
+    """
+    Change the overall run status.
+    """
+    _record(run_id, {"type": "status", "status": status})
+
+def append_output(run_id: str, idx: int, stream: str, data: str) -> None:
+    """
+    Record a chunk of a step's live output (only a bounded tail is kept).
+    """
+    _record(run_id, {"type": "output", "idx": idx, "stream": stream, "data": data})
+
+def record_trace(run_id: str, trace: dict) -> None:
+    """
+    Store the run's span tree (see metrics.Span) under run["trace"].
+    """
+    _record(run_id, {"type": "trace", "trace": trace})
+
+def record_delivery(run_id: str, idx: int, delivery: dict) -> None:
+    """
+    Store the outbox delivery status of step `idx` under its "delivery" key.
+    """
+    _record(run_id, {"type": "delivery", "idx": idx, "delivery": delivery})
+
+def list_runs(limit: int = 50, offset: int = 0, **filters) -> list[dict]:
+    """
+    Filtered run summaries, newest first (see RunStore.list_runs), archived
+    runs included.
+    """
+    live = _store.list_runs(limit=offset + limit, **filters)
+    archived = archive.list_runs(limit=offset + limit, **filters)
+    merged = sorted(live + archived, key=lambda r: r["created_at"] or "", reverse=True)
+    return merged[offset:offset + limit]
+
+def _archive_run(run_id: str) -> bool:
     with _lock_for(run_id):
-        with open(path, "r") as f:
-            return json.load(f)
+        try:
+            run = _store.load_run(run_id)
+        except (OSError, ValueError):
+            return False
+        if run.get("status") not in FINISHED:
+            return False
+        archive.put(run)
+        _store.delete_run(run_id)
+    return True
+
+def compact_runs(policy=None) -> dict:
+    """
+    One retention pass: move finished, idle runs past their workflow's
+    retention into the archive, then drop expired archive segments.
+    `policy(name)` may return the workflow's {"days", "runs"} overrides.
+    Runs still executing are never touched.
+    """
+    started = time.monotonic()
+    now = datetime.now()
+    idle_cutoff = (now - timedelta(seconds=ARCHIVE_MIN_IDLE_SECONDS)).isoformat()
+    by_workflow: dict[str, list] = {}
+    for summary in _store.list_runs(limit=sys.maxsize):  # newest first
+        if summary["status"] in FINISHED:
+            by_workflow.setdefault(summary["name"], []).append(summary)
+
+    archived = 0
+    for name, summaries in by_workflow.items():
+        retention = (policy(name) if policy else None) or {}
+        keep = retention.get("runs", RETAIN_RUNS)
+        cutoff = (now - timedelta(days=retention.get("days", RETAIN_DAYS))).isoformat()
+        for rank, summary in enumerate(summaries):
+            if rank < keep and (summary["created_at"] or "") >= cutoff:
+                continue
+            if (summary["updated_at"] or "") >= idle_cutoff:
+                continue
+            archived += _archive_run(summary["id"])
+    expired = archive.expire()
+    return {"archived": archived, "expired_segments": expired,
+            "seconds": round(time.monotonic() - started, 3)}
+
+_compactor: threading.Thread | None = None
+_compactor_lock = threading.Lock()
+
+def start_compactor(policy=None) -> None:
+    """
+    Run compact_runs(policy) every COMPACTOR_INTERVAL_SECONDS in a
+    background thread (once per process).
+    """
+    global _compactor
+
+    def loop():
+        while True:
+            try:
+                stats = compact_runs(policy)
+                if stats["archived"] or stats["expired_segments"]:
+                    log.info("compactor: %s", stats)
+            except (OSError, ValueError, sqlite3.Error):
+                log.exception("compactor")
+            time.sleep(COMPACTOR_INTERVAL_SECONDS)
+
+    with _compactor_lock:
+        if _compactor is None or not _compactor.is_alive():
+            _compactor = threading.Thread(target=loop, name="compactor", daemon=True)
+            _compactor.start()
+
+metrics.Gauge("orq_run_locks", "Per-run store locks currently alive", lambda: len(_locks))
@@ -0,0 +1,116 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+SLOT_WAIT_SECONDS = metrics.Histogram(
+    "orq_step_slot_wait_seconds", "Time steps wait for a free slot of their type", ("type",),
+)
+
+
+class QueueFull(Exception):
+    """
+    Raised by Scheduler.submit when the run queue is at capacity.
+    """
+
+
+class Scheduler:
+    """
+    Central run scheduler.
+
+    Runs wait in a priority queue (higher priority first, FIFO within a
+    priority) and are drained by a fixed pool of worker threads, so at most
+    `max_runs` workflows execute at once. Independently, `step_slot(type)`
+    caps how many steps of a given runner type run across all workflows.
+    """
+
+    def __init__(self, target, max_runs: int, max_queued: int, step_limits: dict):
+        self._target = target
+        self._max_queued = max_queued
+        self._heap: list[tuple[int, int, str]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._active: set[str] = set()
+        self._slots = {t: threading.BoundedSemaphore(n) for t, n in step_limits.items()}
+
+        for i in range(max_runs):
+            threading.Thread(target=self._worker, name=f"run-worker-{i}", daemon=True).start()
+
+    def submit(self, run_id: str, priority: int = 0) -> int:
+        """
+        Queue a run and return its 1-based queue position.
+        """
+        with self._cond:
+            if len(self._heap) >= self._max_queued:
+                raise QueueFull(f"Run queue is full ({self._max_queued} waiting)")
+            heapq.heappush(self._heap, (-priority, next(self._seq), run_id))
+            self._cond.notify()
+            return self._position(run_id)
+
+    def position(self, run_id: str) -> int | None:
+        """
+        1-based position of a queued run, or None if it isn't waiting.
+        """
+        with self._cond:
+            return self._position(run_id)
+
+    def _position(self, run_id: str) -> int | None:
+        for pos, entry in enumerate(sorted(self._heap), start=1):
+            if entry[2] == run_id:
+                return pos
+        return None
+
+    def cancel(self, run_id: str) -> bool:
+        """
+        Drop a run that is still waiting; False if it isn't in the queue.
+        """
+        with self._cond:
+            kept = [entry for entry in self._heap if entry[2] != run_id]
+            if len(kept) == len(self._heap):
+                return False
+            self._heap[:] = kept
+            heapq.heapify(self._heap)
+            return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"queued": len(self._heap), "running": len(self._active)}
+
+    @contextmanager
+    def step_slot(self, step_type: str):
+        """
+        Hold one of the slots reserved for `step_type` (no limit if unset).
+        """
+        sem = self._slots.get(step_type)
+        if sem is None:
+            yield
+            return
+        started = time.perf_counter()
+        with metrics.span("slot wait", type=step_type):
+            sem.acquire()
+        SLOT_WAIT_SECONDS.observe(time.perf_counter() - started, type=step_type)
+        try:
+            yield
+        finally:
+            sem.release()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, run_id = heapq.heappop(self._heap)
+                self._active.add(run_id)
+            try:
+                self._target(run_id)
+            except Exception:
+                log.exception("Run %s crashed", run_id)
+            finally:
+                with self._cond:
+                    self._active.discard(run_id)
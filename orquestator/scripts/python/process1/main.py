@@ -2,31 +2,154 @@
 """
 Example usage:
     python myScript.py --env dev --trans_id 20934djjd9a
+    python myScript.py --env dev --batch ids.txt --workers 16 --rate 50
+    cat ids.txt | python myScript.py --batch -
+
+Batch mode prints one JSON line per transaction, in completion order:
+    {"trans_id": "...", "ok": true, "result": {...}}
+    {"trans_id": "...", "ok": false, "error": "..."}
 """
 
 import argparse
 import json
 import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests          # or httpx, urllib, etc.
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from utils import with_config        # where you defined the decorator
+from config import _Config, with_config        # where you defined the decorator
 
 
 # --- STEP 1: Pure business logic -------------------------------------------
 @with_config()                        # cfg will be auto-injected
-def fetch_transaction(trans_id: str, *, cfg):
+def fetch_transaction(trans_id: str, *, cfg, session=None, timeout: float = 10):
     """
     Makes the API request and returns the server JSON.
     Relies on keys living in env.json, e.g. cfg.base_url, cfg.token …
+    Pass a `session` to reuse its pooled connections.
     """
     url = f"{cfg.base_url}/transactions/{trans_id}"
     headers = {"Authorization": f"Bearer {cfg.token}"}
 
-    r = requests.get(url, headers=headers, timeout=10)
+    r = (session or requests).get(url, headers=headers, timeout=timeout)
     r.raise_for_status()
     return r.json()                   # e.g. {"status": "success", "code": 200}
 
 
+# --- STEP 1b: Batch fetching ------------------------------------------------
+class RateLimit:
+    """
+    At most `per_second` calls to wait() return per second, across threads
+    (0 = no limit).
+    """
+
+    def __init__(self, per_second: float):
+        self._interval = 1 / per_second if per_second > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self._interval
+        time.sleep(slot - now)
+
+
+def make_session(workers: int, retries: int) -> requests.Session:
+    """
+    One keep-alive connection per worker; connection errors, 429 and 5xx
+    are retried with exponential backoff (honouring Retry-After).
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def read_ids(stream):
+    """
+    Transaction IDs, one per line (blank lines and # comments skipped).
+    """
+    for line in stream:
+        trans_id = line.strip()
+        if trans_id and not trans_id.startswith("#"):
+            yield trans_id
+
+
+def fetch_batch(ids, *, workers: int = 8, rate: float = 0, retries: int = 3,
+                timeout: float = 10, cfg_kwargs: dict | None = None):
+    """
+    Fetch every ID concurrently over one pooled session and yield a result
+    dict per ID as soon as it completes. At most 2 * `workers` IDs are read
+    ahead, so the input can be an endless stream.
+    """
+    limit = RateLimit(rate)
+    cfg_kwargs = cfg_kwargs or {}
+
+    def one(trans_id: str) -> dict:
+        limit.wait()
+        try:
+            result = fetch_transaction(trans_id, session=session, timeout=timeout, **cfg_kwargs)
+        except (requests.RequestException, ValueError) as exc:
+            return {"trans_id": trans_id, "ok": False, "error": str(exc)}
+        return {"trans_id": trans_id, "ok": True, "result": result}
+
+    # a feeder thread reads the input, so a slow stdin never holds back
+    # results that are already in: they are yielded from `finished` as
+    # each future completes
+    finished = queue.Queue()
+    slots = threading.Semaphore(2 * workers)
+    closed = threading.Event()
+
+    def feed() -> None:
+        submitted, error = 0, None
+        try:
+            for trans_id in ids:
+                slots.acquire()
+                if closed.is_set():
+                    break
+                pool.submit(one, trans_id).add_done_callback(finished.put)
+                submitted += 1
+        except Exception as exc:          # reading the input failed
+            error = exc
+        finished.put((submitted, error))
+
+    with make_session(workers, retries) as session, ThreadPoolExecutor(max_workers=workers) as pool:
+        threading.Thread(target=feed, name="feeder", daemon=True).start()
+        yielded, total, error = 0, None, None
+        try:
+            while total is None or yielded < total:
+                item = finished.get()
+                if isinstance(item, tuple):
+                    total, error = item
+                    continue
+                slots.release()
+                yielded += 1
+                yield item.result()
+            if error is not None:
+                raise error
+        finally:
+            closed.set()
+            slots.release()           # let a blocked feeder see `closed`
+
+
 # --- STEP 2: CLI plumbing ---------------------------------------------------
 def parse_cli():
     p = argparse.ArgumentParser(description="Small API helper")
@@ -35,24 +158,47 @@ def parse_cli():
         choices=["dev", "uat", "prod"],
         help="Which block inside env.json to use (default: dev)",
     )
-    p.add_argument(
+    which = p.add_mutually_exclusive_group(required=True)
+    which.add_argument(
         "--trans_id",
-        required=True,
         help="Transaction ID to query (e.g. 20934djjd9a)",
     )
+    which.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="File with one transaction ID per line ('-' for stdin)",
+    )
+    p.add_argument("--workers", type=int, default=8, help="Requests in flight at once (batch)")
+    p.add_argument("--rate", type=float, default=0, help="Max requests per second, 0 = no limit (batch)")
+    p.add_argument("--retries", type=int, default=3, help="Retries on connection errors, 429 and 5xx (batch)")
+    p.add_argument("--timeout", type=float, default=10, help="Seconds per request")
     return p.parse_args()
 
 
 def main() -> None:
     args = parse_cli()
 
+    cfg_kwargs = {}
     if args.env:
         os.environ["APP_ENV"] = args.env
+        # the decorator bound its cfg at import time, before --env was known
+        cfg_kwargs["cfg"] = _Config(args.env)
 
-    result = fetch_transaction(args.trans_id)
+    if args.trans_id:
+        result = fetch_transaction(args.trans_id, timeout=args.timeout, **cfg_kwargs)
+        print(json.dumps(result, ensure_ascii=False))
+        return
 
-    print(json.dumps(result, ensure_ascii=False))
+    stream = sys.stdin if args.batch == "-" else open(args.batch, "r", encoding="utf-8")
+    failed = 0
+    with stream:
+        for item in fetch_batch(read_ids(stream), workers=args.workers, rate=args.rate,
+                                retries=args.retries, timeout=args.timeout, cfg_kwargs=cfg_kwargs):
+            failed += not item["ok"]
+            print(json.dumps(item, ensure_ascii=False), flush=True)
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
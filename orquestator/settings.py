@@ -0,0 +1,8 @@
+# Settings shared by the server and the runners; kept free of imports so
+# an agent can load the runners without pulling in app.py
+
+# Optional mapping of module names → Cypress folders
+CYPRESS_MODULES = {
+    # "smoke": "cypress/integration/smoke",
+    # "feature": "cypress/integration/my-feature-tests",
+}
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from compiler import COMMON_KEYS
+from persistence import STEP_RUNTIME_KEYS
+
+# Content-addressed store of successful step results (+ their artifacts)
+STEP_CACHE_DIR = Path(os.getenv("ORQ_STEP_CACHE", Path(__file__).parent / "runs" / "step-cache"))
+STEP_CACHE_MAX_BYTES = 2 * 1024 ** 3
+STEP_CACHE_MAX_ENTRIES = 500
+
+# Folders never hashed when a directory is declared as an input
+IGNORED_DIRS = {".git", "node_modules", "__pycache__", ".venv", "venv"}
+
+# Step keys that don't change what a step does, so they stay out of its key
+_NEUTRAL_KEYS = {"name", "depends_on", "stage", "cache", "timeout_seconds", "matrix_parallel", "requires"}
+
+_lock = threading.Lock()
+
+# (path, mtime_ns, size) -> sha256, so unchanged inputs are not re-read
+_file_digests: dict[tuple, str] = {}
+
+# entry name -> bytes on disk: filled by one walk of the cache on the first
+# store, then kept current so a store only looks at its own entry
+_sizes: dict[str, int] | None = None
+
+
+def _file_digest(path: Path) -> str:
+    stat = path.stat()
+    memo = (str(path), stat.st_mtime_ns, stat.st_size)
+    digest = _file_digests.get(memo)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = _file_digests[memo] = h.hexdigest()
+    return digest
+
+def _hash_input(h, path: Path) -> None:
+    if path.is_file():
+        h.update(f"F {path}\0{_file_digest(path)}\0".encode())
+    elif path.is_dir():
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+            for name in sorted(files):
+                file = Path(root, name)
+                h.update(f"F {file.relative_to(path)}\0{_file_digest(file)}\0".encode())
+    else:
+        h.update(f"- {path}\0".encode())
+
+def _definition(step: dict, runner) -> dict:
+    schema = getattr(runner, "SCHEMA", None)
+    if schema is not None:
+        known = COMMON_KEYS.keys() | schema.keys()
+        return {k: v for k, v in step.items() if k in known and k not in _NEUTRAL_KEYS}
+    return {k: v for k, v in step.items() if k not in _NEUTRAL_KEYS | STEP_RUNTIME_KEYS}
+
+def cache_key(step: dict, runner) -> str:
+    """
+    Hash of what the step does: its definition, runner type, toolchain
+    version (runner's optional `toolchain(step)`) and the content of every
+    path listed under the step's `cache.inputs`.
+    """
+    spec = step["cache"] if isinstance(step.get("cache"), dict) else {}
+    toolchain = runner.toolchain(step) if hasattr(runner, "toolchain") else ""
+
+    h = hashlib.sha256()
+    h.update(json.dumps(_definition(step, runner), sort_keys=True).encode())
+    h.update(f"\0{step['type']}\0{toolchain}\0".encode())
+    for name in sorted(spec.get("inputs", [])):
+        _hash_input(h, Path(name).resolve())
+    return h.hexdigest()
+
+
+def lookup(key: str, spool_dir: Path | None, idx: int) -> dict | None:
+    """
+    Stored result for `key` with its artifacts restored, or None on a miss.
+    Spooled output files are copied next to the new run's own spool.
+    """
+    entry = STEP_CACHE_DIR / key
+    meta_path = entry / "meta.json"
+    with _lock:
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+        os.utime(meta_path)  # LRU clock
+
+        for slot, target in meta.get("artifacts", {}).items():
+            _copy(entry / "artifacts" / slot, Path(target))
+
+    result = meta["result"]
+    for field, name in meta.get("spooled", {}).items():
+        if spool_dir is None:
+            result.pop(field, None)
+            continue
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        target = spool_dir / f"{idx}-cached.{name}"
+        shutil.copyfile(entry / name, target)
+        result[field] = str(target)
+    result["cached"] = {
+        "key":           key,
+        "from_run":      meta["run_id"],
+        "stored_at":     meta["stored_at"],
+        "saved_seconds": meta["seconds"],
+    }
+    return result
+
+def store(key: str, step: dict, result: dict, run_id: str, seconds: float) -> None:
+    """
+    Keep a successful result (plus the step's `cache.artifacts` paths and any
+    spooled output it references) under `key`, then evict old entries.
+    """
+    spec = step["cache"] if isinstance(step.get("cache"), dict) else {}
+    entry = STEP_CACHE_DIR / key
+    tmp = STEP_CACHE_DIR / f".{key}.{threading.get_ident()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    spooled = {}
+    for field, value in result.items():
+        if field.endswith("_file") and isinstance(value, str) and Path(value).is_file():
+            name = f"{field[:-len('_file')]}.log"
+            shutil.copyfile(value, tmp / name)
+            spooled[field] = name
+
+    artifacts = {}
+    for slot, name in enumerate(spec.get("artifacts", [])):
+        path = Path(name).resolve()
+        if path.exists():
+            _copy(path, tmp / "artifacts" / str(slot))
+            artifacts[str(slot)] = str(path)
+
+    meta = {
+        "result":    {k: v for k, v in result.items() if k not in spooled},
+        "spooled":   spooled,
+        "artifacts": artifacts,
+        "run_id":    run_id,
+        "stored_at": time.time(),
+        "seconds":   round(seconds, 3),
+    }
+    (tmp / "meta.json").write_text(json.dumps(meta))
+    size = _entry_size(tmp)
+
+    with _lock:
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+        _track(entry, size)
+        _evict(keep=entry)
+
+def _copy(source: Path, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if source.is_dir():
+        shutil.copytree(source, target, dirs_exist_ok=True)
+    else:
+        shutil.copy2(source, target)
+
+def _entry_size(entry: Path) -> int:
+    return sum(p.stat().st_size for p in entry.rglob("*") if p.is_file())
+
+def _track(entry: Path, size: int) -> None:
+    global _sizes
+    if _sizes is None:
+        _sizes = {}
+        for other in STEP_CACHE_DIR.iterdir():
+            if other == entry or other.name.startswith("."):
+                continue  # sized by the caller / another store's temp dir
+            if other.is_dir() and (other / "meta.json").is_file():
+                _sizes[other.name] = _entry_size(other)
+    _sizes[entry.name] = size
+
+def _evict(keep: Path) -> None:
+    """
+    Drop least recently used entries until both budgets are met. Only
+    entries' LRU clocks are read, and only once a budget is exceeded.
+    """
+    if len(_sizes) <= STEP_CACHE_MAX_ENTRIES and sum(_sizes.values()) <= STEP_CACHE_MAX_BYTES:
+        return
+    entries = []
+    for name in list(_sizes):
+        try:
+            entries.append(((STEP_CACHE_DIR / name / "meta.json").stat().st_mtime, name))
+        except OSError:
+            _sizes.pop(name)  # removed from outside
+    entries.sort()
+    count = len(_sizes)
+    total = sum(_sizes.values())
+    for _, name in entries:
+        if count <= STEP_CACHE_MAX_ENTRIES and total <= STEP_CACHE_MAX_BYTES:
+            break
+        if name != keep.name:
+            shutil.rmtree(STEP_CACHE_DIR / name, ignore_errors=True)
+            count -= 1
+            total -= _sizes.pop(name)
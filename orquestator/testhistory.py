@@ -0,0 +1,299 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import metrics
+from integrations.junit import parse_reports
+
+# Per-test results of every test step, for duration/failure/flakiness queries
+TEST_HISTORY_DB = Path(os.getenv("ORQ_TEST_HISTORY", Path(__file__).parent / "runs" / "test-history.db"))
+
+# Results older than this are pruned as new ones come in
+TEST_HISTORY_DAYS = 90
+
+# Runs of a spec averaged into its expected duration (for shard balancing)
+EXPECTED_SAMPLES = 10
+
+CASES_TOTAL = metrics.Counter("orq_test_cases_total", "Test cases recorded, by status", ("status",))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spec_runs (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    project  TEXT    NOT NULL,
+    spec     TEXT    NOT NULL,
+    run_id   TEXT,
+    step     TEXT,
+    status   TEXT    NOT NULL,
+    tests    INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    duration REAL    NOT NULL,
+    at       REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spec_runs_at ON spec_runs (at);
+CREATE INDEX IF NOT EXISTS spec_runs_spec ON spec_runs (project, spec, at);
+
+CREATE TABLE IF NOT EXISTS test_results (
+    spec_run INTEGER NOT NULL,
+    project  TEXT    NOT NULL,
+    spec     TEXT    NOT NULL,
+    name     TEXT    NOT NULL,
+    status   TEXT    NOT NULL,
+    duration REAL    NOT NULL,
+    message  TEXT,
+    at       REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS test_results_at ON test_results (at);
+CREATE INDEX IF NOT EXISTS test_results_test ON test_results (project, spec, name, at);
+
+-- per test and day, kept up to date on insert so window queries only
+-- touch one row per test per day
+CREATE TABLE IF NOT EXISTS test_daily (
+    project  TEXT    NOT NULL,
+    spec     TEXT    NOT NULL,
+    name     TEXT    NOT NULL,
+    day      INTEGER NOT NULL,
+    runs     INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    flips    INTEGER NOT NULL,
+    duration REAL    NOT NULL,
+    max_duration REAL NOT NULL,
+    last_at  REAL    NOT NULL,
+    PRIMARY KEY (project, spec, name, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS test_daily_day ON test_daily (day);
+CREATE INDEX IF NOT EXISTS test_daily_flips ON test_daily (day) WHERE flips > 0;
+
+-- latest passed/failed status of each test, to count flips on insert
+CREATE TABLE IF NOT EXISTS test_last (
+    project TEXT NOT NULL,
+    spec    TEXT NOT NULL,
+    name    TEXT NOT NULL,
+    status  TEXT NOT NULL,
+    at      REAL NOT NULL,
+    PRIMARY KEY (project, spec, name)
+) WITHOUT ROWID;
+"""
+
+_DAY = 86400
+
+_local = threading.local()
+_pruned = 0.0
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        TEST_HISTORY_DB.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(TEST_HISTORY_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+def _spec_of(report: dict) -> str:
+    if report["file"]:
+        return report["file"].replace(os.sep, "/")
+    first = report["cases"][0] if report["cases"] else {}
+    return first.get("suite") or first.get("classname") or "unknown"
+
+def _test_name(case: dict) -> str:
+    # the one key test_results, test_daily and test_last agree on
+    return case["name"] or case["classname"] or ""
+
+def _prune(conn, now: float) -> None:
+    global _pruned
+    if now - _pruned < 3600:
+        return
+    _pruned = now
+    cutoff = now - TEST_HISTORY_DAYS * _DAY
+    for table in ("spec_runs", "test_results", "test_last"):
+        conn.execute(f"DELETE FROM {table} WHERE at < ?", (cutoff,))
+    conn.execute("DELETE FROM test_daily WHERE day < ?", (int(cutoff // _DAY),))
+
+def _roll_up(conn, project: str, spec: str, cases: list, now: float) -> None:
+    ran = [(_test_name(c), c) for c in cases if c["status"] != "skipped"]
+    last = dict(conn.execute(
+        "SELECT name, status FROM test_last WHERE project = ? AND spec = ?", (project, spec),
+    ))
+    day = int(now // _DAY)
+    conn.executemany(
+        """
+        INSERT INTO test_daily (project, spec, name, day, runs, failures, flips, duration, max_duration, last_at)
+        VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?)
+        ON CONFLICT (project, spec, name, day) DO UPDATE SET
+            runs = runs + 1, failures = failures + excluded.failures, flips = flips + excluded.flips,
+            duration = duration + excluded.duration,
+            max_duration = MAX(max_duration, excluded.max_duration), last_at = excluded.last_at
+        """,
+        [(project, spec, name, day, int(c["status"] == "failed"),
+          int(last.get(name, c["status"]) != c["status"]), c["time"], c["time"], now) for name, c in ran],
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO test_last (project, spec, name, status, at) VALUES (?, ?, ?, ?, ?)",
+        [(project, spec, name, c["status"], now) for name, c in ran],
+    )
+
+def record(project: str, reports: list[dict], run_id: str | None = None, step: str | None = None) -> dict:
+    """
+    Store parsed reporter output (see integrations/junit.py) and return a
+    compact summary for the step result.
+    """
+    now = time.time()
+    summary = {"specs": 0, "tests": 0, "passed": 0, "failed": 0, "skipped": 0, "duration": 0.0}
+    conn = _conn()
+    with conn:
+        for report in reports:
+            cases = report["cases"]
+            failures = sum(c["status"] == "failed" for c in cases)
+            duration = round(sum(c["time"] for c in cases), 3)
+            spec = _spec_of(report)
+            spec_run = conn.execute(
+                "INSERT INTO spec_runs (project, spec, run_id, step, status, tests, failures, duration, at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (project, spec, run_id, step, "failed" if failures else "passed",
+                 len(cases), failures, duration, now),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO test_results (spec_run, project, spec, name, status, duration, message, at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(spec_run, project, spec, _test_name(c), c["status"], c["time"],
+                  c["message"], now) for c in cases],
+            )
+            _roll_up(conn, project, spec, cases, now)
+            summary["specs"] += 1
+            summary["tests"] += len(cases)
+            summary["duration"] += duration
+            for c in cases:
+                summary[c["status"]] += 1
+                CASES_TOTAL.inc(status=c["status"])
+        _prune(conn, now)
+    summary["duration"] = round(summary["duration"], 3)
+    return summary
+
+def ingest(project, paths, step: dict, ctx=None) -> dict | None:
+    """
+    Parse reporter files and record them for `step`; None when there was
+    nothing to read or the store is unavailable (never fails the step).
+    """
+    reports = parse_reports(paths)
+    if not reports:
+        return None
+    return keep(str(project), reports, step, ctx)
+
+def keep(project: str, reports: list[dict], step: dict, ctx=None) -> dict | None:
+    """
+    record() on behalf of a runner. On a worker agent the parsed reports
+    are returned as they are, to be recorded by the orchestrator when the
+    result comes back (dispatch.run_remote); None if the store failed.
+    """
+    if getattr(ctx, "remote", False):
+        return {"project": project, "reports": reports}
+    try:
+        return record(project, reports, getattr(ctx, "run_id", None), step.get("name"))
+    except sqlite3.Error:
+        return None
+
+def _window(days: float, project: str | None, column: str = "at") -> tuple[str, list]:
+    since = time.time() - days * _DAY
+    if column == "day":
+        since = int(since // _DAY)
+    where, params = f"{column} >= ?", [since]
+    if project is not None:
+        where += " AND project = ?"
+        params.append(project)
+    return where, params
+
+def slowest(days: float = 30, limit: int = 50, project: str | None = None, by: str = "spec") -> list[dict]:
+    """
+    Specs (or single tests with by="test") with the highest mean duration
+    over the last `days`.
+    """
+    if by == "test":
+        # whole days: the rollup has no finer resolution
+        where, params = _window(days, project, "day")
+        sql = ("SELECT project, spec, name, SUM(runs), SUM(duration) / SUM(runs), MAX(max_duration), "
+               f"MAX(last_at) FROM test_daily WHERE {where} GROUP BY project, spec, name "
+               "ORDER BY 5 DESC LIMIT ?")
+        keys = ["project", "spec", "name"]
+    else:
+        where, params = _window(days, project)
+        sql = ("SELECT project, spec, COUNT(*), AVG(duration), MAX(duration), MAX(at) FROM spec_runs "
+               f"WHERE {where} GROUP BY project, spec ORDER BY 4 DESC LIMIT ?")
+        keys = ["project", "spec"]
+    rows = _conn().execute(sql, (*params, limit)).fetchall()
+    keys += ["runs", "avg_seconds", "max_seconds", "last_seen"]
+    return [_row(keys, r) for r in rows]
+
+def flaky(days: float = 30, limit: int = 50, project: str | None = None) -> list[dict]:
+    """
+    Tests whose status flipped between passed and failed from one run to
+    the next over the last `days`, most flips first.
+    """
+    where, params = _window(days, project, "day")
+    # only tests with a flip in the window (partial index), then their totals
+    rows = _conn().execute(
+        f"""
+        WITH flaky AS (
+            SELECT project, spec, name, SUM(flips) AS flips FROM test_daily
+            WHERE {where} AND flips > 0 GROUP BY project, spec, name
+        )
+        SELECT d.project, d.spec, d.name, SUM(d.runs), SUM(d.failures), f.flips, MAX(d.last_at)
+        FROM flaky f JOIN test_daily d ON (d.project, d.spec, d.name) = (f.project, f.spec, f.name)
+        WHERE d.day >= ?
+        GROUP BY d.project, d.spec, d.name
+        ORDER BY 6 DESC, 5 DESC LIMIT ?
+        """,
+        (*params, params[0], limit),
+    ).fetchall()
+    keys = ["project", "spec", "name", "runs", "failures", "flips", "last_seen"]
+    return [_row(keys, r) for r in rows]
+
+def history(spec: str, name: str | None = None, project: str | None = None, limit: int = 50) -> list[dict]:
+    """
+    Latest results of one spec (or one test in it), newest first.
+    """
+    if name is None:
+        sql = "SELECT project, spec, run_id, step, status, tests, failures, duration, at FROM spec_runs WHERE spec = ?"
+        keys = ["project", "spec", "run_id", "step", "status", "tests", "failures", "duration", "at"]
+        params = [spec]
+    else:
+        sql = ("SELECT t.project, t.spec, t.name, s.run_id, t.status, t.duration, t.message, t.at "
+               "FROM test_results t JOIN spec_runs s ON s.id = t.spec_run WHERE t.spec = ? AND t.name = ?")
+        keys = ["project", "spec", "name", "run_id", "status", "duration", "message", "at"]
+        params = [spec, name]
+    if project is not None:
+        sql += " AND project = ?" if name is None else " AND t.project = ?"
+        params.append(project)
+    sql += " ORDER BY at DESC LIMIT ?" if name is None else " ORDER BY t.at DESC LIMIT ?"
+    return [_row(keys, r) for r in _conn().execute(sql, (*params, limit))]
+
+def expected_durations(project: str) -> dict[str, float]:
+    """
+    spec -> mean duration of its last EXPECTED_SAMPLES runs, for balancing
+    specs across shards.
+    """
+    rows = _conn().execute(
+        """
+        SELECT spec, AVG(duration) FROM (
+            SELECT spec, duration,
+                   ROW_NUMBER() OVER (PARTITION BY spec ORDER BY at DESC) AS n
+            FROM spec_runs WHERE project = ?
+        ) WHERE n <= ? GROUP BY spec
+        """,
+        (project, EXPECTED_SAMPLES),
+    ).fetchall()
+    return {spec: round(avg, 3) for spec, avg in rows}
+
+def _row(keys: list, row: tuple) -> dict:
+    item = dict(zip(keys, row))
+    for key in ("at", "last_seen"):
+        if key in item:
+            item[key] = datetime.fromtimestamp(item[key]).isoformat(timespec="seconds")
+    for key in ("avg_seconds", "max_seconds", "duration"):
+        if isinstance(item.get(key), float):
+            item[key] = round(item[key], 3)
+    return item
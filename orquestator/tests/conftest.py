@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# the modules import each other by bare name (`import persistence`), as
+# they do when app.py or agent.py is started from this folder
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,101 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import archive
+import persistence
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def store(request, tmp_path, monkeypatch):
+    """
+    Each run store in tmp_path, with the archive next to it and no idle
+    grace period, so finished runs can be compacted straight away.
+    """
+    (tmp_path / "runs").mkdir()
+    if request.param == "sqlite":
+        backend = persistence.SqliteStore(tmp_path / "runs" / "runs.db")
+    else:
+        backend = persistence.JsonFileStore(tmp_path / "runs")
+    monkeypatch.setattr(persistence, "_store", backend)
+    monkeypatch.setattr(persistence, "RUN_STORE", request.param)
+    monkeypatch.setattr(persistence, "ARCHIVE_MIN_IDLE_SECONDS", 0)
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", tmp_path / "runs" / "archive")
+    monkeypatch.setattr(archive, "_local", threading.local())
+    return backend
+
+def _run(run_id: str, days_ago: float = 0, status: str = "completed", name: str = "deploy") -> None:
+    created = (datetime.now() - timedelta(days=days_ago)).isoformat()
+    persistence.save_run(run_id, {
+        "id": run_id, "name": name, "status": status, "created_at": created,
+        "steps": [{"name": "a", "type": "python"}], "states": ["completed"], "current": [],
+        "log": [{"step": "a", "result": {"code": 0, "out": "done"}}],
+    })
+
+def _live_ids() -> set:
+    return {r["id"] for r in persistence._store.list_runs(limit=1000)}
+
+def test_runs_beyond_the_newest_n_are_archived(store, monkeypatch):
+    monkeypatch.setattr(persistence, "RETAIN_RUNS", 2)
+    for n in range(5):
+        _run(f"r{n}", days_ago=5 - n)
+    stats = persistence.compact_runs()
+    assert stats["archived"] == 3
+    assert _live_ids() == {"r3", "r4"}
+    assert archive.count() == 3
+
+    # archived runs still read back whole and show up in listings
+    run = persistence.load_run("r0")
+    assert run["log"] == [{"step": "a", "result": {"code": 0, "out": "done"}}]
+    assert persistence.load_run("r1", fields={"status"}) == {"status": "completed"}
+    assert [r["id"] for r in persistence.list_runs(limit=10)] == ["r4", "r3", "r2", "r1", "r0"]
+
+def test_old_runs_are_archived_whatever_their_rank(store, monkeypatch):
+    monkeypatch.setattr(persistence, "RETAIN_DAYS", 10)
+    _run("old", days_ago=30)
+    _run("new", days_ago=1)
+    assert persistence.compact_runs()["archived"] == 1
+    assert _live_ids() == {"new"}
+
+def test_unfinished_and_recently_updated_runs_stay(store, monkeypatch):
+    monkeypatch.setattr(persistence, "RETAIN_RUNS", 0)
+    _run("running", status="running")
+    _run("queued", status="queued")
+    assert persistence.compact_runs()["archived"] == 0
+
+    monkeypatch.setattr(persistence, "ARCHIVE_MIN_IDLE_SECONDS", 3600)
+    _run("done")
+    assert persistence.compact_runs()["archived"] == 0
+    assert _live_ids() == {"running", "queued", "done"}
+
+def test_workflow_policy_overrides_the_defaults(store, monkeypatch):
+    monkeypatch.setattr(persistence, "RETAIN_RUNS", 0)
+    for n in range(3):
+        _run(f"keep{n}", name="keep", days_ago=n)
+        _run(f"drop{n}", name="drop", days_ago=n)
+    policy = {"keep": {"runs": 2, "days": 30}}.get
+    assert persistence.compact_runs(policy)["archived"] == 4
+    assert _live_ids() == {"keep0", "keep1"}
+
+def test_events_for_an_archived_run_are_refused(store, monkeypatch):
+    monkeypatch.setattr(persistence, "RETAIN_RUNS", 0)
+    _run("r1")
+    persistence.compact_runs()
+    with pytest.raises(FileNotFoundError):
+        persistence.set_status("r1", "failed")
+    assert persistence.load_run("r1")["status"] == "completed"
+
+def test_expired_segments_are_dropped_except_the_current_one(store, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_SEGMENT_BYTES", 1)  # one run per segment
+    for n in range(3):
+        archive.put({"id": f"r{n}", "name": "deploy", "status": "completed",
+                     "updated_at": (datetime.now() - timedelta(days=400 - n)).isoformat()})
+    assert archive._segments() == [1, 2, 3]
+    # room again in segment 3: it is the one appended to, so it stays
+    monkeypatch.setattr(archive, "ARCHIVE_SEGMENT_BYTES", 1024 ** 2)
+    assert archive.expire(days=365) == 2
+    assert archive._segments() == [3]
+    assert [r["id"] for r in archive.list_runs()] == ["r2"]
+    with pytest.raises(FileNotFoundError):
+        archive.get("r0")
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+import compiler
+from compiler import WorkflowError, compile_workflow, load_compiled
+
+
+def _problems(wf) -> list[str]:
+    with pytest.raises(WorkflowError) as info:
+        compile_workflow(wf, "wf")
+    return info.value.problems
+
+def test_valid_workflow_gets_its_graph():
+    wf = {"steps": [
+        {"name": "a", "type": "python", "script": "a.py"},
+        {"name": "b", "type": "python", "script": "b.py", "depends_on": ["a"], "timeout_seconds": 5},
+    ]}
+    assert compile_workflow(wf)["deps"] == [set(), {0}]
+
+def test_every_problem_is_reported_at_once():
+    problems = _problems({"max_parallel": 0, "steps": [
+        {"name": "a", "type": "python"},
+        {"name": "a", "type": "python", "script": 3, "colour": "red"},
+        {"name": "c", "type": "teleport"},
+        "not a step",
+    ]})
+    assert problems == [
+        "wf: 'max_parallel' must be a positive integer",
+        "wf step 'a': missing 'script'",
+        "wf step 'a': duplicate step name",
+        "wf step 'a': 'script' must be str",
+        "wf step 'a': unknown key 'colour' for python steps",
+        "wf step 'c': unknown type 'teleport' (known: " + ", ".join(sorted(compiler.load_runners())) + ")",
+        "wf step 4: must be an object",
+    ]
+
+def test_common_keys_are_typed_too():
+    assert _problems({"steps": [{"name": "a", "type": "python", "script": "a.py", "stage": "one"}]}) == [
+        "wf step 'a': 'stage' must be int or float",
+    ]
+
+def test_matrix_placeholders_stand_in_for_typed_values():
+    step = {"name": "a", "type": "python", "script": "a.py", "retries": "{n}", "matrix": {"n": [1, 2]}}
+    compile_workflow({"steps": [step]})
+    assert _problems({"steps": [{**step, "matrix": {"n": {"range": "x"}}}]}) == [
+        "wf step 'a': 'n': range must be [stop], [start, stop] or [start, stop, step] integers",
+    ]
+
+def test_graph_errors_become_workflow_errors():
+    assert _problems({"steps": [
+        {"name": "a", "type": "python", "script": "a.py", "depends_on": ["b"]},
+        {"name": "b", "type": "python", "script": "b.py", "depends_on": ["a"]},
+    ]}) == ["wf: Dependency cycle between steps: a, b"]
+
+@pytest.mark.parametrize("retention", [{"days": -1}, {"weeks": 2}, "forever"])
+def test_retention_is_checked(retention):
+    wf = {"retention": retention, "steps": [{"name": "a", "type": "python", "script": "a.py"}]}
+    assert _problems(wf) == ['wf: \'retention\' must be {"days": n, "runs": n} (non-negative numbers)']
+
+def test_load_compiled_recompiles_only_on_change(tmp_path):
+    path = tmp_path / "deploy.json"
+    path.write_text(json.dumps({"steps": [{"name": "a", "type": "python", "script": "a.py"}]}))
+    first = load_compiled(path)
+    assert load_compiled(path) is first
+
+    path.write_text(json.dumps({"steps": [{"name": "build", "type": "python", "script": "b.py"}]}))
+    assert load_compiled(path)["steps"][0]["name"] == "build"
+
+    path.write_text("{nope")
+    with pytest.raises(WorkflowError, match="deploy.json: invalid JSON"):
+        load_compiled(path)
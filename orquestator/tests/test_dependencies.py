@@ -0,0 +1,38 @@
+import pytest
+
+from compiler import resolve_dependencies
+
+
+def test_steps_without_graph_keys_run_in_order():
+    steps = [{"name": "a"}, {"name": "b"}, {"name": "c"}]
+    assert resolve_dependencies(steps) == [set(), {0}, {1}]
+
+def test_depends_on_names_other_steps():
+    steps = [
+        {"name": "build"},
+        {"name": "unit", "depends_on": ["build"]},
+        {"name": "lint"},
+        {"name": "deploy", "depends_on": ["unit", "lint"]},
+    ]
+    assert resolve_dependencies(steps) == [set(), {0}, set(), {1, 2}]
+
+def test_stage_waits_for_every_lower_stage():
+    steps = [
+        {"name": "a", "stage": 1},
+        {"name": "b", "stage": 1},
+        {"name": "c", "stage": 2},
+        {"name": "d", "stage": 3, "depends_on": ["a"]},
+        {"name": "e"},
+    ]
+    assert resolve_dependencies(steps) == [set(), set(), {0, 1}, {0, 1, 2}, set()]
+
+@pytest.mark.parametrize("steps, message", [
+    ([{"name": "a"}, {"name": "a", "depends_on": []}], "Duplicate step name 'a'"),
+    ([{"name": "a", "depends_on": ["missing"]}], "depends on unknown step 'missing'"),
+    ([{"name": "a", "depends_on": ["a"]}], "'a' depends on itself"),
+    ([{"name": "a", "depends_on": ["b"]}, {"name": "b", "depends_on": ["a"]}, {"name": "c"}],
+     "Dependency cycle between steps: a, b"),
+])
+def test_invalid_graphs_are_rejected(steps, message):
+    with pytest.raises(ValueError, match=message):
+        resolve_dependencies(steps)
@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+
+import dispatch
+import outbox
+import testhistory
+from integrations import jira_runner
+from integrations.process import StepContext
+
+STEP = {"name": "build", "type": "python", "script": "build.py", "requires": ["node"]}
+
+
+@pytest.fixture(autouse=True)
+def board(monkeypatch):
+    """
+    An empty lease board with short leases; `board` lists notifications.
+    """
+    woken = []
+    monkeypatch.setattr(dispatch, "_jobs", {})
+    monkeypatch.setattr(dispatch, "_agents", {})
+    monkeypatch.setattr(dispatch, "_listeners", [lambda: woken.append(time.monotonic())])
+    monkeypatch.setattr(dispatch, "LEASE_SECONDS", 0.6)
+    return woken
+
+def _remote(step: dict, ctx=None) -> tuple[threading.Thread, dict]:
+    """
+    run_remote in a thread, as the run's step executor calls it.
+    """
+    out = {}
+    thread = threading.Thread(target=lambda: out.update(result=dispatch.run_remote(step, ctx)), daemon=True)
+    thread.start()
+    return thread, out
+
+def _lease(agent_id: str, timeout: float = 2.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = dispatch.lease(agent_id)
+        if job is not None:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("nothing to lease")
+
+def test_auto_mode_routes_by_labels(monkeypatch):
+    monkeypatch.setattr(dispatch, "DISPATCH_MODE", "auto")
+    assert not dispatch.remote(STEP)
+    dispatch.register("box", ["linux", "node"], 1)
+    assert dispatch.remote(STEP)
+    assert not dispatch.remote({**STEP, "requires": ["gpu"]})
+    monkeypatch.setattr(dispatch, "DISPATCH_MODE", "local")
+    assert not dispatch.remote(STEP)
+
+def test_only_agents_with_every_label_get_the_step():
+    plain = dispatch.register("plain", ["linux"], 1)["agent_id"]
+    node = dispatch.register("node", ["linux", "node"], 1)["agent_id"]
+    thread, out = _remote(STEP, StepContext("run1", 3))
+    job = _lease(node)
+    assert dispatch.lease(plain) is None
+    assert (job["step"], job["run_id"], job["idx"]) == (STEP, "run1", 3)
+
+    dispatch.complete(node, job["job_id"], job["lease_id"], {"code": 0, "out": "ok"}, [])
+    thread.join(2)
+    assert out["result"] == {"code": 0, "out": "ok", "agent": "node"}
+
+def test_output_lines_reach_the_step_context():
+    lines = []
+    agent = dispatch.register("box", ["node"], 1)["agent_id"]
+    thread, out = _remote(STEP, StepContext("run1", 0, on_line=lambda stream, line: lines.append((stream, line))))
+    job = _lease(agent)
+    assert dispatch.heartbeat(agent, job["job_id"], job["lease_id"], [["stdout", "one\n"]]) == {"cancel": None}
+    dispatch.complete(agent, job["job_id"], job["lease_id"], {"code": 0}, [["stderr", "two\n"]])
+    thread.join(2)
+    assert lines == [("stdout", "one\n"), ("stderr", "two\n")]
+
+def test_cancel_is_passed_on_with_the_next_heartbeat():
+    stop = threading.Event()
+    agent = dispatch.register("box", ["node"], 1)["agent_id"]
+    thread, out = _remote(STEP, StepContext("run1", 0, stop=stop))
+    job = _lease(agent)
+    stop.set()
+    time.sleep(0.6)
+    assert dispatch.heartbeat(agent, job["job_id"], job["lease_id"], []) == {"cancel": "cancelled"}
+    dispatch.complete(agent, job["job_id"], job["lease_id"], {"code": -15, "killed": "cancelled"}, [])
+    thread.join(2)
+    assert out["result"]["killed"] == "cancelled"
+
+def test_expired_lease_goes_to_another_agent(board):
+    first = dispatch.register("first", ["node"], 1)["agent_id"]
+    second = dispatch.register("second", ["node"], 1)["agent_id"]
+    thread, out = _remote(STEP)
+    job = _lease(first)
+    assert len(board) == 1  # offered once, not on every poll
+
+    retry = _lease(second, timeout=3)
+    assert retry["job_id"] == job["job_id"] and retry["lease_id"] != job["lease_id"]
+    assert len(board) == 2  # offered again after the lease ran out
+    with pytest.raises(dispatch.LeaseLost):
+        dispatch.heartbeat(first, job["job_id"], job["lease_id"], [])
+
+    dispatch.complete(second, retry["job_id"], retry["lease_id"], {"code": 0}, [])
+    thread.join(2)
+    assert out["result"]["agent"] == "second"
+
+def test_step_fails_after_max_leases(monkeypatch):
+    monkeypatch.setattr(dispatch, "MAX_LEASES", 1)
+    agent = dispatch.register("flaky", ["node"], 1)["agent_id"]
+    thread, out = _remote(STEP)
+    _lease(agent)
+    thread.join(3)
+    assert out["result"] == {"code": 1, "error": "Lease lost 1 times (last agent: flaky)"}
+
+def test_outbox_items_and_test_reports_are_settled_on_the_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_DB", tmp_path / "outbox.db")
+    monkeypatch.setattr(outbox, "_local", threading.local())
+    monkeypatch.setattr(outbox, "start", lambda: None)
+    deliveries = []
+    monkeypatch.setattr(outbox, "record_delivery", lambda *args: deliveries.append(args))
+    monkeypatch.setattr(testhistory, "TEST_HISTORY_DB", tmp_path / "test-history.db")
+    monkeypatch.setattr(testhistory, "_local", threading.local())
+
+    step = {"name": "notify", "type": "jira", "jira_url": "http://jira", "user": "u", "token": "t",
+            "issue": "PROJ-1", "comment": "deployed", "outbox": True}
+    # what the runner hands back on an agent: nothing queued or recorded there
+    agent_ctx = StepContext("run1", 2)
+    agent_ctx.remote = True
+    result = jira_runner.execute(step, agent_ctx)
+    assert "outbox_id" not in result
+    reports = [{"file": "login.cy.js", "cases": [
+        {"suite": "login", "name": "works", "classname": "login works", "time": 1.5,
+         "status": "passed", "message": None},
+    ]}]
+    result["tests"] = testhistory.keep("/projects/web", reports, step, agent_ctx)
+    assert result["tests"] == {"project": "/projects/web", "reports": reports}
+
+    agent = dispatch.register("box", [], 1)["agent_id"]
+    thread, out = _remote(step, StepContext("run1", 2))
+    job = _lease(agent)
+    dispatch.complete(agent, job["job_id"], job["lease_id"], result, [])
+    thread.join(2)
+
+    settled = out["result"]
+    assert "enqueue" not in settled
+    assert settled["tests"]["passed"] == 1
+    [item] = outbox.items(run_id="run1")
+    assert (item["id"], item["idx"], item["status"]) == (settled["outbox_id"], 2, "pending")
+    assert deliveries == [("run1", 2, {"status": "queued", "id": item["id"]})]
+    assert [r["run_id"] for r in testhistory.history("login.cy.js", project="/projects/web")] == ["run1"]
@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+import matrix
+from integrations.process import StepContext
+
+
+def test_object_matrix_is_a_cross_product(tmp_path):
+    ids = tmp_path / "ids.txt"
+    ids.write_text("t1\n\n t2 \n")
+    assert matrix.expand({"env": ["dev", "uat"], "n": {"range": [1, 3]}, "id": {"file": str(ids)}}) == [
+        {"env": "dev", "n": 1, "id": "t1"}, {"env": "dev", "n": 1, "id": "t2"},
+        {"env": "dev", "n": 2, "id": "t1"}, {"env": "dev", "n": 2, "id": "t2"},
+        {"env": "uat", "n": 1, "id": "t1"}, {"env": "uat", "n": 1, "id": "t2"},
+        {"env": "uat", "n": 2, "id": "t1"}, {"env": "uat", "n": 2, "id": "t2"},
+    ]
+
+def test_list_matrix_is_taken_as_is():
+    items = [{"a": 1}, {"a": 2, "b": 3}]
+    assert matrix.expand(items) == items
+
+def test_files_are_not_read_while_validating():
+    assert matrix.expand({"id": {"file": "missing.txt"}}, read_files=False) == [{"id": "missing.txt"}]
+
+@pytest.mark.parametrize("spec, message", [
+    ({}, "non-empty list or object"),
+    ([1, 2], "must hold objects"),
+    ({"n": []}, "expands to no items"),
+    ({"n": {"range": [0, 5, 1, 1]}}, "range must be"),
+    ({"n": {"values": [1]}}, "expected a list"),
+    ({"a": list(range(100)), "b": list(range(11))}, "1100 items"),
+])
+def test_bad_matrices_are_rejected(spec, message):
+    with pytest.raises(ValueError, match=message):
+        matrix.expand(spec)
+
+def test_render_fills_placeholders():
+    step = {
+        "name": "check", "type": "python", "script": "main.py",
+        "retries": "{n}", "args": ["--env", "{env}", "--n={n}"], "env": {"TARGET": "{env}-{other}"},
+        "matrix": {"env": ["dev"], "n": [3]}, "matrix_parallel": 2, "fail_fast": True,
+    }
+    assert matrix.render(step, {"env": "dev", "n": 3}) == {
+        "name": "check", "type": "python", "script": "main.py",
+        "retries": 3, "args": ["--env", "dev", "--n=3"], "env": {"TARGET": "dev-{other}"},
+    }
+
+def _fake(codes: dict, seen: list):
+    def execute(child, ctx):
+        seen.append(child["n"])  # list.append is atomic
+        return {"code": codes.get(child["n"], 0), "out": f"item {child['n']}\n"}
+    return execute
+
+def test_run_aggregates_every_item():
+    seen = []
+    step = {"name": "m", "type": "python", "n": "{n}", "matrix": {"n": {"range": [5]}}}
+    result = matrix.run(step, StepContext(), _fake({3: 2}, seen))
+    assert sorted(seen) == [0, 1, 2, 3, 4]
+    assert result["code"] == 1
+    assert {k: result["matrix"][k] for k in ("total", "passed", "failed", "skipped")} == {
+        "total": 5, "passed": 4, "failed": 1, "skipped": 0,
+    }
+    assert [item["code"] for item in result["items"]] == [0, 0, 0, 2, 0]
+    assert "[exit 2] n=3" in result["out"]
+
+def test_fail_fast_starts_no_new_items():
+    seen = []
+    step = {"name": "m", "type": "python", "n": "{n}", "matrix": {"n": {"range": [6]}},
+            "matrix_parallel": 1, "fail_fast": True}
+    result = matrix.run(step, StepContext(), _fake({1: 1}, seen))
+    assert seen == [0, 1]
+    assert result["matrix"]["skipped"] == 4
+    assert result["items"][2] == {"params": {"n": 2}, "skipped": True}
+
+def test_cancel_skips_the_rest_and_reports_killed():
+    stop = threading.Event()
+    seen = []
+
+    def execute(child, ctx):
+        seen.append(child["n"])
+        stop.set()
+        return {"code": 0}
+
+    step = {"name": "m", "type": "python", "n": "{n}", "matrix": {"n": [1, 2, 3]}, "matrix_parallel": 1}
+    result = matrix.run(step, StepContext(stop=stop), execute)
+    assert seen == [1]
+    assert result["killed"] == "cancelled"
+    assert result["matrix"]["skipped"] == 2
+
+def test_unreadable_file_fails_the_step():
+    step = {"name": "m", "type": "python", "matrix": {"id": {"file": "/nonexistent/ids.txt"}}}
+    assert matrix.run(step, StepContext(), _fake({}, []))["error"].startswith("matrix: ")
@@ -0,0 +1,101 @@
+import threading
+import types
+
+import httpx
+import pytest
+
+import compiler
+import outbox
+
+
+@pytest.fixture
+def box(tmp_path, monkeypatch):
+    """
+    A fresh outbox in tmp_path whose worker never starts: tests deliver
+    through a fake "fake" channel by hand.
+    """
+    monkeypatch.setattr(outbox, "OUTBOX_DB", tmp_path / "outbox.db")
+    monkeypatch.setattr(outbox, "_local", threading.local())
+    monkeypatch.setattr(outbox, "start", lambda: None)
+    monkeypatch.setattr(outbox, "OUTBOX_COALESCE_SECONDS", 0.0)
+    monkeypatch.setattr(outbox, "OUTBOX_BACKOFF_JITTER", 0.0)
+    sent, errors = [], []
+
+    def deliver(client, payloads):
+        if errors:
+            raise errors.pop(0)
+        sent.append([p["text"] for p in payloads])
+
+    compiler.load_runners()
+    monkeypatch.setitem(compiler._runners, "fake", types.SimpleNamespace(deliver=deliver))
+    return types.SimpleNamespace(sent=sent, errors=errors)
+
+def _drain() -> None:
+    conn = outbox._conn()
+    while True:
+        group, _ = outbox._next_group(conn)
+        if not group:
+            return
+        outbox._deliver(conn, None, group)
+
+def _status(item_id: int) -> dict:
+    return next(i for i in outbox.items() if i["id"] == item_id)
+
+def test_pending_messages_for_one_target_go_out_together(box):
+    outbox.enqueue("fake", "PROJ-1", {"text": "a"})
+    outbox.enqueue("fake", "PROJ-2", {"text": "b"})
+    outbox.enqueue("fake", "PROJ-1", {"text": "c"})
+    assert outbox.pending() == 3
+    _drain()
+    assert sorted(box.sent) == [["a", "c"], ["b"]]
+    assert outbox.pending() == 0
+    assert {i["status"] for i in outbox.items()} == {"delivered"}
+
+def test_a_later_message_waits_for_its_own_window(box, monkeypatch):
+    first = outbox.enqueue("fake", "PROJ-1", {"text": "a"})
+    _drain()
+    monkeypatch.setattr(outbox, "OUTBOX_COALESCE_SECONDS", 60.0)
+    second = outbox.enqueue("fake", "PROJ-1", {"text": "b"})
+    group, wait = outbox._next_group(outbox._conn())
+    assert group == [] and 59 < wait <= 60
+    assert _status(first)["status"] == "delivered"
+    assert _status(second)["status"] == "pending"
+
+def test_transient_failures_are_retried_with_backoff(box):
+    box.errors.append(httpx.ConnectError("down"))
+    item_id = outbox.enqueue("fake", "PROJ-1", {"text": "a"})
+    _drain()
+    row = _status(item_id)
+    assert (row["status"], row["attempts"], row["error"]) == ("pending", 1, "down")
+    assert row["next_at"] - outbox.time.time() == pytest.approx(outbox.OUTBOX_BACKOFF_BASE, abs=1)
+    assert box.sent == []
+
+    outbox._conn().execute("UPDATE outbox SET next_at = 0")
+    _drain()
+    row = _status(item_id)
+    assert (row["status"], row["attempts"], row["error"]) == ("delivered", 2, None)
+    assert box.sent == [["a"]]
+
+def test_backoff_doubles_up_to_the_cap(box):
+    delays = [outbox._backoff(n) for n in range(1, 10)]
+    assert delays[:3] == [2.0, 4.0, 8.0]
+    assert max(delays) == outbox.OUTBOX_BACKOFF_MAX
+
+def test_client_errors_are_not_retried(box):
+    request = httpx.Request("POST", "http://jira/issue/PROJ-1/comment")
+    response = httpx.Response(403, request=request)
+    box.errors.append(httpx.HTTPStatusError("forbidden", request=request, response=response))
+    item_id = outbox.enqueue("fake", "PROJ-1", {"text": "a"})
+    _drain()
+    assert _status(item_id)["status"] == "failed"
+
+def test_gives_up_after_max_attempts(box, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    box.errors += [httpx.ReadTimeout("slow"), httpx.ReadTimeout("slow")]
+    item_id = outbox.enqueue("fake", "PROJ-1", {"text": "a"})
+    _drain()
+    outbox._conn().execute("UPDATE outbox SET next_at = 0")
+    _drain()
+    row = _status(item_id)
+    assert (row["status"], row["attempts"]) == ("failed", 2)
+    assert outbox.pending() == 0
@@ -0,0 +1,142 @@
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts" / "python" / "process1"))
+
+# config.py reads ./.env.json when imported, so import it from a folder
+# that has one
+_cwd = os.getcwd()
+with tempfile.TemporaryDirectory() as _env_dir:
+    Path(_env_dir, ".env.json").write_text(json.dumps({"dev": {"base_url": "http://unset", "token": "secret"}}))
+    os.chdir(_env_dir)
+    try:
+        import config  # noqa: E402
+        import main  # noqa: E402
+    finally:
+        os.chdir(_cwd)
+
+
+class _Transactions(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        trans_id = self.path.rsplit("/", 1)[-1]
+        if trans_id.startswith("slow"):
+            time.sleep(0.5)
+        if trans_id.startswith("missing"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({"id": trans_id, "auth": self.headers["Authorization"]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def cfg():
+    """
+    fetch_batch's `cfg_kwargs` pointing at a local transactions API: IDs
+    starting with "slow" take 0.5s, those starting with "missing" are 404s.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Transactions)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    config._Config._raw_json_cache["test"] = {"base_url": base_url, "token": "secret"}
+    yield {"cfg": config._Config("test")}
+    server.shutdown()
+
+
+def test_every_id_is_fetched_once_in_completion_order(cfg):
+    ids = ["slow-1", "a", "missing-1", "b"]
+    results = list(main.fetch_batch(ids, workers=4, retries=0, cfg_kwargs=cfg))
+    assert sorted(r["trans_id"] for r in results) == sorted(ids)
+    assert results[-1]["trans_id"] == "slow-1"
+    by_id = {r["trans_id"]: r for r in results}
+    assert by_id["a"] == {"trans_id": "a", "ok": True, "result": {"id": "a", "auth": "Bearer secret"}}
+    assert by_id["missing-1"]["ok"] is False and "404" in by_id["missing-1"]["error"]
+
+
+def test_results_are_not_held_back_by_slow_input(cfg):
+    more = threading.Event()
+
+    def ids():
+        yield "a"
+        more.wait(5)   # the next line only arrives once "a" was printed
+        yield "b"
+
+    started = time.monotonic()
+    seen = []
+    for result in main.fetch_batch(ids(), workers=2, retries=0, cfg_kwargs=cfg):
+        seen.append(result["trans_id"])
+        more.set()
+    assert seen == ["a", "b"]
+    assert time.monotonic() - started < 2
+
+
+def test_input_is_read_only_a_bounded_way_ahead(cfg):
+    read = []
+
+    def endless():
+        for n in itertools.count():
+            read.append(n)
+            yield f"id-{n}"
+
+    batch = main.fetch_batch(endless(), workers=2, retries=0, cfg_kwargs=cfg)
+    for _ in itertools.islice(batch, 3):
+        pass
+    time.sleep(0.2)
+    assert len(read) <= 3 + 2 * 2 + 1
+    batch.close()
+
+
+def test_input_errors_surface_after_the_results_already_in(cfg):
+    def broken():
+        yield "a"
+        raise OSError("stdin went away")
+
+    seen = []
+    with pytest.raises(OSError, match="stdin went away"):
+        for result in main.fetch_batch(broken(), workers=2, retries=0, cfg_kwargs=cfg):
+            seen.append(result["trans_id"])
+    assert seen == ["a"]
+
+
+def test_rate_limit_spaces_calls_across_threads():
+    limit = main.RateLimit(20)
+    started = time.monotonic()
+    threads = [threading.Thread(target=limit.wait) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert time.monotonic() - started >= 9 / 20 - 0.02
+
+
+def test_rate_limit_applies_to_batches(cfg):
+    started = time.monotonic()
+    results = list(main.fetch_batch([f"id-{n}" for n in range(6)], workers=6, rate=10,
+                                    retries=0, cfg_kwargs=cfg))
+    assert len(results) == 6
+    assert time.monotonic() - started >= 5 / 10 - 0.02
+
+
+def test_no_limit_means_no_wait():
+    limit = main.RateLimit(0)
+    started = time.monotonic()
+    for _ in range(1000):
+        limit.wait()
+    assert time.monotonic() - started < 0.1